@@ -0,0 +1,60 @@
+"""
+Benchmarks EvmAccountInfo throughput against the local node (see local_node.py),
+classifying and fetching balances of a generated (or given) state.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from e2e.local_node import LocalNode, NodeConfig, NodeState
+from src.fetch.contracts import EvmAccountInfo, RPC_WORKERS
+from src.files import NetworkFile
+from src.utils.code_store import CodeStore
+
+
+def benchmark(state: NodeState, config: NodeConfig, max_workers: int) -> dict[str, float]:
+    """
+    Fetches code and balances of all accounts of `state` from a local node with `config`
+    :return: addresses per second of each fetch
+    """
+    throughput = {}
+    with tempfile.TemporaryDirectory() as temp_dir, LocalNode(state, config) as node:
+        account_info = EvmAccountInfo(
+            node_url=node.url,
+            addresses=list(state.accounts),
+            network='mainnet',
+            max_workers=max_workers,
+            store=CodeStore(os.path.join(temp_dir, "code.sqlite")),
+        )
+        account_info.null_balance_file = NetworkFile("null-balances.csv", path=temp_dir)
+        account_info.null_balance_checkpoint = NetworkFile("null.jsonl", path=temp_dir)
+
+        start = time.monotonic()
+        account_info.contracts(NetworkFile("contracts.csv", path=temp_dir))
+        throughput['eth_getCode'] = len(state.accounts) / (time.monotonic() - start)
+
+        start = time.monotonic()
+        account_info.get_null_balances()
+        throughput['eth_getBalance'] = len(state.accounts) / (time.monotonic() - start)
+        print(node.stats)
+    return throughput
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark EvmAccountInfo on a local node")
+    parser.add_argument("--state", help="fixture state file (generated when not given)")
+    parser.add_argument("--addresses", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=RPC_WORKERS)
+    NodeConfig.add_arguments(parser)
+    # Defaults resembling a hosted provider
+    parser.set_defaults(
+        latency=0.05, latency_per_item=0.0001, max_batch_size=500, failure_rate=0.001
+    )
+    args = parser.parse_args()
+
+    node_state = NodeState.load_from(args.state) if args.state \
+        else NodeState.generate(args.addresses)
+    results = benchmark(node_state, NodeConfig.from_args(args), args.workers)
+    for method, rate in results.items():
+        print(f"{method}: {rate:.0f} addresses/s")
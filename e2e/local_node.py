@@ -0,0 +1,254 @@
+"""
+Local stand-in for an Ethereum JSON-RPC node, serving eth_getCode, eth_getBalance,
+eth_call and eth_blockNumber (single and batch requests) from a fixture state file,
+with configurable latency, batch size limit, rate limit and random item failures.
+Used to test and benchmark EvmAccountInfo without a real node.
+
+State file (JSON):
+  {
+    "block_number": 123,
+    "accounts": {"0xabc...": {"code": "0x...", "balance": "0x..."}},
+    "calls": {"0xabc...": {"0x<calldata>": "0x<result>"}}
+  }
+Unknown accounts have no code and no balance, unknown calls return "0x".
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+@dataclass
+class NodeConfig:
+    """Behaviour of the local node"""
+    # Seconds per request, plus seconds per item of a batch
+    latency: float = 0.0
+    latency_per_item: float = 0.0
+    # Larger batches are answered with a single error object (like hosted providers)
+    max_batch_size: Optional[int] = None
+    # Requests per second, further requests are answered with status code 429
+    rate_limit: Optional[float] = None
+    # Share of items answered with a (retryable) error
+    failure_rate: float = 0.0
+    seed: int = 0
+
+    @staticmethod
+    def add_arguments(parser: argparse.ArgumentParser):
+        """Adds command line arguments for each setting"""
+        parser.add_argument("--latency", type=float, default=0.0)
+        parser.add_argument("--latency-per-item", type=float, default=0.0)
+        parser.add_argument("--max-batch-size", type=int)
+        parser.add_argument("--rate-limit", type=float, help="requests per second")
+        parser.add_argument("--failure-rate", type=float, default=0.0)
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> NodeConfig:
+        """Config from command line arguments (see add_arguments)"""
+        return cls(
+            latency=args.latency,
+            latency_per_item=args.latency_per_item,
+            max_batch_size=args.max_batch_size,
+            rate_limit=args.rate_limit,
+            failure_rate=args.failure_rate,
+        )
+
+
+@dataclass
+class NodeStats:
+    """Requests handled by the local node"""
+    requests: int = 0
+    items: int = 0
+    rejected_batches: int = 0
+    rate_limited: int = 0
+    failed_items: int = 0
+
+
+@dataclass
+class NodeState:
+    """Chain state served by the local node"""
+    block_number: int = 0
+    accounts: dict[str, dict[str, str]] = field(default_factory=dict)
+    calls: dict[str, dict[str, str]] = field(default_factory=dict)
+
+    @classmethod
+    def load_from(cls, filename: str) -> NodeState:
+        """Loads a fixture state file"""
+        with open(filename, 'r', encoding='utf-8') as state_file:
+            state = json.load(state_file)
+        return cls(
+            block_number=state.get('block_number', 0),
+            accounts={
+                address.lower(): account
+                for address, account in state.get('accounts', {}).items()
+            },
+            calls={address.lower(): calls for address, calls in state.get('calls', {}).items()},
+        )
+
+    def write(self, filename: str):
+        """Writes the state as fixture file"""
+        with open(filename, 'w', encoding='utf-8') as state_file:
+            json.dump(
+                {'block_number': self.block_number, 'accounts': self.accounts, 'calls': self.calls},
+                state_file
+            )
+
+    @classmethod
+    def generate(cls, num_addresses: int, contract_share: float = 0.2, seed: int = 0):
+        """
+        Random state of `num_addresses` accounts, of which `contract_share` are
+        contracts (minimal proxies) and the others have a random balance (possibly none).
+        """
+        rng = random.Random(seed)
+        accounts = {}
+        for _ in range(num_addresses):
+            address = f"0x{rng.getrandbits(160):040x}"
+            if rng.random() < contract_share:
+                implementation = f"{rng.getrandbits(160):040x}"
+                accounts[address] = {
+                    'code': f"0x363d3d373d3d3d363d73{implementation}"
+                            f"5af43d82803e903d91602b57fd5bf3"
+                }
+            else:
+                accounts[address] = {'balance': hex(rng.choice([0, 10 ** 15, 10 ** 18]))}
+        return cls(block_number=15_000_000, accounts=accounts)
+
+
+class LocalNode:
+    """
+    JSON-RPC server for `state` on localhost (on a free port unless `port` is given),
+    running in a background thread while used as context manager.
+    """
+
+    def __init__(self, state: NodeState, config: Optional[NodeConfig] = None, port: int = 0):
+        self.state = state
+        self.config = config or NodeConfig()
+        self.stats = NodeStats()
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        # Start of the current one second rate limit window and its number of requests
+        self._window = (0.0, 0)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """URL of the node"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> LocalNode:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Answers JSON-RPC POST requests"""
+
+            # pylint: disable=invalid-name
+            def do_POST(self):
+                """Handles a single or batch request"""
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                status, response = node.handle(json.loads(body))
+                content = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *_):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+    def _rate_limited(self) -> bool:
+        if self.config.rate_limit is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._window
+            if now - start >= 1:
+                start, count = now, 0
+            self._window = (start, count + 1)
+        return count >= self.config.rate_limit
+
+    def handle(self, request) -> tuple[int, object]:
+        """:return: status code and response to a single or batch `request`"""
+        items = request if isinstance(request, list) else [request]
+        with self._lock:
+            self.stats.requests += 1
+        if self._rate_limited():
+            with self._lock:
+                self.stats.rate_limited += 1
+            return 429, {"jsonrpc": "2.0", "id": None, "error": {
+                "code": 429, "message": "rate limit exceeded"
+            }}
+        max_size = self.config.max_batch_size
+        if max_size is not None and len(items) > max_size:
+            with self._lock:
+                self.stats.rejected_batches += 1
+            return 200, {"jsonrpc": "2.0", "id": None, "error": {
+                "code": -32600, "message": f"batch size {len(items)} exceeds limit {max_size}"
+            }}
+        time.sleep(self.config.latency + self.config.latency_per_item * len(items))
+        responses = [self._item(item) for item in items]
+        return 200, responses if isinstance(request, list) else responses[0]
+
+    def _item(self, item: dict) -> dict:
+        with self._lock:
+            self.stats.items += 1
+            failed = self._random.random() < self.config.failure_rate
+            if failed:
+                self.stats.failed_items += 1
+        if failed:
+            return {"jsonrpc": "2.0", "id": item['id'], "error": {
+                "code": -32005, "message": "request failed, please retry"
+            }}
+        method, params = item['method'], item.get('params', [])
+        if method == 'eth_blockNumber':
+            result = hex(self.state.block_number)
+        elif method in ('eth_getCode', 'eth_getBalance'):
+            account = self.state.accounts.get(params[0].lower(), {})
+            result = account.get('code', '0x') if method == 'eth_getCode' \
+                else account.get('balance', '0x0')
+        elif method == 'eth_call':
+            calls = self.state.calls.get(params[0]['to'].lower(), {})
+            result = calls.get(params[0].get('data', '0x'), '0x')
+        else:
+            return {"jsonrpc": "2.0", "id": item['id'], "error": {
+                "code": -32601, "message": f"method {method} not supported"
+            }}
+        return {"jsonrpc": "2.0", "id": item['id'], "result": result}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local JSON-RPC node for a state file")
+    parser.add_argument("state", help="fixture state file (JSON)")
+    parser.add_argument("--port", type=int, default=8545)
+    NodeConfig.add_arguments(parser)
+    args = parser.parse_args()
+
+    with LocalNode(
+            NodeState.load_from(args.state), NodeConfig.from_args(args), port=args.port
+    ) as local_node:
+        print(f"serving {args.state} at {local_node.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
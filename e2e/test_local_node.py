@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from e2e.local_node import LocalNode, NodeConfig, NodeState
+from src.fetch.contracts import EvmAccountInfo
+from src.files import NetworkFile
+from src.utils.code_store import CodeStore
+
+
+class TestLocalNode(unittest.TestCase):
+    """EvmAccountInfo against a local (flaky) node, no network access needed"""
+
+    def setUp(self) -> None:
+        self.state = NodeState.generate(num_addresses=2000, seed=1)
+        self.contracts = {
+            address for address, account in self.state.accounts.items() if 'code' in account
+        }
+        self.null_balances = {
+            address for address, account in self.state.accounts.items()
+            if int(account.get('balance', '0x0'), 16) < 10 ** 16
+        }
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def account_info(self, node: LocalNode) -> EvmAccountInfo:
+        account_info = EvmAccountInfo(
+            node_url=node.url,
+            addresses=list(self.state.accounts),
+            network='mainnet',
+            store=CodeStore(os.path.join(self.temp_dir.name, "code.sqlite")),
+        )
+        account_info.null_balance_file = NetworkFile("null.csv", path=self.temp_dir.name)
+        account_info.null_balance_checkpoint = NetworkFile(
+            "null.jsonl", path=self.temp_dir.name
+        )
+        return account_info
+
+    def test_flaky_node(self):
+        config = NodeConfig(max_batch_size=150, failure_rate=0.05, seed=2)
+        with LocalNode(self.state, config) as node, \
+                patch('src.fetch.contracts.RETRY_BACKOFF', 0.01):
+            account_info = self.account_info(node)
+            contracts = account_info.contracts(
+                NetworkFile("contracts.csv", path=self.temp_dir.name)
+            )
+            null_balances = account_info.get_null_balances()
+
+        self.assertEqual(contracts, self.contracts)
+        self.assertEqual(null_balances, self.null_balances)
+        self.assertGreater(node.stats.rejected_batches, 0)
+        self.assertGreater(node.stats.failed_items, 0)
+
+    def test_rate_limited_node(self):
+        self.state = NodeState(accounts=dict(list(self.state.accounts.items())[:200]))
+        with LocalNode(self.state, NodeConfig(rate_limit=4)) as node:
+            account_info = self.account_info(node)
+            account_info.max_batch_size = 20
+            null_balances = account_info.get_null_balances()
+
+        self.assertEqual(null_balances, self.null_balances & set(self.state.accounts))
+        self.assertGreater(node.stats.rate_limited, 0)
+
+    def test_eth_call(self):
+        token, data = "0x" + "1" * 40, "0x313ce567"
+        state = NodeState(calls={token: {data: "0x12"}})
+        with LocalNode(state) as node:
+            response = requests.post(node.url, json={
+                "jsonrpc": "2.0",
+                "method": "eth_call",
+                "params": [{"to": token, "data": data}, "latest"],
+                "id": 7
+            })
+        self.assertEqual(response.json(), {"jsonrpc": "2.0", "id": 7, "result": "0x12"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+-- Trader data restricted to trades in blocks [StartBlock, BlockNumber).
+-- Used to incrementally refresh trader data previously fetched up to StartBlock
+-- (all history when StartBlock is 0, see ./generic_trader_data.sql for the
+-- snapshot version).
+-- In order to get block number, we join the trade view on settlement events.
+with
+
+trader_volume AS (
+    select trader          as owner,
+           min(block_time) as first_trade,
+           max(block_time) as last_trade,
+           sum(case
+                   when buy_token_address in
+                        (select contract_address from erc20.stablecoins)
+                       and
+                        sell_token_address in
+                        (select contract_address from erc20.stablecoins)
+                       then 0
+                   else trade_value_usd
+               end)        as non_stable_volume,
+           sum(case
+                   when buy_token_address in
+                        (select contract_address from erc20.stablecoins)
+                       and
+                        sell_token_address in
+                        (select contract_address from erc20.stablecoins)
+                       then trade_value_usd
+                   else 0
+               end)        as stable_volume,
+           count(*)        as num_trades
+    from gnosis_protocol_v2."view_trades"
+             join gnosis_protocol_v2."GPv2Settlement_evt_Settlement"
+                  on tx_hash = evt_tx_hash
+    where evt_block_number >= '{{StartBlock}}'
+      and evt_block_number < '{{BlockNumber}}'
+    group by owner
+)
+
+-- Volumes are neither combined nor rounded and traders without volume are kept
+-- (their trades still count), so that aggregates can be summed across refreshes.
+select concat('0x', encode(t.owner, 'hex')) as trader,
+       non_stable_volume,
+       stable_volume,
+       num_trades,
+       date(first_trade)                   as first_trade,
+       date(last_trade)                    as last_trade
+from trader_volume t
+order by trader
@@ -2,6 +2,7 @@
 
 """This provides the DuneAnalytics class implementation"""
 import os
+import threading
 import time
 from typing import Optional
 
@@ -16,6 +17,7 @@ GRAPH_URL = 'https://core-hsr.duneanalytics.com/v1/graphql'
 # --------- Constants --------- #
 
 
+# pylint: disable=too-many-instance-attributes
 class DuneAnalytics:
     """
     DuneAnalytics class to act as python client for duneanalytics.com.
@@ -35,6 +37,9 @@ class DuneAnalytics:
         self.username = username
         self.password = password
         self.query_id = int(query_id)
+        # All queries are executed through the same saved query (`query_id`),
+        # so concurrent callers must take turns.
+        self._query_lock = threading.Lock()
         self.session = Session()
         headers = {
             'origin': BASE_URL,
@@ -239,24 +244,26 @@ class DuneAnalytics:
             max_retries: int = 2,
     ) -> list[dict]:
         """
-        Pushes new query to dune and executes, awaiting query completion
+        Pushes new query to dune and executes, awaiting query completion.
+        Safe to call from multiple threads (queries are executed one at a time).
         """
-        self.initiate_new_query(
-            query=self.open_query(query_filepath),
-            network=network,
-            query_name="Auto Generated Query",
-            parameters=parameters or []
-        )
-        for _ in range(0, max_retries):
-            try:
-                return self.execute_and_await_results(ping_frequency)
-            except RuntimeError as err:
-                print(
-                    f"execution fetching failed with {err}.\n"
-                    f"re-establishing dune connection and trying again"
-                )
-                self.login_and_fetch_auth()
-        raise Exception(f"Maximum retries ({max_retries}) exceeded")
+        with self._query_lock:
+            self.initiate_new_query(
+                query=self.open_query(query_filepath),
+                network=network,
+                query_name="Auto Generated Query",
+                parameters=parameters or []
+            )
+            for _ in range(0, max_retries):
+                try:
+                    return self.execute_and_await_results(ping_frequency)
+                except RuntimeError as err:
+                    print(
+                        f"execution fetching failed with {err}.\n"
+                        f"re-establishing dune connection and trying again"
+                    )
+                    self.login_and_fetch_auth()
+            raise Exception(f"Maximum retries ({max_retries}) exceeded")
 
     def execute_and_await_results(self, sleep_time) -> list[dict]:
         """
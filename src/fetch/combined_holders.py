@@ -4,22 +4,41 @@ A single script used to fetch results from all other fetchers and combine them
 from __future__ import annotations
 
 import csv
+import hashlib
+import os
+import tempfile
 from collections import defaultdict
-from dataclasses import dataclass
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, Optional
 
 import src.fetch.univ3_gno
-from src.constants import SNAPSHOT_BLOCK_NUMBER, GNO_TOKEN, MIN_GNO, \
-    GNO_HOLDER_ALLOCATION
+from src.constants import SNAPSHOT_BLOCK_NUMBER, GNO_TOKEN, MIN_GNO, FILE_OUT_PATH
 from src.dune_analytics import DuneAnalytics
-from src.fetch.balancer_gno import balancer_gno
+from src.fetch.balancer_gno import balancer_gno, BalancerPool
 from src.fetch.gno_holders import fetch_gno_holders, GnoHolder
 from src.fetch.gno_stakers import fetch_gno_stakers
 from src.fetch.lp_holders import fetch_lp_holders, LiquidityPosition, \
     LiquidityProportion, GenericPool
 from src.fetch.univ3_gno import fetch_univ3_gno
 from src.files import HolderFiles, NetworkFile, File
-from src.models import Allocation, Account
+from src.models import Account
 from src.utils.data import write_to_csv, flatten_without_duplicates
+from src.utils.external_sort import ExternalSorter, merge_join, read_csv_rows, \
+    sorted_file
+from src.utils.file import file_digest
+
+# Upper bound on the number of holder fetches (over both networks) run at once
+HOLDER_FETCH_WORKERS = 8
+
+# Files from which the excluded accounts are derived (see load_excluded_accounts)
+EXCLUSION_SOURCES = {
+    'excluded': File(name='excluded_accounts.csv', path='./data/'),
+    'binance': File(name='binance_accounts.csv', path='./data/'),
+    'generic_pools': File(name='generic_pools.csv', path='./data/'),
+}
 
 
 @dataclass
@@ -60,6 +79,17 @@ class VerboseNetworkHolderData:
         """Makes `total` into a computed field."""
         return self.gno_held + self.lp_gno + self.univ3_gno + self.staked_gno
 
+    def update_contribution(self, column: str, amount: int) -> bool:
+        """
+        Sets a single contribution (e.g. `staked_gno`) and recomputes the total.
+        :return: True if the contribution changed
+        """
+        if getattr(self, column) == amount:
+            return False
+        setattr(self, column, int(amount))
+        self.total_gno = self._compute_total()
+        return True
+
     @classmethod
     def load_from(cls, load_from: File) -> dict[str, VerboseNetworkHolderData]:
         print(f"Loading Network Holder Data from {load_from.name}")
@@ -85,17 +115,43 @@ def transform_proportions(
         gno_holders: dict[str, GnoHolder]
 ) -> defaultdict[str, list[LiquidityPosition]]:
     """
-    Transforms LiquidityProportions into LiquidityPosition based on `gno_holders`
+    Transforms LiquidityProportions into LiquidityPosition based on `gno_holders`.
+    Positions are computed in integer arithmetic, looking up each pool's GNO once.
     """
     print("Transforming Proportions into Positions")
+    pool_gno = {}
     lp_holders = defaultdict(list)
     for account, proportions in liquidity_proportions.items():
         for proportion in proportions:
-            pool_gno = gno_holders[proportion.pool].amount
-            lp_holders[account].append(proportion.to_liquidity_position(pool_gno))
+            gno_amount = pool_gno.get(proportion.pool)
+            if gno_amount is None:
+                gno_amount = pool_gno[proportion.pool] = gno_holders[proportion.pool].amount
+            lp_holders[account].append(proportion.to_liquidity_position(gno_amount))
     return lp_holders
 
 
+def split_balancer_vault(
+        gno_holders: dict[str, GnoHolder],
+        gno_in_balancer_pools: list[BalancerPool],
+):
+    """
+    We remove the vault GNO holdings from the holders list (in place) and replace it
+    with the partitioned individual pool balances
+    """
+    vault_holding = gno_holders.pop('0xba12222222228d8ba445958a75a0704d566bf2c8')
+    # The vault should contain exactly the same amount of GNO
+    # as the partition made by fetching pool balances.
+    balancer_pool_total = sum(p.gno_balance for p in gno_in_balancer_pools)
+    assert vault_holding.amount == balancer_pool_total
+
+    # update GNO holders with balancer pool balances
+    for balancer_pool in gno_in_balancer_pools:
+        gno_holders[balancer_pool.pool_address] = GnoHolder(
+            account=balancer_pool.pool_address,
+            amount=balancer_pool.gno_balance
+        )
+
+
 @dataclass
 class NetworkGnoHoldersBlob:
     """Data class holding all the pieces to build master GNO Holders list"""
@@ -112,60 +168,61 @@ class NetworkGnoHoldersBlob:
             dune: DuneAnalytics,
             network: str,
             block_number: str,
-            load_from: HolderFiles
+            load_from: HolderFiles,
+            executor: Optional[Executor] = None,
     ):
+        """
+        The independent fetches are submitted to `executor` (when provided) and run
+        concurrently, otherwise they are evaluated in sequence.
+        """
         self.network = network
-        self.lp_proportions = fetch_lp_holders(
+        submit = executor.submit if executor is not None else _evaluate_now
+        lp_proportions = submit(
+            fetch_lp_holders,
             dune,
             self.network,
             block_number,
             load_from=load_from.lp_holders
         )
-        self.gno_holders = fetch_gno_holders(
+        gno_holders = submit(
+            fetch_gno_holders,
             dune,
             self.network,
             block_number,
             load_from.gno_holders
         )
         # Initialize empty network specific fields
-        self.stakers, self.uni_holders = {}, {}
+        stakers, gno_in_balancer_pools, uni_holders = None, None, None
         if self.network == 'gchain':
-            self.stakers = fetch_gno_stakers(
+            stakers = submit(
+                fetch_gno_stakers,
                 dune,
                 block_number,
                 load_from.stakers
             )
 
         if self.network == 'mainnet':
-            # Split the Balancer vault balances:
-            gno_in_balancer_pools = balancer_gno(
+            gno_in_balancer_pools = submit(
+                balancer_gno,
                 dune,
                 block_number,
                 load_from.balancer_pools
             )
-            # We remove the vault GNO holdings from the holders list and replace it
-            # with the partitioned individual pool balances
-            vault_holding = self.gno_holders.pop(
-                '0xba12222222228d8ba445958a75a0704d566bf2c8')
-            # The vault should contain exactly the same amount of GNO
-            # as the partition made by fetching pool balances.
-            balancer_pool_total = sum(p.gno_balance for p in gno_in_balancer_pools)
-            assert vault_holding.amount == balancer_pool_total
-
-            # update GNO holders with balancer pool balances
-            for balancer_pool in gno_in_balancer_pools:
-                self.gno_holders[balancer_pool.pool_address] = GnoHolder(
-                    account=balancer_pool.pool_address,
-                    amount=balancer_pool.gno_balance
-                )
-
-            self.uni_holders = fetch_univ3_gno(
+            uni_holders = submit(
+                fetch_univ3_gno,
                 # Dune expects string, but uni expects int
                 block_number=int(block_number),
                 token=GNO_TOKEN['mainnet'],
                 load_from=load_from.univ3_holders
             )
 
+        self.lp_proportions = lp_proportions.result()
+        self.gno_holders = gno_holders.result()
+        self.stakers = stakers.result() if stakers is not None else {}
+        self.uni_holders = uni_holders.result() if uni_holders is not None else {}
+        if gno_in_balancer_pools is not None:
+            split_balancer_vault(self.gno_holders, gno_in_balancer_pools.result())
+
         # THIS MUST HAPPEN LAST (after gno_holders is finalized)
         self.lp_holders = transform_proportions(self.lp_proportions, self.gno_holders)
 
@@ -229,13 +286,6 @@ class CombinedGnoHolder:
         """Makes `total` into a computed field."""
         return self.mainnet_gno + self.gchain_gno
 
-    def to_allocation(self, supply: int) -> Allocation:
-        """Transforms combined holder to allocation as proportion of supply"""
-        return Allocation(
-            account=self.account,
-            amount=(GNO_HOLDER_ALLOCATION * self.total_gno) // supply,
-        )
-
     @classmethod
     def zero_for_account(cls, account: str) -> CombinedGnoHolder:
         """Empty constructor"""
@@ -267,71 +317,87 @@ class CombinedGnoHolderBlob:
         """Returns complete set of accounts on both networks"""
         return self.mainnet.keys() | self.gchain.keys()
 
-    def build_master_holder_data(
+    def combined_holder(self, account: str) -> CombinedGnoHolder:
+        """Holdings of `account` summed over both networks"""
+        mainnet_holdings = self.mainnet.get(account, None)
+        gchain_holdings = self.gchain.get(account, None)
+        return CombinedGnoHolder(
+            account=account,
+            mainnet_gno=mainnet_holdings.total_gno if mainnet_holdings else 0,
+            gchain_gno=gchain_holdings.total_gno if gchain_holdings else 0,
+        )
+
+    def update_master_holder_data(
             self,
+            holders: list[CombinedGnoHolder],
+            affected_accounts: set[str],
             min_gno: int,
             excluded_accounts: set[str],
-            load_from: File,
-    ) -> list[CombinedGnoHolder]:
+    ) -> tuple[list[CombinedGnoHolder], int]:
         """
-        Fetches combined GNO holder data over both networks (mainnet and gchain),
-        builds a combined summary, writes to file and returns the summary.
-        :param min_gno: amounts to exclude from final output.
-        :param excluded_accounts: list of accounts to be removed after processing
-        :param load_from: File path to existing data set
-        :return: combined summary of all GNO holders
+        Recomputes only `affected_accounts` of a previously built master holder list.
+        :return: updated master list (sorted by total GNO descending) along with
+            the change in total eligible GNO
         """
-        try:
-            return CombinedGnoHolder.load_from(load_from)
-        except FileNotFoundError:
-            print(f"file at {load_from.name} not found. Fetching from Dune...")
-
-        results: list[CombinedGnoHolder] = []
-        for account in self.account_set():
-            mainnet_holdings = self.mainnet.get(account, None)
-            gchain_holdings = self.gchain.get(account, None)
-            holder = CombinedGnoHolder(
-                account=account,
-                mainnet_gno=mainnet_holdings.total_gno if mainnet_holdings else 0,
-                gchain_gno=gchain_holdings.total_gno if gchain_holdings else 0,
-            )
-            # Filtering by min gno and excluded accounts.
+        indexed = {holder.account: holder for holder in holders}
+        supply_change = 0
+        for account in affected_accounts:
+            previous = indexed.pop(account, None)
+            if previous is not None:
+                supply_change -= previous.total_gno
+            holder = self.combined_holder(account)
             if holder.total_gno >= min_gno and holder.account not in excluded_accounts:
-                results.append(holder)
+                indexed[account] = holder
+                supply_change += holder.total_gno
+        results = sorted(indexed.values(), key=lambda t: (-t.total_gno, t.account))
+        return results, supply_change
+
+
+def _evaluate_now(function: Callable, *args, **kwargs) -> Future:
+    """Evaluates `function` immediately, wrapping its result in a completed Future"""
+    future = Future()
+    future.set_result(function(*args, **kwargs))
+    return future
 
-        # Sort by total GNO descending.
-        results.sort(key=lambda t: (-t.total_gno, t.account))
-        print("successfully built master holder list")
-        write_to_csv(data_list=results, outfile=load_from)
-        return results
 
+def _build_network_holders(
+        dune: DuneAnalytics,
+        network: str,
+        load_from: HolderFiles,
+        executor: Executor,
+) -> dict[str, VerboseNetworkHolderData]:
+    network_blob = NetworkGnoHoldersBlob(
+        dune=dune,
+        network=network,
+        block_number=SNAPSHOT_BLOCK_NUMBER[network],
+        load_from=load_from,
+        executor=executor,
+    )
+    print(f"Building Combined Holder Files for {network}")
+    return network_blob.combine(load_from.network_master)
 
-def build_holder_blob(
+
+def build_network_holders(
         dune: DuneAnalytics,
         load_from: HolderFiles,
-) -> CombinedGnoHolderBlob:
+):
     """
-    Builds combined HoldersBlob for both networks.
+    Builds (or loads) the network holders master files of both networks.
+    Both networks, and the independent fetches within each, are built concurrently
+    (Dune queries themselves are still executed one at a time).
     :param dune: open connection to dune
     :param load_from: existing in case you don't want to fetch from scratch
-    :return: HoldersBlob
     """
-    holder_dict = {}
-    for network in ['mainnet', 'gchain']:
-        network_blob = NetworkGnoHoldersBlob(
-            dune=dune,
-            network=network,
-            block_number=SNAPSHOT_BLOCK_NUMBER[network],
-            load_from=load_from
-        )
-        print(f"Building Combined Holder Files for {network}")
-        combined_result = network_blob.combine(load_from.network_master)
-
-        holder_dict[network] = combined_result
-    return CombinedGnoHolderBlob(
-        mainnet=holder_dict['mainnet'],
-        gchain=holder_dict['gchain']
-    )
+    networks = ['mainnet', 'gchain']
+    # Separate pools, so network builds waiting on their fetches can't starve them.
+    with ThreadPoolExecutor(max_workers=HOLDER_FETCH_WORKERS) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=len(networks)) as network_pool:
+        holder_futures = [
+            network_pool.submit(_build_network_holders, dune, network, load_from, fetch_pool)
+            for network in networks
+        ]
+        for future in holder_futures:
+            future.result()
 
 
 def generate_combined_holders(
@@ -340,31 +406,339 @@ def generate_combined_holders(
 ) -> list[CombinedGnoHolder]:
     """
     With dune connection, either fetches or parses holder data and builds
-    a complete account of gno holder data
+    a complete account of gno holder data.
+    The network holder files are merged into the combined holders file
+    with bounded memory (see stream_master_holder_data).
     """
+    try:
+        return CombinedGnoHolder.load_from(load_from.combined)
+    except FileNotFoundError:
+        print(f"file at {load_from.combined.name} not found. Fetching from Dune...")
+
     excluded_accounts = load_excluded_accounts()
-    holder_blob = build_holder_blob(dune, load_from)
-    return holder_blob.build_master_holder_data(
-        min_gno=MIN_GNO,
-        excluded_accounts=excluded_accounts,
-        load_from=load_from.combined,
+    build_network_holders(dune, load_from)
+    stream_master_holder_data(
+        load_from, min_gno=MIN_GNO, excluded_accounts=excluded_accounts
     )
+    return CombinedGnoHolder.load_from(load_from.combined)
+
+
+def _network_totals(load_from: File) -> Iterator[tuple[str, int]]:
+    """Streams (account, total GNO) records of a network holders master file"""
+    for row in read_csv_rows(load_from):
+        yield row['account'].lower(), int(row['total_gno'])
+
+
+def merge_network_totals(
+        mainnet: Iterable[tuple[str, int]],
+        gchain: Iterable[tuple[str, int]],
+) -> Iterator[CombinedGnoHolder]:
+    """
+    Sort-merge join of two account-sorted (account, total GNO) streams into
+    CombinedGnoHolders, in order of account.
+    Raises ValueError if either stream is unsorted or contains duplicate accounts.
+    """
+    for mainnet_total, gchain_total in merge_join(mainnet, gchain, key=itemgetter(0)):
+        account = (mainnet_total or gchain_total)[0]
+        yield CombinedGnoHolder(
+            account=account,
+            mainnet_gno=mainnet_total[1] if mainnet_total else 0,
+            gchain_gno=gchain_total[1] if gchain_total else 0,
+        )
+
+
+def _holder_order(row: dict[str, str]) -> tuple[int, str]:
+    """Output order of combined holders (total GNO descending then account)"""
+    return -int(row['total_gno']), row['account']
 
 
-def load_excluded_accounts() -> set[str]:
+def stream_master_holder_data(
+        load_from: HolderFiles,
+        min_gno: int = MIN_GNO,
+        excluded_accounts: Optional[set[str]] = None,
+        chunk_size: int = 100_000,
+) -> int:
+    """
+    Builds the combined holders file from previously built network holders
+    master files with bounded memory: each is (externally) sorted by account, merged,
+    filtered and externally sorted into the combined holders file.
+    :param chunk_size: number of records held in memory per sorted chunk
+    :return: total GNO held by all written holders
+    """
+    excluded_accounts = excluded_accounts if excluded_accounts is not None \
+        else load_excluded_accounts()
+    supply = 0
+    with tempfile.TemporaryDirectory() as temp_dir, ExternalSorter(
+            [f.name for f in fields(CombinedGnoHolder)], _holder_order, chunk_size, temp_dir
+    ) as sorter:
+        network_totals = {
+            network: _network_totals(sorted_file(
+                load_from.network_master.filename(network),
+                lambda row: row['account'].lower(),
+                temp_dir,
+                chunk_size,
+            ))
+            for network in ['mainnet', 'gchain']
+        }
+        for holder in merge_network_totals(**network_totals):
+            if holder.total_gno >= min_gno and holder.account not in excluded_accounts:
+                supply += holder.total_gno
+                sorter.add({
+                    'account': holder.account,
+                    'mainnet_gno': str(holder.mainnet_gno),
+                    'gchain_gno': str(holder.gchain_gno),
+                    'total_gno': str(holder.total_gno),
+                })
+        sorter.write(load_from.combined)
+    print("successfully streamed master holder list")
+    return supply
+
+
+# Contribution columns of VerboseNetworkHolderData derived from each holder source
+CONTRIBUTION_SOURCES = {
+    # Pool GNO balances (including the Balancer vault split) also determine LP positions
+    'gno_holders': ('gno_held', 'lp_gno'),
+    'balancer_pools': ('gno_held', 'lp_gno'),
+    'lp_holders': ('lp_gno',),
+    'stakers': ('staked_gno',),
+    'univ3_holders': ('univ3_gno',),
+}
+
+
+def holder_source_files(load_from: HolderFiles, network: str) -> dict[str, File]:
+    """Source files (by CONTRIBUTION_SOURCES name) of the holder data on `network`"""
+    files = {
+        'gno_holders': load_from.gno_holders.filename(network),
+        'lp_holders': load_from.lp_holders.filename(network),
+    }
+    if network == 'mainnet':
+        files['balancer_pools'] = load_from.balancer_pools
+        files['univ3_holders'] = load_from.univ3_holders
+    if network == 'gchain':
+        files['stakers'] = load_from.stakers
+    return files
+
+
+def load_source_manifest(load_from: File) -> dict[str, str]:
+    """Loads source file digests (by filename) recorded in `load_from`"""
+    try:
+        with open(load_from.filename(), 'r', encoding='utf-8') as manifest_file:
+            return {row['file']: row['digest'] for row in csv.DictReader(manifest_file)}
+    except FileNotFoundError:
+        return {}
+
+
+def source_digests(sources: dict[str, File]) -> dict[str, str]:
+    """
+    Digests of source files by filename.
+    Missing files (i.e. removed to be fetched again) have an empty digest.
+    """
+    digests = {}
+    for file in sources.values():
+        try:
+            digests[file.filename()] = file_digest(file)
+        except FileNotFoundError:
+            digests[file.filename()] = ''
+    return digests
+
+
+def write_source_manifest(manifest: dict[str, str], outfile: File):
+    """Writes source file digests (by filename) to `outfile`"""
+    if not os.path.exists(outfile.path):
+        os.makedirs(outfile.path)
+    with open(outfile.filename(), 'w', encoding='utf-8') as manifest_file:
+        writer = csv.writer(manifest_file, lineterminator='\n')
+        writer.writerow(['file', 'digest'])
+        writer.writerows(sorted(manifest.items()))
+
+
+def network_contributions(
+        dune: DuneAnalytics,
+        network: str,
+        block_number: str,
+        load_from: HolderFiles,
+        columns: set[str],
+) -> dict[str, dict[str, int]]:
+    """
+    Recomputes the requested contribution columns on `network` from their sources.
+    :return: non-zero amounts by account for each requested column
+    """
+    results = {}
+    if columns & {'gno_held', 'lp_gno'}:
+        gno_holders = fetch_gno_holders(dune, network, block_number, load_from.gno_holders)
+        if network == 'mainnet':
+            split_balancer_vault(
+                gno_holders, balancer_gno(dune, block_number, load_from.balancer_pools)
+            )
+        lp_holders = transform_proportions(
+            fetch_lp_holders(dune, network, block_number, load_from=load_from.lp_holders),
+            gno_holders,
+        )
+        results['gno_held'] = {
+            account: holder.amount for account, holder in gno_holders.items()
+        }
+        results['lp_gno'] = {
+            account: sum(position.gno_amount for position in positions)
+            for account, positions in lp_holders.items()
+        }
+    if 'staked_gno' in columns:
+        stakers = fetch_gno_stakers(dune, block_number, load_from.stakers)
+        results['staked_gno'] = {
+            account: holder.amount for account, holder in stakers.items()
+        }
+    if 'univ3_gno' in columns:
+        uni_holders = fetch_univ3_gno(
+            block_number=int(block_number),
+            token=GNO_TOKEN['mainnet'],
+            load_from=load_from.univ3_holders
+        )
+        results['univ3_gno'] = {
+            account: holder.amount for account, holder in uni_holders.items()
+        }
+    return {
+        column: {account: amount for account, amount in amounts.items() if amount}
+        for column, amounts in results.items()
+    }
+
+
+def apply_contributions(
+        network_holders: dict[str, VerboseNetworkHolderData],
+        network: str,
+        contributions: dict[str, dict[str, int]],
+) -> set[str]:
+    """
+    Replaces the given contribution columns of `network_holders` (in place).
+    Accounts left without any GNO on `network` are removed.
+    :return: accounts whose holdings changed
+    """
+    affected = set()
+    for column, amounts in contributions.items():
+        previous = {
+            account for account, holder in network_holders.items()
+            if getattr(holder, column) != 0
+        }
+        for account in previous | amounts.keys():
+            holder = network_holders.get(account)
+            if holder is None:
+                holder = network_holders[account] = VerboseNetworkHolderData(
+                    account=account, network=network, gno_held=0, lp_gno=0
+                )
+            if holder.update_contribution(column, amounts.get(account, 0)):
+                affected.add(account)
+    for account in affected:
+        if network_holders[account].total_gno == 0:
+            del network_holders[account]
+    return affected
+
+
+@dataclass
+class CombinedHolderRefresh:
+    """Master holder list along with what changed in the last refresh"""
+    holders: list[CombinedGnoHolder]
+    # Total GNO held by all holders in the master list
+    supply: int
+    affected_accounts: set[str]
+
+
+def refresh_combined_holders(
+        dune: DuneAnalytics,
+        load_from: HolderFiles,
+) -> CombinedHolderRefresh:
+    """
+    Brings previously built holder data up to date with its source files.
+    Only the contribution columns of changed sources (according to the source manifest)
+    are recomputed, and the master list is only updated for the affected accounts.
+    Builds everything from scratch if there is no previous holder data.
+    """
+    try:
+        holders = CombinedGnoHolder.load_from(load_from.combined)
+        network_holders = {
+            network: VerboseNetworkHolderData.load_from(
+                load_from.network_master.filename(network)
+            )
+            for network in ['mainnet', 'gchain']
+        }
+    except FileNotFoundError:
+        print("No previous holder data found, building from scratch...")
+        holders = generate_combined_holders(dune, load_from)
+        manifest = {}
+        for network in ['mainnet', 'gchain']:
+            manifest.update(source_digests(holder_source_files(load_from, network)))
+        write_source_manifest(manifest, load_from.source_manifest)
+        return CombinedHolderRefresh(
+            holders=holders,
+            supply=sum(holder.total_gno for holder in holders),
+            affected_accounts={holder.account for holder in holders},
+        )
+
+    manifest = load_source_manifest(load_from.source_manifest)
+    if not manifest:
+        print("No holder source manifest, recording current sources as up to date")
+    affected: set[str] = set()
+    for network, holder_data in network_holders.items():
+        sources = holder_source_files(load_from, network)
+        digests = source_digests(sources)
+        changed = [
+            name for name, file in sources.items()
+            if (manifest and manifest.get(file.filename()) != digests[file.filename()])
+            or not digests[file.filename()]
+        ]
+        if not changed:
+            manifest.update(digests)
+            continue
+        print(f"{network} holder sources changed: {changed}")
+        columns = {column for name in changed for column in CONTRIBUTION_SOURCES[name]}
+        network_affected = apply_contributions(
+            holder_data,
+            network,
+            network_contributions(
+                dune, network, SNAPSHOT_BLOCK_NUMBER[network], load_from, columns
+            ),
+        )
+        # Missing sources have now been fetched again.
+        manifest.update(source_digests(sources))
+        print(f"{len(network_affected)} {network} holders changed")
+        write_to_csv(
+            data_list=sorted(holder_data.values(), key=lambda t: (-t.total_gno, t.account)),
+            outfile=load_from.network_master.filename(network),
+        )
+        affected |= network_affected
+
+    supply = sum(holder.total_gno for holder in holders)
+    if affected:
+        holders, supply_change = CombinedGnoHolderBlob(
+            mainnet=network_holders['mainnet'],
+            gchain=network_holders['gchain'],
+        ).update_master_holder_data(
+            holders=holders,
+            affected_accounts=affected,
+            min_gno=MIN_GNO,
+            excluded_accounts=load_excluded_accounts(),
+        )
+        supply += supply_change
+        write_to_csv(data_list=holders, outfile=load_from.combined)
+    write_source_manifest(manifest, load_from.source_manifest)
+    return CombinedHolderRefresh(
+        holders=holders,
+        supply=supply,
+        affected_accounts=affected,
+    )
+
+
+def _fetch_excluded_accounts(block_number: int) -> set[str]:
     excluded = set()
 
-    excluded |= File(name='excluded_accounts.csv', path='./data/').get_accounts_from()
+    excluded |= EXCLUSION_SOURCES['excluded'].get_accounts_from()
 
     # exclude Binance Accounts
-    excluded |= File(name='binance_accounts.csv', path='./data/').get_accounts_from()
+    excluded |= EXCLUSION_SOURCES['binance'].get_accounts_from()
 
     # exclude univ3 pools
     excluded |= set(
         p.address
         for p in src.fetch.univ3_gno.fetch_pools(
-            block_number=int(SNAPSHOT_BLOCK_NUMBER['mainnet']),
-            token=GNO_TOKEN
+            block_number=block_number,
+            token=GNO_TOKEN['mainnet']
         )
     )
     # exclude generic mainnet pools
@@ -372,7 +746,7 @@ def load_excluded_accounts() -> set[str]:
         p.address
         for p in GenericPool.load_from_file(
             network='mainnet',
-            pool_file='./data/generic_pools.csv'
+            pool_file=EXCLUSION_SOURCES['generic_pools'].filename()
         )
     )
     # exclude generic gchain pools
@@ -380,13 +754,54 @@ def load_excluded_accounts() -> set[str]:
         p.address
         for p in GenericPool.load_from_file(
             network='gchain',
-            pool_file='./data/generic_pools.csv'
+            pool_file=EXCLUSION_SOURCES['generic_pools'].filename()
         )
     )
 
     return {Account(a).account for a in excluded}
 
 
+def _exclusion_key(block_number: int) -> str:
+    """Digest of the snapshot block and the contents of all exclusion source files"""
+    digest = hashlib.sha256(str(block_number).encode())
+    for source in EXCLUSION_SOURCES.values():
+        with open(source.filename(), 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def _cached_excluded_accounts(
+        block_number: int,
+        key: str,
+        cache_path: str,
+) -> frozenset[str]:
+    artifact = File(name=f"excluded-accounts-{block_number}-{key}.csv", path=cache_path)
+    try:
+        excluded = artifact.get_accounts_from()
+        print(f"Loaded {len(excluded)} excluded accounts from {artifact.name}")
+        return frozenset(excluded)
+    except FileNotFoundError:
+        print(f"file at {artifact.name} not found. Fetching excluded accounts")
+    excluded = _fetch_excluded_accounts(block_number)
+    write_to_csv(data_list=[Account(a) for a in sorted(excluded)], outfile=artifact)
+    return frozenset(excluded)
+
+
+def load_excluded_accounts(cache_path: str = FILE_OUT_PATH) -> set[str]:
+    """
+    Accounts excluded from all allocations (at the mainnet snapshot block).
+    Results are persisted to `cache_path`, keyed by snapshot block and the contents
+    of the exclusion source files, and memoised in process,
+    so the pools are only fetched from the network once.
+    :return: a fresh (mutable) copy of the excluded accounts
+    """
+    block_number = int(SNAPSHOT_BLOCK_NUMBER['mainnet'])
+    return set(
+        _cached_excluded_accounts(block_number, _exclusion_key(block_number), cache_path)
+    )
+
+
 if __name__ == '__main__':
     dune_connection = DuneAnalytics.new_from_environment()
 
@@ -2,52 +2,250 @@
 Single use EthRPC module for fetching code at address specified
 and determining whether the address is a deployed smart contract.
 """
+from __future__ import annotations
+
 import argparse
 import csv
-from collections import defaultdict
-from typing import Callable, TypeVar
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, TypeVar
 
 import requests
 
-from src.contract_bytecode import WALLET_BYTECODE, NOT_WALLET_BYTECODE, \
-    UNVERIFIED_BYTECODE
+from src.contract_bytecode import bytecode_index
 from src.files import NetworkFile
 from src.models import Account
+from src.utils.code_store import CodeInfo, CodeStore, code_store
 from src.utils.data import File
 from src.utils.file import write_to_csv
 
 # pylint: disable=invalid-name
 V = TypeVar('V', int, str)
 
-# pylint: disable=too-few-public-methods
+# Number of batches in flight at once
+RPC_WORKERS = 4
+# Seconds before a batch request is abandoned (and retried in smaller batches)
+RPC_TIMEOUT = 30
+# Batches answered faster than this (in seconds) may grow
+TARGET_BATCH_LATENCY = 2.0
+INITIAL_BATCH_SIZE = 100
+# Attempts per address (failed requests are retried with exponential backoff)
+MAX_ATTEMPTS = 8
+# Seconds before the first retry, doubled with every further attempt (up to MAX_BACKOFF)
+RETRY_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+# JSON-RPC error codes of requests which fail regardless of retries
+# (invalid request, method not found, invalid params)
+PERMANENT_RPC_ERRORS = {-32600, -32601, -32602}
+# Client error status codes of requests which may succeed when retried
+# (request timeout, too early), all others fail regardless of retries
+RETRYABLE_CLIENT_ERRORS = {408, 425}
+
+
+class BatchRejected(IOError):
+    """The node could not handle a request batch of this size"""
+
+
+class RateLimited(BatchRejected):
+    """The node asked to slow down (status code 429)"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UnexpectedResponse(IOError):
+    """The node answered with an unexpected status code or a body that isn't JSON"""
+
+
+@dataclass
+class PendingBatch:
+    """Addresses to be (re)requested after `delay` seconds"""
+    addresses: list[str]
+    attempt: int = 0
+    delay: float = 0.0
+
+    def retry(self, addresses: list[str], reason: str, retry_after: float = 0.0) -> PendingBatch:
+        """
+        Next attempt for (failed) `addresses` of this batch, after exponential backoff
+        (or `retry_after`, if longer).
+        :raises IOError: when the retry budget of the addresses is used up
+        """
+        if self.attempt + 1 >= MAX_ATTEMPTS:
+            raise IOError(
+                f"Requests for {len(addresses)} addresses (e.g. \"{addresses[0]}\") "
+                f"failed {MAX_ATTEMPTS} times, last with {reason}"
+            )
+        backoff = min(MAX_BACKOFF, RETRY_BACKOFF * 2 ** self.attempt)
+        return PendingBatch(addresses, self.attempt + 1, max(backoff, retry_after))
+
+
+def _retry_after(response: requests.Response) -> float:
+    """Seconds to wait according to the Retry-After header (if given in seconds)"""
+    try:
+        return float(response.headers.get('Retry-After', 0))
+    except ValueError:
+        return 0.0
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size adjusted to the node's responses: halved whenever a batch is rejected
+    (timeouts, 413s, batch limit errors) and grown by half while batches are fast,
+    within [1, `maximum`].
+    """
+
+    def __init__(self, initial: int, maximum: int, target_latency: float):
+        self.maximum = maximum
+        self.size = max(1, min(initial, maximum))
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+
+    def succeeded(self, size: int, latency: float):
+        """Records a successful batch of `size` answered in `latency` seconds"""
+        with self._lock:
+            # Only batches of (at least) the current size are evidence for growing.
+            if latency < self.target_latency and size >= self.size:
+                self.size = min(self.maximum, self.size + max(1, self.size // 2))
+
+    def rejected(self, size: int):
+        """Records a rejected batch of `size`"""
+        with self._lock:
+            self.size = max(1, min(self.size, size // 2))
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    """Connection pool of the current thread"""
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _timed(func: Callable[[list[str]], dict[str, V]], batch: PendingBatch):
+    """:return: func(batch.addresses) (after the batch's delay) and the time it took"""
+    time.sleep(batch.delay)
+    start = time.monotonic()
+    result = func(batch.addresses)
+    return result, time.monotonic() - start
+
+
+def load_checkpoint(checkpoint: File) -> dict:
+    """Results of the batches completed by an interrupted batch call"""
+    results: dict = {}
+    try:
+        with open(checkpoint.filename(), 'r', encoding='utf-8') as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    results |= json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of an interrupted write
+                    pass
+    except FileNotFoundError:
+        return {}
+    print(f"resuming with {len(results)} results from {checkpoint.name}")
+    return results
+
+
+@contextmanager
+def checkpoint_writer(checkpoint: Optional[File]) -> Iterator[Callable[[dict], None]]:
+    """
+    Yields a function appending the results of each completed batch to `checkpoint`.
+    The checkpoint is removed once the batch call completes.
+    """
+    if checkpoint is None:
+        yield lambda results: None
+        return
+    os.makedirs(checkpoint.path, exist_ok=True)
+    with open(checkpoint.filename(), 'a', encoding='utf-8') as checkpoint_file:
+        def save(results: dict):
+            checkpoint_file.write(json.dumps(results) + '\n')
+            checkpoint_file.flush()
+
+        yield save
+    os.remove(checkpoint.filename())
+
+
+@dataclass
+class UnknownBytecode:
+    """Contract bytecode missing from the bytecode index, recorded for labelling"""
+    code_hash: str
+    code_length: int
+    implementation: str
+    num_accounts: int
+    example_account: str
+
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
 class EvmAccountInfo:
     """
     Class consisting of 3 parameters to determine if the addresses are contracts.
     :param max_batch_size: max number of queries to batch into a single rpc call
+    :param max_workers: max number of rpc calls in flight at once
     :param node_url: Ethereum node url (with api key)
     :param addresses: list of ethereum address (42 character hexadecimal string)
+    :param store: code info known from previous runs (default: code_store())
     """
 
+    # pylint: disable=too-many-arguments
     def __init__(
             self,
             node_url: str,
             addresses: list[str],
             network: str,
-            max_batch_size: int = 1000
+            max_batch_size: int = 1000,
+            max_workers: int = RPC_WORKERS,
+            store: Optional[CodeStore] = None,
     ):
         self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.store = store or code_store()
+        # Block at which missing code is fetched (head of the chain when first needed)
+        self._block: Optional[int] = None
+        self._block_lock = threading.Lock()
         self.node_url = node_url
         self.network = network
         # de-duplicate to reduce unnecessary queries
         self.addresses = list(set(addresses))
         self.null_balance_file = NetworkFile("null-balances.csv")
+        self.null_balance_checkpoint = NetworkFile("null-balances-checkpoint.jsonl")
+        self.unknown_bytecode_file = NetworkFile("unknown-bytecode.csv")
         # TODO - could store the results of batch calls in the instance
         #  However this would require self.update_all whenever the addresses change.
 
-    def _get_code_at(self, addresses: list[str]) -> dict[str, str]:
+    def _rpc_batch(
+            self,
+            method: str,
+            addresses: list[str],
+            block: str = "latest",
+    ) -> dict[str, str]:
         """
-        :return: map {address => byte_code_at_address}
+        Calls `method` with params [address, `block`] for all `addresses`
+        in a single batch request.
+        :raises BatchRejected: when the node can't handle a batch of this size
+        :raises RateLimited: when the node asks to slow down
+        :raises UnexpectedResponse: on responses which may be fine when retried
+        :raises IOError: when a request is invalid (see PERMANENT_RPC_ERRORS)
+            or refused (client error status codes, see RETRYABLE_CLIENT_ERRORS)
+        :return: map {address => result} of the successful requests
         """
+        return self._post_batch(method, addresses, [[address, block] for address in addresses])
+
+    def _post_batch(
+            self,
+            method: str,
+            addresses: list[str],
+            params: list[list[str]],
+    ) -> dict[str, str]:
+        """Calls `method` with the `params` of each of `addresses` (see `_rpc_batch`)"""
         if len(addresses) > self.max_batch_size:
             size = len(addresses)
             raise RuntimeError(
@@ -55,25 +253,105 @@ class EvmAccountInfo:
                 f" partition your list and try again"
             )
         request_data = []
-        for index, eth_address in enumerate(addresses):
+        for index, request_params in enumerate(params):
             request_data.append({
                 "jsonrpc": "2.0",
-                "method": "eth_getCode",
-                "params": [eth_address, "latest"],
+                "method": method,
+                "params": request_params,
                 "id": index
             })
-        response = requests.post(self.node_url, json=request_data)
+        try:
+            response = _session().post(self.node_url, json=request_data, timeout=RPC_TIMEOUT)
+        except requests.Timeout as err:
+            raise BatchRejected(f"timed out after {RPC_TIMEOUT}s") from err
+        if response.status_code == 429:
+            raise RateLimited("status code 429", _retry_after(response))
+        if response.status_code == 413 or response.status_code >= 500:
+            raise BatchRejected(f"status code {response.status_code}")
+        if not response.ok:
+            if response.status_code in RETRYABLE_CLIENT_ERRORS:
+                raise UnexpectedResponse(f"status code {response.status_code}")
+            raise IOError(
+                f"Request {method} refused with status code {response.status_code}: "
+                f"{response.text[:200]}"
+            )
+        try:
+            body = response.json()
+        except ValueError as err:
+            # e.g. an error page of a proxy in front of the node
+            raise UnexpectedResponse(f"response {response.text[:200]!r}") from err
+        if not isinstance(body, list):
+            # Providers answer batches over their limit with a single error object.
+            raise BatchRejected(f"response {body}")
+        # Failed requests are left out of the results (to be retried).
         results = {}
-        for result_dict in response.json():
-            try:
+        errors = []
+        for result_dict in body:
+            if 'result' in result_dict:
                 results[addresses[result_dict['id']]] = result_dict['result']
-            except KeyError as err:
+            elif result_dict.get('error', {}).get('code') in PERMANENT_RPC_ERRORS:
                 raise IOError(
-                    f"Request for code at address \"{addresses[result_dict['id']]}\" "
+                    f"Request {method} for address \"{addresses[result_dict['id']]}\" "
                     f"failed with response {result_dict}"
-                ) from err
+                )
+            else:
+                errors.append(result_dict)
+        if errors:
+            print(f"{len(errors)} of {len(addresses)} {method} requests failed, "
+                  f"e.g. {errors[0]}")
+        return results
+
+    def _get_code_at(self, addresses: list[str]) -> dict[str, str]:
+        """
+        :return: map {address => byte_code_at_address}
+        """
+        return self._rpc_batch("eth_getCode", addresses)
+
+    def block_number(self) -> int:
+        """
+        Block at which code is fetched (the latest block when first called).
+        Resolved once (per instance) with the same retries and backoff as batch calls.
+        """
+        with self._block_lock:
+            if self._block is None:
+                latest = self.batch_call(
+                    ["latest"],
+                    lambda keys: self._post_batch("eth_blockNumber", keys, [[] for _ in keys]),
+                )
+                self._block = int(latest["latest"], base=16)
+                print(f"fetching code on {self.network} at block {self._block}")
+        return self._block
+
+    def _fetch_code_info(self, addresses: list[str]) -> dict[str, CodeInfo]:
+        """Fetches code at `addresses` and adds its info to the store"""
+        block = self.block_number()
+        results = {
+            address: CodeInfo.from_code(address, code, block)
+            for address, code in self._rpc_batch("eth_getCode", addresses, hex(block)).items()
+        }
+        # Merged per batch, so an interrupted run keeps its progress.
+        self.store.merge(self.network, results.values())
         return results
 
+    def code_info(self, addresses: list[str]) -> dict[str, CodeInfo]:
+        """
+        Code info of `addresses` from the store,
+        only those not stored yet are fetched from the node.
+        :return: map {address => code info}
+        """
+        known = self.store.lookup(self.network, addresses)
+        missing = sorted({a for a in addresses if a.lower() not in known})
+        print(f"{len(addresses) - len(missing)} of {len(addresses)} addresses "
+              f"found in code store for {self.network}")
+        if missing:
+            # Pinned before any batch is submitted, so all workers fetch at the same block.
+            self.block_number()
+            known |= {
+                address.lower(): info
+                for address, info in self.batch_call(missing, self._fetch_code_info).items()
+            }
+        return {address: known[address.lower()] for address in addresses}
+
     @staticmethod
     def load_from_file(file: File) -> set:
         """Loads results dict from a file containing known contract addresses"""
@@ -82,19 +360,82 @@ class EvmAccountInfo:
             reader = csv.DictReader(csv_file)
             return set(row['account'] for row in reader)
 
-
+    # pylint: disable=too-many-locals
     def batch_call(
             self,
             addresses: list[str],
-            func: Callable[[list[str]], dict[str, V]]
+            func: Callable[[list[str]], dict[str, V]],
+            checkpoint: Optional[File] = None,
     ) -> dict[str, V]:
-        print(f"making batch call for {len(addresses)} addresses on "
+        """
+        Applies `func` to `addresses` in batches, with up to `max_workers` batches
+        in flight. The batch size adapts to the node (see AdaptiveBatchSize),
+        rejected batches are retried in smaller batches and addresses missing from the
+        results of `func` (failed requests) are retried with backoff (see PendingBatch).
+        :param checkpoint: file recording completed batches, from which an
+            interrupted call resumes
+        :return: results of all batches (in order of `addresses`)
+        """
+        results = load_checkpoint(checkpoint) if checkpoint else {}
+        remaining = [address for address in addresses if address not in results]
+        print(f"making batch call for {len(remaining)} addresses on "
               f"{self.network} (this will take a while)...")
-        results = {}
-        for index in range(0, len(addresses), self.max_batch_size):
-            partition = addresses[index:index + self.max_batch_size]
-            results |= func(partition)
-        return results
+        batch_size = AdaptiveBatchSize(
+            INITIAL_BATCH_SIZE, self.max_batch_size, TARGET_BATCH_LATENCY
+        )
+        retries: deque[PendingBatch] = deque()
+        cursor = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                checkpoint_writer(checkpoint) as save:
+            running: dict[Future, PendingBatch] = {}
+            while cursor < len(remaining) or retries or running:
+                while len(running) < self.max_workers and (retries or cursor < len(remaining)):
+                    if retries:
+                        batch = retries.popleft()
+                    else:
+                        batch = PendingBatch(remaining[cursor:cursor + batch_size.size])
+                        cursor += len(batch.addresses)
+                    running[executor.submit(_timed, func, batch)] = batch
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = running.pop(future)
+                    try:
+                        batch_results, latency = future.result()
+                    except RateLimited as err:
+                        # Not a matter of batch size, retry the same batch after waiting.
+                        retries.append(batch.retry(batch.addresses, str(err), err.retry_after))
+                        continue
+                    except UnexpectedResponse as err:
+                        retries.append(batch.retry(batch.addresses, str(err)))
+                        continue
+                    except (BatchRejected, requests.ConnectionError) as err:
+                        retries.extend(self._split_rejected(batch, batch_size, str(err)))
+                        continue
+                    batch_size.succeeded(len(batch.addresses), latency)
+                    results |= batch_results
+                    save(batch_results)
+                    failed = [address for address in batch.addresses if address not in results]
+                    if failed:
+                        retries.append(batch.retry(failed, "missing results"))
+
+        return {address: results[address] for address in addresses}
+
+    @staticmethod
+    def _split_rejected(
+            batch: PendingBatch,
+            batch_size: AdaptiveBatchSize,
+            reason: str,
+    ) -> list[PendingBatch]:
+        """Batches in which the addresses of a rejected `batch` are retried"""
+        if len(batch.addresses) == 1:
+            return [batch.retry(batch.addresses, reason)]
+        batch_size.rejected(len(batch.addresses))
+        print(f"batch of {len(batch.addresses)} rejected ({reason}), "
+              f"retrying in batches of {batch_size.size}")
+        return [
+            PendingBatch(batch.addresses[start:start + batch_size.size], batch.attempt)
+            for start in range(0, len(batch.addresses), batch_size.size)
+        ]
 
     def contracts(self, load_from: NetworkFile) -> set[str]:
         """
@@ -108,10 +449,9 @@ class EvmAccountInfo:
             except FileNotFoundError:
                 print(f"file at {load_file} not found. Fetching from Node")
 
-        batch_results = self.batch_call(self.addresses, self._get_code_at)
         results = {
-            account for account, code in batch_results.items()
-            if code != "0x"
+            account for account, info in self.code_info(self.addresses).items()
+            if info.is_contract()
         }
         print(f"found {len(results)} contracts, writing to file")
         write_to_csv(
@@ -121,56 +461,61 @@ class EvmAccountInfo:
         return results
 
     def get_non_wallets(self, contracts: set[str]) -> set[str]:
-        code_at = self.batch_call(
-            addresses=list(contracts),
-            func=self._get_code_at
-        )
-        collector = defaultdict(list)
-        for account, code in code_at.items():
-            collector[code].append(account)
-
-        wallets = set()
-        for byte_code, accounts in collector.items():
-            if byte_code in WALLET_BYTECODE | UNVERIFIED_BYTECODE:
-                # Can't be certain if unverified code is a wallet, so assume it is.
-                wallets |= set(accounts)
-            elif byte_code in NOT_WALLET_BYTECODE:
-                pass
-            else:
-                # We should never reach this!
-                raise RuntimeError(
-                    f"Unclassified Contract Bytecode:\n"
-                    f"{byte_code}\n"
-                    f"example address: {accounts[0]}"
-                )
+        """
+        Contracts without (assumed) wallet bytecode according to the bytecode index.
+        Proxies with unknown bytecode are classified by the code of their implementation.
+        Bytecode which remains unknown is not considered a wallet and is written
+        to `unknown_bytecode_file` for labelling.
+        """
+        collector: dict[str, list[tuple[str, CodeInfo]]] = defaultdict(list)
+        for account, info in self.code_info(list(contracts)).items():
+            collector[info.code_hash].append((account, info))
+
+        index = bytecode_index()
+        # Identical code delegates to the same implementation.
+        proxies = {
+            code_hash: accounts[0][1].implementation
+            for code_hash, accounts in collector.items()
+            if code_hash not in index and accounts[0][1].implementation
+        }
+        implementations = self.code_info(sorted(set(proxies.values()))) if proxies else {}
+
+        wallets, unknown = set(), []
+        for code_hash, accounts in collector.items():
+            known = index.get(code_hash)
+            if known is None and code_hash in proxies:
+                known = index.get(implementations[proxies[code_hash]].code_hash)
+            if known is None:
+                unknown.append(UnknownBytecode(
+                    code_hash=code_hash,
+                    code_length=accounts[0][1].code_length,
+                    implementation=accounts[0][1].implementation,
+                    num_accounts=len(accounts),
+                    example_account=accounts[0][0],
+                ))
+            elif known.is_wallet():
+                wallets |= {account for account, _ in accounts}
 
+        if unknown:
+            unknown.sort(key=lambda u: (-u.num_accounts, u.code_hash))
+            print(f"WARNING: {len(unknown)} unclassified contract bytecodes "
+                  f"({sum(u.num_accounts for u in unknown)} accounts) on {self.network}")
+            write_to_csv(unknown, self.unknown_bytecode_file.filename(self.network))
         print(f"found {len(wallets)} wallet contracts on {self.network}")
         return set(contracts) - wallets
 
     def _limited_balances(self, addresses: list[str]) -> dict[str, int]:
-        request_data = []
-        for index, eth_address in enumerate(addresses):
-            request_data.append({
-                "jsonrpc": "2.0",
-                "method": "eth_getBalance",
-                "params": [eth_address, "latest"],
-                "id": index
-            })
-        response = requests.post(self.node_url, json=request_data)
-        results = {}
-        for result_dict in response.json():
-            try:
-                account = addresses[result_dict['id']]
-                results[account] = int(result_dict['result'], base=16)
-            except KeyError as err:
-                raise IOError(
-                    f"Request for address \"{addresses[result_dict['id']]}\" "
-                    f"failed with response {result_dict}"
-                ) from err
-        return results
+        return {
+            account: int(balance, base=16)
+            for account, balance in self._rpc_batch("eth_getBalance", addresses).items()
+        }
 
     def get_null_balances(self, epsilon=10 ** 16) -> set[str]:
-        results = self.batch_call(self.addresses, self._limited_balances)
+        results = self.batch_call(
+            self.addresses,
+            self._limited_balances,
+            checkpoint=self.null_balance_checkpoint.filename(self.network),
+        )
 
         null_balances = sorted([Account(k) for k, v in results.items() if v < epsilon])
         print(f"found {len(null_balances)} accounts will zero balance, writing to file")
@@ -198,7 +543,7 @@ if __name__ == '__main__':
         "--request-batch-size",
         type=int,
         help="max number of requests to make at once",
-        default=10
+        default=1000
     )
     args = parser.parse_args()
     contract_detector = EvmAccountInfo(
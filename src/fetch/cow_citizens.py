@@ -3,12 +3,11 @@ Stores the resulting NFT metadata of CoW Citizens on both networks `out/citizens
 """
 from __future__ import annotations
 
-import json
 import math
 
-from web3 import Web3
-
 from src.dune_analytics import DuneAnalytics
+from src.files import File
+from src.utils.file import write_to_json
 
 
 def fetch_cow_citizens(
@@ -60,7 +59,7 @@ def fetch_cow_citizens(
         description = f"CoW Citizen - " \
                       f"Early investor in the CoW Protocol with {token} on {network}"
         citizens.append({
-            "wallet": Web3.toChecksumAddress(citizen['wallet']),
+            "wallet": citizen['wallet'],
             "tokenID": token_id,
         })
         nfts.append({
@@ -85,15 +84,9 @@ def fetch_cow_citizens(
             ]
         })
 
-    citizen_outfile = './out/citizens.json'
-    nft_outfile = './out/nfts.json'
-    print(f"Writing Citizens to {citizen_outfile}")
-    with open(citizen_outfile, 'w', encoding='utf-8') as file:
-        json.dump(citizens, file, indent=2)
-
-    print(f"Writing NFT metadata to {nft_outfile}")
-    with open(nft_outfile, 'w', encoding='utf-8') as file:
-        json.dump(nfts, file, indent=2)
+    # Wallets are checksum encoded as a whole column when written.
+    write_to_json(citizens, File("citizens.json"), checksum_columns=['wallet'])
+    write_to_json(nfts, File("nfts.json"))
 
     return citizens, nfts
 
@@ -8,7 +8,8 @@ import argparse
 import csv
 from collections import defaultdict
 from dataclasses import dataclass
-from fractions import Fraction
+from math import lcm
+from typing import Iterable
 
 from src.constants import SNAPSHOT_BLOCK_NUMBER
 from src.dune_analytics import DuneAnalytics
@@ -35,51 +36,82 @@ class LiquidityProportion(Account):
     """
     Proportion of GNO held by `account` in `pool`.
     Equivalent to the account's pool token balance over the circulating supply.
+    Both are kept as integers so positions are computed without rational arithmetic.
     """
     pool: str
-    lp_proportion: Fraction
+    lp_balance: int
+    lp_supply: int
 
-    def __init__(self, account: str, pool: str, proportion: Fraction):
+    def __init__(self, account: str, pool: str, lp_balance: int, lp_supply: int):
         Account.__init__(self, account)
         self.pool = pool.lower()
-        self.lp_proportion = proportion
+        self.lp_balance = int(lp_balance)
+        self.lp_supply = int(lp_supply)
 
     def to_liquidity_position(self, pool_gno: int) -> LiquidityPosition:
         """
-        Converts Proportion into GNO amount by multiplying `lp_proportion` by `pool_gno`
+        Converts Proportion into GNO amount: `pool_gno` * `lp_balance` / `lp_supply`
+        (rounded down).
         """
         # TODO: pass Pool { address, gno_balance } and assert(self.pool == pool.address)
-        gno_fraction = self.lp_proportion * pool_gno
         return LiquidityPosition(
             account=self.account,
             pool=self.pool,
-            gno_amount=gno_fraction.numerator // gno_fraction.denominator
+            gno_amount=(self.lp_balance * pool_gno) // self.lp_supply
         )
 
     @classmethod
     def load_from_file(cls, load_file: File) -> dict[str, list[LiquidityProportion]]:
-        """Loads liquidity proportions from filename"""
+        """
+        Loads liquidity proportions from filename.
+        Files in the legacy format (a single reduced `lp_proportion` fraction "a/b" per
+        row) are converted to integer balances over the least common denominator of
+        each pool, which yields exactly the same positions.
+        """
         print(f"Loading LP Proportions from {load_file.name}")
         results = defaultdict(list)
         with open(load_file.filename(), 'r', encoding='utf-8') as file:
             dict_reader = csv.DictReader(file)
-            for row in dict_reader:
-                try:
-                    numerator, denominator = row['lp_proportion'].split('/')
-                    proportion = Fraction(int(numerator), int(denominator))
-                except ValueError:
-                    proportion = Fraction(int(row['lp_proportion']), 1)
+            if 'lp_proportion' in (dict_reader.fieldnames or []):
+                rows = _from_legacy_proportions(dict_reader)
+            else:
+                rows = dict_reader
+            for row in rows:
                 results[row['account']].append(
                     cls(
                         account=row['account'],
                         pool=row['pool'],
-                        proportion=proportion,
+                        lp_balance=row['lp_balance'],
+                        lp_supply=row['lp_supply'],
                     )
                 )
         print(f"Loaded {len(results)} lp account records")
         return results
 
 
+def _from_legacy_proportions(rows: Iterable[dict[str, str]]) -> list[dict[str, str]]:
+    """Converts legacy "a/b" lp_proportion records into lp_balance and lp_supply"""
+    parsed, pool_denominators = [], defaultdict(set)
+    for row in rows:
+        numerator, _, denominator = row['lp_proportion'].partition('/')
+        denominator = int(denominator) if denominator else 1
+        parsed.append((row, int(numerator), denominator))
+        pool_denominators[row['pool']].add(denominator)
+    pool_supply = {
+        pool: lcm(*denominators) for pool, denominators in pool_denominators.items()
+    }
+    results = []
+    for row, numerator, denominator in parsed:
+        lp_supply = pool_supply[row['pool']]
+        results.append({
+            'account': row['account'],
+            'pool': row['pool'],
+            'lp_balance': numerator * (lp_supply // denominator),
+            'lp_supply': lp_supply,
+        })
+    return results
+
+
 @dataclass
 class GenericPool:
     """
@@ -162,13 +194,14 @@ class GenericPool:
             ]
         )
 
-        # lp_supply used to compute lp_proportion.
+        # lp_supply is the circulating supply of the pool token.
         lp_supply = sum(int(entry['lp_balance']) for entry in data_set)
         results = [
             LiquidityProportion(
                 account=entry['account'],
                 pool=self.address,
-                proportion=Fraction(int(entry['lp_balance']), lp_supply)
+                lp_balance=entry['lp_balance'],
+                lp_supply=lp_supply,
             )
             for entry in data_set
         ]
@@ -201,7 +234,8 @@ def fetch_lp_holders(
     for pool in pool_list:
         results += pool.fetch_lp_holders(dune, block_number)
 
-    results.sort(key=lambda t: (t.pool, -t.lp_proportion))
+    # All entries of a pool share the same lp_supply
+    results.sort(key=lambda t: (t.pool, -t.lp_balance))
     write_to_csv(data_list=results, outfile=network_file)
     return index_by_account_with_multiplicity(results)
 
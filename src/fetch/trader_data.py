@@ -4,20 +4,28 @@ Stores the result of querying trader data on each network into respectively name
 """
 from __future__ import annotations
 
+import argparse
 import csv
 import os
+import tempfile
+from array import array
+from bisect import bisect_right
 from collections import defaultdict
-from dataclasses import dataclass
-from datetime import date, datetime
-from typing import Optional
+from dataclasses import dataclass, fields
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Sequence
 
 from src.constants import VOLUME_TIERS, TRADING_TIER_FACTORS, SNAPSHOT_BLOCK_NUMBER, \
     USER_OPTION_TIER_FACTORS
 from src.dune_analytics import DuneAnalytics
 from src.fetch.combined_holders import load_excluded_accounts
 from src.files import NetworkFile, TraderFiles, File
-from src.models import Account, Allocation
-from src.utils.data import dump_results_and_index_by_account, write_to_csv
+from src.models import Account
+from src.utils.file import open_database
+from src.utils.external_sort import ExternalSorter, merge_join, read_csv_rows, \
+    sorted_file
 
 
 @dataclass
@@ -50,6 +58,19 @@ TRADER_PARAMETERS = DuneTradeParameters(
 )
 
 
+def allocation_tier(eligible_volume: int) -> int:
+    """
+    Index of the largest VOLUME_TIERS boundary not exceeding `eligible_volume`.
+    Volumes below the lowest boundary have tier -1.
+    """
+    return bisect_right(VOLUME_TIERS, eligible_volume) - 1
+
+
+def allocation_tiers(eligible_volumes: Iterable[int]) -> list[int]:
+    """Assigns allocation tiers to a whole column of volumes"""
+    return [bisect_right(VOLUME_TIERS, volume) - 1 for volume in eligible_volumes]
+
+
 # pylint: disable=too-few-public-methods
 class AllocationTiers:
     """
@@ -106,23 +127,33 @@ class CowSwapTrader(Account):
             num_trades: int,
             first_trade: Optional[date],
             last_trade: Optional[date],
+            tier: Optional[int] = None,
     ):
         Account.__init__(self, account)
         self.eligible_volume = eligible_volume
         self.num_trades = int(num_trades)
         self.first_trade = first_trade
         self.last_trade = last_trade
-        self.allocation_tier = self._compute_allocation_tier()
+        # Tier may be passed in when it was already assigned in bulk.
+        self.allocation_tier = allocation_tier(eligible_volume) if tier is None else tier
+
+    @property
+    def eligibility_criteria(self) -> list[bool]:
+        """Primary criteria (volume, trades, days) defined by TRADER_PARAMETERS"""
         days_between = self.days_between_first_and_last() or -1
-        self.eligibility_criteria = [
+        return [
             self.eligible_volume >= TRADER_PARAMETERS.min_volume,
             self.num_trades >= TRADER_PARAMETERS.primary_min_trades,
             days_between >= TRADER_PARAMETERS.days_between,
         ]
-        self.consolation_criteria = [
-                self.eligible_volume >= TRADER_PARAMETERS.min_volume,
-                self.num_trades >= TRADER_PARAMETERS.consolation_min_trades
-            ]
+
+    @property
+    def consolation_criteria(self) -> list[bool]:
+        """Consolation criteria (volume, trades) defined by TRADER_PARAMETERS"""
+        return [
+            self.eligible_volume >= TRADER_PARAMETERS.min_volume,
+            self.num_trades >= TRADER_PARAMETERS.consolation_min_trades
+        ]
 
     @classmethod
     def load_from_file(cls, load_file: File) -> dict[str, CowSwapTrader]:
@@ -132,25 +163,32 @@ class CowSwapTrader(Account):
         with open(load_file.filename(), 'r', encoding='utf-8') as file:
             dict_reader = csv.DictReader(file)
             for row in dict_reader:
-                account = row['account']
-                results[account] = cls(
-                    account=account,
-                    eligible_volume=int(row['eligible_volume']),
-                    num_trades=int(row['num_trades']),
-                    first_trade=datetime.strptime(row['first_trade'],
-                                                  "%Y-%m-%d").date(),
-                    last_trade=datetime.strptime(row['last_trade'], "%Y-%m-%d").date(),
-                )
+                trader = cls.from_row(row)
+                results[trader.account] = trader
         print(f"Loaded {len(results)} trader records")
         return results
 
-    def _compute_allocation_tier(self) -> int:
-        if self.eligible_volume < VOLUME_TIERS[0]:
-            return -1
-        for i in range(len(VOLUME_TIERS) - 1):
-            if VOLUME_TIERS[i] <= self.eligible_volume < VOLUME_TIERS[i + 1]:
-                return i
-        return len(VOLUME_TIERS) - 1
+    @classmethod
+    def from_row(cls, row: dict[str, str]) -> CowSwapTrader:
+        """Parses a csv record written in CowSwapTrader format"""
+        # Trader files are written with their tier, so it need not be recomputed
+        stored_tier = row.get('allocation_tier')
+        return cls(
+            account=row['account'],
+            eligible_volume=int(row['eligible_volume']),
+            num_trades=int(row['num_trades']),
+            first_trade=date.fromisoformat(row['first_trade']),
+            last_trade=date.fromisoformat(row['last_trade']),
+            tier=int(stored_tier) if stored_tier else None,
+        )
+
+    def to_row(self) -> dict[str, str]:
+        """csv record of trader (as written by write_to_csv)"""
+        values = (getattr(self, field.name) for field in fields(self))
+        return {
+            field.name: '' if value is None else str(value)
+            for field, value in zip(fields(self), values)
+        }
 
     def days_between_first_and_last(self):
         """Number of days between first and last trade"""
@@ -192,51 +230,6 @@ class CowSwapTrader(Account):
             )
         return is_eligible
 
-    def to_user_option(
-            self,
-            total_weight: int,
-            supply: int
-    ) -> Allocation:
-        """
-        Converts Trader to User Option based on their allocation factor
-        """
-        assert self.is_eligible(), f"{self} not eligible for primary allocation"
-        # KeyError not possible here because above assertion ensures key exists.
-        allocation_factor = USER_OPTION_TIER_FACTORS[self.allocation_tier]
-        return Allocation(
-            account=self.account,
-            amount=(supply * allocation_factor) // total_weight,
-        )
-
-    def to_primary_allocation(
-            self,
-            total_weight: int,
-            supply: int
-    ) -> Allocation:
-        """
-        Converts Trader to Primary Allocation based on their allocation factor
-        """
-        assert self.is_eligible(), f"{self} not eligible for primary allocation"
-        # KeyError not possible here because above assertion ensures key exists.
-        allocation_factor = TRADING_TIER_FACTORS[self.allocation_tier]
-        return Allocation(
-            account=self.account,
-            amount=(supply * allocation_factor) // total_weight,
-        )
-
-    def to_consolation_allocation(
-            self, num_recipients: int,
-            supply: int
-    ) -> Allocation:
-        """
-        Converts Trader to Consolation Allocation number of recipients and total supply
-        """
-        assert not self.is_eligible(), f"{self} not eligible for consolation allocation"
-        return Allocation(
-            account=self.account,
-            amount=supply // num_recipients,
-        )
-
     @classmethod
     def default_for_account(cls, account: str) -> CowSwapTrader:
         return cls(
@@ -266,46 +259,421 @@ class CowSwapTrader(Account):
                        f"  trades: {consolation_trades}"
         return results
 
-    @classmethod
-    def load_and_merge_network_trader_data(
-            cls,
-            mainnet_file: File,
-            gchain_file: File
-    ) -> dict[str, CowSwapTrader]:
-        mainnet_traders = CowSwapTrader.load_from_file(mainnet_file)
-        gchain_traders = CowSwapTrader.load_from_file(gchain_file)
-        results = {}
-        for account in mainnet_traders.keys() | gchain_traders.keys():
-            mainnet_entry = mainnet_traders.pop(
-                account,
-                CowSwapTrader.default_for_account(account)
+
+def eligibility_masks(
+        eligible_volumes: Sequence[int],
+        num_trades: Sequence[int],
+        days_between: Sequence[int],
+        parameters: DuneTradeParameters = TRADER_PARAMETERS,
+) -> tuple[list[bool], list[bool]]:
+    """
+    Evaluates the primary and consolation criteria over aligned trader columns.
+    :param days_between: days between first and last trade (-1 when zero or unknown)
+    :return: boolean columns (primary, consolation).
+        Primary traders are never consolation traders.
+    """
+    meets_volume = [volume >= parameters.min_volume for volume in eligible_volumes]
+    primary = [
+        volume_met
+        and trades >= parameters.primary_min_trades
+        and days >= parameters.days_between
+        for volume_met, trades, days in zip(meets_volume, num_trades, days_between)
+    ]
+    consolation = [
+        not is_primary
+        and (volume_met or trades >= parameters.consolation_min_trades)
+        for is_primary, volume_met, trades in zip(primary, meets_volume, num_trades)
+    ]
+    return primary, consolation
+
+
+def _to_ordinal(trade_date: Optional[date]) -> int:
+    return trade_date.toordinal() if trade_date is not None else 0
+
+
+def _from_ordinal(ordinal: int) -> Optional[date]:
+    return date.fromordinal(ordinal) if ordinal else None
+
+
+# pylint: disable=too-many-public-methods
+class TraderTable:
+    """
+    Columnar storage of trader data with one array per CowSwapTrader field.
+    Accounts are packed as raw 20 byte addresses and trade dates as day ordinals
+    (0 when unknown). `CowSwapTrader` views are only built on demand.
+    """
+    ADDRESS_BYTES = 20
+
+    def __init__(self):
+        self.account_bytes = bytearray()
+        self.eligible_volume = array('q')
+        self.num_trades = array('q')
+        self.first_trade = array('i')
+        self.last_trade = array('i')
+        self.allocation_tier = array('b')
+        self._index: Optional[dict[bytes, int]] = None
+
+    def __len__(self):
+        return len(self.eligible_volume)
+
+    # pylint: disable=too-many-arguments
+    def append(
+            self,
+            account: str,
+            eligible_volume: int,
+            num_trades: int,
+            first_trade: Optional[date],
+            last_trade: Optional[date],
+            tier: Optional[int] = None,
+    ):
+        """Appends a single row (computing its tier if not provided)"""
+        self.append_raw(
+            bytes.fromhex(account[2:]),
+            eligible_volume,
+            num_trades,
+            _to_ordinal(first_trade),
+            _to_ordinal(last_trade),
+            allocation_tier(eligible_volume) if tier is None else tier,
+        )
+
+    def append_raw(self, raw_account: bytes, *values: int):
+        """Appends a row in storage format (raw account followed by `row_values`)"""
+        assert len(raw_account) == self.ADDRESS_BYTES, f"Invalid account {raw_account}"
+        self.account_bytes += raw_account
+        volume, trades, first_trade, last_trade, tier = values
+        self.eligible_volume.append(volume)
+        self.num_trades.append(trades)
+        self.first_trade.append(first_trade)
+        self.last_trade.append(last_trade)
+        self.allocation_tier.append(tier)
+        self._index = None
+
+    def raw_account(self, row: int) -> bytes:
+        """Account at `row` as raw bytes"""
+        start = row * self.ADDRESS_BYTES
+        return bytes(self.account_bytes[start:start + self.ADDRESS_BYTES])
+
+    def account(self, row: int) -> str:
+        """Account at `row` as a lower case hex string"""
+        return "0x" + self.raw_account(row).hex()
+
+    def accounts(self) -> list[str]:
+        """The account column as lower case hex strings"""
+        return [self.account(row) for row in range(len(self))]
+
+    def index(self) -> dict[bytes, int]:
+        """Row number by raw account (raises on duplicate accounts)"""
+        if self._index is None:
+            index = {self.raw_account(row): row for row in range(len(self))}
+            if len(index) != len(self):
+                raise IndexError("Attempting to index trader table with duplicate accounts")
+            self._index = index
+        return self._index
+
+    def assign_tiers(self, rows: Optional[Iterable[int]] = None):
+        """(Re)computes the tier column from the volume column (optionally only `rows`)"""
+        if rows is None:
+            self.allocation_tier = array('b', allocation_tiers(self.eligible_volume))
+            return
+        for row in rows:
+            self.allocation_tier[row] = allocation_tier(self.eligible_volume[row])
+
+    def copy(self) -> TraderTable:
+        """Independent copy of the table"""
+        results = TraderTable()
+        results.account_bytes = bytearray(self.account_bytes)
+        results.eligible_volume = array('q', self.eligible_volume)
+        results.num_trades = array('q', self.num_trades)
+        results.first_trade = array('i', self.first_trade)
+        results.last_trade = array('i', self.last_trade)
+        results.allocation_tier = array('b', self.allocation_tier)
+        return results
+
+    def fold(self, other: TraderTable) -> list[int]:
+        """
+        Folds trader aggregates from `other` into this table (in place): volume and
+        trade counts are summed, first and last trade are the earliest and latest.
+        Accounts not yet present are appended.
+        Tiers are only recomputed for the affected rows.
+        :return: rows of this table which were changed or added
+        """
+        was_indexed = self._index is not None
+        index = self.index()
+        changed = []
+        for row in range(len(other)):
+            raw_account = other.raw_account(row)
+            volume, trades, first_trade, last_trade, _ = other.row_values(row)
+            target = index.get(raw_account)
+            if target is None:
+                target = len(self)
+                self.append_raw(raw_account, volume, trades, first_trade, last_trade, -1)
+                index[raw_account] = target
+            else:
+                self.eligible_volume[target] += volume
+                self.num_trades[target] += trades
+                self.first_trade[target] = min(
+                    (d for d in (self.first_trade[target], first_trade) if d), default=0
+                )
+                self.last_trade[target] = max(self.last_trade[target], last_trade)
+            changed.append(target)
+        # The account index is only kept if it was already in use.
+        self._index = index if was_indexed else None
+        self.assign_tiers(changed)
+        return changed
+
+    def days_between(self) -> list[int]:
+        """
+        Days between first and last trade, using -1 when unknown or zero
+        (consistent with CowSwapTrader.eligibility_criteria)
+        """
+        return [
+            (last - first if first else 0) or -1
+            for first, last in zip(self.first_trade, self.last_trade)
+        ]
+
+    def eligibility_masks(
+            self,
+            parameters: DuneTradeParameters = TRADER_PARAMETERS
+    ) -> tuple[list[bool], list[bool]]:
+        """Primary and consolation boolean columns for the table"""
+        primary, consolation = eligibility_masks(
+            self.eligible_volume,
+            self.num_trades,
+            self.days_between(),
+            parameters,
+        )
+        if any(is_primary and tier not in TRADING_TIER_FACTORS
+               for is_primary, tier in zip(primary, self.allocation_tier)):
+            raise ValueError(
+                "Trader meets eligibility criteria, but has invalid allocation tier!"
             )
-            gchain_entry = gchain_traders.pop(
-                account,
-                CowSwapTrader.default_for_account(account)
+        return primary, consolation
+
+    def account_mask(self, accounts: set[str]) -> list[bool]:
+        """
+        Boolean column marking rows whose account is in `accounts`.
+        Accounts are compared as strings (i.e. only lower case entries can match).
+        """
+        raw_accounts = set()
+        for account in accounts:
+            if account.startswith('0x') and account == account.lower():
+                try:
+                    raw_accounts.add(bytes.fromhex(account[2:]))
+                except ValueError:
+                    continue
+        return [self.raw_account(row) in raw_accounts for row in range(len(self))]
+
+    def select(self, mask: Sequence[bool]) -> TraderTable:
+        """New table containing only the rows where `mask` is True"""
+        results = TraderTable()
+        for row, selected in enumerate(mask):
+            if selected:
+                results.append_raw(self.raw_account(row), *self.row_values(row))
+        return results
+
+    def row_values(self, row: int) -> tuple[int, int, int, int, int]:
+        """(volume, trades, first trade ordinal, last trade ordinal, tier) of `row`"""
+        return (
+            self.eligible_volume[row],
+            self.num_trades[row],
+            self.first_trade[row],
+            self.last_trade[row],
+            self.allocation_tier[row],
+        )
+
+    def tier_histogram(self) -> defaultdict[int, int]:
+        """Number of traders in each allocation tier"""
+        histogram = defaultdict(int)
+        for tier in self.allocation_tier:
+            histogram[tier] += 1
+        return histogram
+
+    def trader(self, row: int) -> CowSwapTrader:
+        """CowSwapTrader view of `row`"""
+        return CowSwapTrader(
+            account=self.account(row),
+            eligible_volume=self.eligible_volume[row],
+            num_trades=self.num_trades[row],
+            first_trade=_from_ordinal(self.first_trade[row]),
+            last_trade=_from_ordinal(self.last_trade[row]),
+            tier=self.allocation_tier[row],
+        )
+
+    def get(self, account: str, default=None) -> Optional[CowSwapTrader]:
+        """CowSwapTrader view for `account` (or `default` when not present)"""
+        try:
+            row = self.index().get(bytes.fromhex(account.lower()[2:]))
+        except ValueError:
+            row = None
+        return default if row is None else self.trader(row)
+
+    def _sorted_rows(self) -> list[int]:
+        """Row order by volume descending then account"""
+        return sorted(
+            range(len(self)),
+            key=lambda row: (-self.eligible_volume[row], self.raw_account(row))
+        )
+
+    def write_to_csv(self, outfile: File):
+        """Writes the table (sorted by volume descending) in CowSwapTrader format"""
+        if len(self) == 0:
+            print("No data in list, skipping write")
+            return
+        print(f"dumping {len(self)} results to {outfile.name}")
+        if not os.path.exists(outfile.path):
+            os.makedirs(outfile.path)
+        with open(outfile.filename(), 'w', encoding='utf-8') as out_file:
+            writer = csv.writer(out_file, lineterminator='\n')
+            writer.writerow([f.name for f in fields(CowSwapTrader)])
+            for row in self._sorted_rows():
+                volume, trades, first_trade, last_trade, tier = self.row_values(row)
+                writer.writerow([
+                    self.account(row),
+                    volume,
+                    trades,
+                    _from_ordinal(first_trade),
+                    _from_ordinal(last_trade),
+                    tier,
+                ])
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> TraderTable:
+        """Builds table from trader query records (assigning tiers in bulk)"""
+        results = cls()
+        for entry in records:
+            results.append_raw(
+                bytes.fromhex(entry['trader'][2:]),
+                int(entry['eligible_volume']),
+                int(entry['num_trades']),
+                date.fromisoformat(entry['first_trade']).toordinal(),
+                date.fromisoformat(entry['last_trade']).toordinal(),
+                -1,
             )
+        results.assign_tiers()
+        return results
 
-            combined_entry = mainnet_entry.merge(gchain_entry)
-            results[account] = combined_entry
+    @classmethod
+    def load_from_file(cls, load_file: File) -> TraderTable:
+        """Loads trader table from a file written in CowSwapTrader format"""
+        print(f"Loading Trader Data from {load_file.name}")
+        results = cls()
+        with open(load_file.filename(), 'r', encoding='utf-8') as file:
+            dict_reader = csv.DictReader(file)
+            has_tiers = 'allocation_tier' in (dict_reader.fieldnames or [])
+            for row in dict_reader:
+                results.append_raw(
+                    bytes.fromhex(row['account'][2:]),
+                    int(row['eligible_volume']),
+                    int(row['num_trades']),
+                    date.fromisoformat(row['first_trade']).toordinal(),
+                    date.fromisoformat(row['last_trade']).toordinal(),
+                    int(row['allocation_tier']) if has_tiers else -1,
+                )
+        if not has_tiers:
+            results.assign_tiers()
+        results.index()
+        print(f"Loaded {len(results)} trader records")
         return results
 
+    @classmethod
+    def merge(cls, mainnet: TraderTable, gchain: TraderTable) -> TraderTable:
+        """
+        Merges trader data from both networks (summing volume and trades and taking
+        the earliest first and latest last trade). Tiers are reassigned for traders
+        whose combined volume differs from their mainnet volume.
+        """
+        results = mainnet.copy()
+        results.fold(gchain)
+        return results
+
+    @classmethod
+    def load_and_merge(cls, mainnet_file: File, gchain_file: File) -> TraderTable:
+        """Loads trader data for both networks and merges them"""
+        return cls.merge(
+            mainnet=cls.load_from_file(mainnet_file),
+            gchain=cls.load_from_file(gchain_file),
+        )
+
+
+def load_watermarks(
+        load_file: File,
+        defaults: Optional[dict[str, str]] = None,
+) -> dict[str, int]:
+    """
+    Loads the block number (per network) up to which trader data was aggregated.
+    Networks without a recorded watermark default to `defaults`
+    (by default their snapshot block).
+    """
+    defaults = SNAPSHOT_BLOCK_NUMBER if defaults is None else defaults
+    watermarks = {network: int(block) for network, block in defaults.items()}
+    try:
+        with open(load_file.filename(), 'r', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                watermarks[row['network']] = int(row['block_number'])
+    except FileNotFoundError:
+        print(f"No trader watermarks at {load_file.name}")
+    return watermarks
+
+
+def write_watermark(network: str, block_number: int, outfile: File):
+    """Records `block_number` as the watermark of `network` (keeping all others)"""
+    watermarks = load_watermarks(outfile, defaults={})
+    watermarks[network] = int(block_number)
+    if not os.path.exists(outfile.path):
+        os.makedirs(outfile.path)
+    with open(outfile.filename(), 'w', encoding='utf-8') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['network', 'block_number'])
+        writer.writerows(sorted(watermarks.items()))
+
+
+def check_snapshot_watermarks(load_file: File, networks: Iterable[str]):
+    """
+    Raises ValueError unless the trader data of all `networks` was aggregated
+    up to (exactly) their snapshot block.
+    """
+    watermarks = load_watermarks(load_file)
+    for network in networks:
+        if watermarks[network] != int(SNAPSHOT_BLOCK_NUMBER[network]):
+            raise ValueError(
+                f"{network} trader data is aggregated up to block {watermarks[network]}, "
+                f"not the snapshot block {SNAPSHOT_BLOCK_NUMBER[network]}"
+            )
+
+
+def _trader_query_parameters(block_number: str) -> list[dict[str, str]]:
+    return [
+        {
+            "key": "BlockNumber",
+            "type": "number",
+            "value": block_number,
+        },
+        {
+            "key": "StableFactor",
+            "type": "number",
+            "value": TRADER_PARAMETERS.stable_factor,
+        },
+    ]
+
 
 def fetch_trader_data(
         dune: DuneAnalytics,
         network: str,
         block_number: str,
         load_from: NetworkFile,
-) -> dict[str, CowSwapTrader]:
+        watermarks: Optional[File] = None,
+) -> TraderTable:
     """
     :param dune: open connection to dune analytics
     :param network: should be 'mainnet' or 'gchain'
     :param block_number: str representation of an integer ethereum block number
     :param load_from: File to load from (todo - load from).
-    :return: collection of `CowSwapTrader` on `network` at `block_number`
+    :param watermarks: File recording `block_number` when fetched from dune
+    :return: table of trader data on `network` at `block_number`
     """
     network_file = load_from.filename(network)
     try:
-        return CowSwapTrader.load_from_file(network_file)
+        return TraderTable.load_from_file(network_file)
     except FileNotFoundError:
         print(f"file at {network_file.name} not found. Fetching from Dune")
 
@@ -314,32 +682,263 @@ def fetch_trader_data(
         query_filepath="./queries/generic_trader_data.sql",
         network=network,
         name="trader data",
+        parameters=_trader_query_parameters(block_number)
+    )
+    results = TraderTable.from_records(data_set)
+    results.index()  # No duplicate accounts!
+    results.write_to_csv(network_file)
+    if watermarks is not None:
+        write_watermark(network, int(block_number), watermarks)
+    return results
+
+
+@dataclass
+class TraderVolume:
+    """
+    Unrounded trade aggregates of a single trader, as accumulated by
+    `refresh_trader_data`. The stable factor is only applied (and the result rounded)
+    after folding, so folded aggregates match a full fetch.
+    """
+    non_stable_volume: Decimal
+    stable_volume: Decimal
+    num_trades: int
+    first_trade: date
+    last_trade: date
+
+    @classmethod
+    def from_record(cls, record: dict) -> TraderVolume:
+        """Parses a record of ./queries/generic_trader_data_delta.sql (or its csv row)"""
+        return cls(
+            non_stable_volume=Decimal(str(record['non_stable_volume'])),
+            stable_volume=Decimal(str(record['stable_volume'])),
+            num_trades=int(record['num_trades']),
+            first_trade=date.fromisoformat(record['first_trade']),
+            last_trade=date.fromisoformat(record['last_trade']),
+        )
+
+    def fold(self, other: TraderVolume):
+        """Adds the aggregates of `other` (for the same trader) in place"""
+        self.non_stable_volume += other.non_stable_volume
+        self.stable_volume += other.stable_volume
+        self.num_trades += other.num_trades
+        self.first_trade = min(self.first_trade, other.first_trade)
+        self.last_trade = max(self.last_trade, other.last_trade)
+
+    def eligible_volume(self, stable_factor: str) -> int:
+        """
+        Volume with stable trades weighted by `stable_factor`, rounded half away
+        from zero (as numeric::integer in ./queries/generic_trader_data.sql)
+        """
+        volume = self.non_stable_volume + Decimal(stable_factor) * self.stable_volume
+        return int(volume.to_integral_value(rounding=ROUND_HALF_UP))
+
+    def has_volume(self) -> bool:
+        """Traders without any volume are left out of trader data"""
+        return self.non_stable_volume + self.stable_volume > 0
+
+
+# Max number of traders per lookup query (bound by sqlite's max host parameters)
+LOOKUP_CHUNK_SIZE = 500
+
+
+class TraderVolumeStore:
+    """
+    Unrounded trader aggregates (per network) in sqlite, along with the block up to
+    which (exclusive) they were aggregated and the eligible volume and tier derived
+    from them. Folding updates only the rows of the traders involved, so neither the
+    stored aggregates nor the tiers of unchanged traders are rewritten.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = open_database(
+            path,
+            "volumes (network TEXT, trader TEXT, non_stable_volume TEXT, "
+            "stable_volume TEXT, num_trades INTEGER, first_trade TEXT, last_trade TEXT, "
+            "eligible_volume INTEGER, allocation_tier INTEGER, has_volume INTEGER, "
+            "PRIMARY KEY (network, trader))"
+        )
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks "
+                "(network TEXT PRIMARY KEY, block_number INTEGER, stable_factor TEXT)"
+            )
+
+    def watermark(self, network: str) -> Optional[tuple[int, str]]:
+        """Block and stable factor of the stored aggregates of `network` (if any)"""
+        row = self._connection.execute(
+            "SELECT block_number, stable_factor FROM watermarks WHERE network = ?",
+            (network,)
+        ).fetchone()
+        return None if row is None else (int(row[0]), row[1])
+
+    def lookup(self, network: str, traders: Iterable[str]) -> dict[str, TraderVolume]:
+        """Stored aggregates of `traders` on `network`"""
+        traders = list(traders)
+        results = {}
+        for start in range(0, len(traders), LOOKUP_CHUNK_SIZE):
+            chunk = traders[start:start + LOOKUP_CHUNK_SIZE]
+            rows = self._connection.execute(
+                "SELECT trader, non_stable_volume, stable_volume, num_trades, "
+                "first_trade, last_trade FROM volumes "
+                f"WHERE network = ? AND trader IN ({','.join('?' * len(chunk))})",
+                (network, *chunk)
+            )
+            for trader, *values in rows:
+                results[trader] = TraderVolume.from_record(
+                    dict(zip([f.name for f in fields(TraderVolume)], values))
+                )
+        return results
+
+    def _store(
+            self,
+            network: str,
+            volumes: dict[str, TraderVolume],
+            stable_factor: str,
+    ):
+        """Upserts `volumes` along with their (re)computed eligible volume and tier"""
+        rows = []
+        for trader, volume in volumes.items():
+            eligible_volume = volume.eligible_volume(stable_factor)
+            rows.append((
+                network, trader, str(volume.non_stable_volume), str(volume.stable_volume),
+                volume.num_trades, volume.first_trade.isoformat(),
+                volume.last_trade.isoformat(), eligible_volume,
+                allocation_tier(eligible_volume), int(volume.has_volume()),
+            ))
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO volumes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def fold(
+            self,
+            network: str,
+            block_number: int,
+            deltas: Iterable[dict],
+            stable_factor: str,
+    ) -> int:
+        """
+        Folds `deltas` (records of ./queries/generic_trader_data_delta.sql) into the
+        aggregates of `network` and records `block_number` as their watermark,
+        in a single transaction.
+        :return: number of traders whose aggregates changed
+        """
+        changed: dict[str, TraderVolume] = {}
+        for record in deltas:
+            delta = TraderVolume.from_record(record)
+            if record['trader'] in changed:
+                changed[record['trader']].fold(delta)
+            else:
+                changed[record['trader']] = delta
+        stored = self.lookup(network, changed)
+        for trader, volume in stored.items():
+            volume.fold(changed[trader])
+            changed[trader] = volume
+        with self._connection:
+            self._restate(network, stable_factor)
+            self._store(network, changed, stable_factor)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                (network, int(block_number), stable_factor)
+            )
+        return len(changed)
+
+    def _restate(self, network: str, stable_factor: str):
+        """Recomputes all eligible volumes and tiers when the stable factor changed"""
+        watermark = self.watermark(network)
+        if watermark is None or watermark[1] == stable_factor:
+            return
+        print(f"Stable factor changed from {watermark[1]} to {stable_factor}, "
+              f"recomputing all {network} trader tiers")
+        traders = [
+            row[0] for row in self._connection.execute(
+                "SELECT trader FROM volumes WHERE network = ?", (network,)
+            )
+        ]
+        self._store(network, self.lookup(network, traders), stable_factor)
+        self._connection.execute(
+            "UPDATE watermarks SET stable_factor = ? WHERE network = ?",
+            (stable_factor, network)
+        )
+
+    def restate(self, network: str, stable_factor: str):
+        """Brings the derived columns of `network` in line with `stable_factor`"""
+        with self._connection:
+            self._restate(network, stable_factor)
+
+    def table(self, network: str) -> TraderTable:
+        """
+        Trader table of `network` with the stored tiers.
+        As in a full fetch, traders without any volume are left out.
+        """
+        results = TraderTable()
+        rows = self._connection.execute(
+            "SELECT trader, eligible_volume, num_trades, first_trade, last_trade, "
+            "allocation_tier FROM volumes WHERE network = ? AND has_volume "
+            "ORDER BY trader",
+            (network,)
+        )
+        for trader, volume, trades, first_trade, last_trade, tier in rows:
+            results.append_raw(
+                bytes.fromhex(trader[2:]),
+                volume,
+                trades,
+                date.fromisoformat(first_trade).toordinal(),
+                date.fromisoformat(last_trade).toordinal(),
+                tier,
+            )
+        return results
+
+
+def refresh_trader_data(
+        dune: DuneAnalytics,
+        network: str,
+        block_number: str,
+        load_from: TraderFiles,
+        stable_factor: str = TRADER_PARAMETERS.stable_factor,
+) -> TraderTable:
+    """
+    Brings the refreshed trader aggregates on `network` up to `block_number` by only
+    fetching trades after their watermark (all trades on the first refresh).
+    Only traders with new trades are updated (and retiered).
+    Aggregates are kept in `load_from.refreshed_volumes`, separate from the
+    snapshot trader data, which is never modified.
+    :return: table of trader data on `network` at `block_number`
+    """
+    store = TraderVolumeStore(load_from.refreshed_volumes.filename())
+    stored = store.watermark(network)
+    watermark = None if stored is None else stored[0]
+    if watermark is not None and int(block_number) < watermark:
+        raise ValueError(
+            f"{network} trader data is already aggregated up to block {watermark}"
+        )
+    if watermark == int(block_number):
+        print(f"{network} trader data already aggregated up to block {watermark}")
+        store.restate(network, stable_factor)
+        return store.table(network)
+
+    start_block = watermark or 0
+    deltas = dune.fetch(
+        query_filepath="./queries/generic_trader_data_delta.sql",
+        network=network,
+        name=f"trader data since block {start_block}",
         parameters=[
             {
-                "key": "BlockNumber",
+                "key": "StartBlock",
                 "type": "number",
-                "value": block_number,
+                "value": str(start_block),
             },
             {
-                "key": "StableFactor",
+                "key": "BlockNumber",
                 "type": "number",
-                "value": TRADER_PARAMETERS.stable_factor,
+                "value": block_number,
             },
         ]
     )
-    results = sorted([
-        CowSwapTrader(
-            account=entry['trader'],
-            eligible_volume=int(entry['eligible_volume']),
-            num_trades=int(entry['num_trades']),
-            first_trade=datetime.strptime(entry['first_trade'], "%Y-%m-%d").date(),
-            last_trade=datetime.strptime(entry['last_trade'], "%Y-%m-%d").date(),
-        ) for entry in data_set
-    ], key=lambda t: (-t.eligible_volume, t.account))
-    return dump_results_and_index_by_account(
-        file=load_from.filename(network),
-        results=results
-    )
+    changed = store.fold(network, int(block_number), deltas, stable_factor)
+    print(f"Folded {len(deltas)} trader updates since block {start_block} "
+          f"({changed} traders changed)")
+    return store.table(network)
 
 
 @dataclass
@@ -347,67 +946,218 @@ class EligibleTraderData:
     """Blob of Trader Data sufficient to generate Allocations"""
     primary_tier_total: int
     user_option_tier_total: int
-    primary_traders: list[CowSwapTrader]
-    consolation_traders: list[CowSwapTrader]
+    primary_traders: TraderTable
+    consolation_traders: TraderTable
 
 
 def fetch_combined(
         dune: DuneAnalytics,
         load_from: TraderFiles,
 ) -> EligibleTraderData:
-    """Fetches trader data for both networks and combines them."""
-    network_results = {}
-    account_set = set()
-    for chain in ['mainnet', 'gchain']:
-        network_results[chain] = fetch_trader_data(
+    """
+    Fetches trader data for both networks and combines them.
+    Raises ValueError if the stored trader data is not at the snapshot block.
+    """
+    network_results = {
+        chain: fetch_trader_data(
             dune=dune,
             network=chain,
             block_number=SNAPSHOT_BLOCK_NUMBER[chain],
-            load_from=load_from.traders
+            load_from=load_from.traders,
+            watermarks=load_from.watermarks,
         )
-        account_set |= set(network_results[chain].keys())
-
-    primary, consolation, tier_counts = [], [], defaultdict(int)
-    excluded_accounts = load_excluded_accounts()
-    for account in account_set - excluded_accounts:
-        mainnet_entry = network_results['mainnet'].pop(account, None)
-        gchain_entry = network_results['gchain'].pop(account, None)
-
-        if mainnet_entry is not None and gchain_entry is not None:
-            user_entry = mainnet_entry.merge(gchain_entry)
-        elif mainnet_entry is not None:
-            user_entry = mainnet_entry
-        elif gchain_entry is not None:
-            user_entry = gchain_entry
-        else:
-            # Should never happen (account set is the union of the two dicts)
-            raise KeyError(f"Account {account} missing from both networks!")
+        for chain in ['mainnet', 'gchain']
+    }
+    check_snapshot_watermarks(load_from.watermarks, network_results)
+    results = combine_eligible(network_results['mainnet'], network_results['gchain'])
+    results.primary_traders.write_to_csv(load_from.primary_trader)
+    results.consolation_traders.write_to_csv(load_from.consolation_trader)
+    return results
 
-        if user_entry.is_eligible():
-            tier_counts[user_entry.allocation_tier] += 1
-            primary.append(user_entry)
-        else:
-            if any(user_entry.consolation_criteria):
-                consolation.append(user_entry)
-
-    allocation_tiers = AllocationTiers(tier_counts)
-    print(f"Tier Count for this dataset\n{allocation_tiers}")
-    write_to_csv(
-        data_list=sorted(primary, key=lambda t: (-t.eligible_volume, t.account)),
-        outfile=load_from.primary_trader
-    )
-    write_to_csv(
-        data_list=sorted(consolation, key=lambda t: (-t.eligible_volume, t.account)),
-        outfile=load_from.consolation_trader
-    )
+
+def refresh_combined(
+        dune: DuneAnalytics,
+        load_from: TraderFiles,
+        block_numbers: dict[str, str],
+) -> EligibleTraderData:
+    """
+    Incremental counterpart of `fetch_combined`: refreshes the trader data of both
+    networks up to `block_numbers` (see refresh_trader_data) and combines them.
+    Snapshot trader data and its outputs are left untouched.
+    """
+    network_results = {
+        chain: refresh_trader_data(
+            dune=dune,
+            network=chain,
+            block_number=block_numbers[chain],
+            load_from=load_from,
+        )
+        for chain in ['mainnet', 'gchain']
+    }
+    return combine_eligible(network_results['mainnet'], network_results['gchain'])
+
+
+def combine_eligible(mainnet: TraderTable, gchain: TraderTable) -> EligibleTraderData:
+    """Merges trader data of both networks and selects the eligible traders"""
+    combined = TraderTable.merge(mainnet=mainnet, gchain=gchain)
+    excluded = combined.account_mask(load_excluded_accounts())
+    primary_mask, consolation_mask = combined.eligibility_masks()
+    primary = combined.select([
+        is_primary and not is_excluded
+        for is_primary, is_excluded in zip(primary_mask, excluded)
+    ])
+    consolation = combined.select([
+        is_consolation and not is_excluded
+        for is_consolation, is_excluded in zip(consolation_mask, excluded)
+    ])
+
+    tiers = AllocationTiers(primary.tier_histogram())
+    print(f"Tier Count for this dataset\n{tiers}")
     return EligibleTraderData(
-        primary_tier_total=allocation_tiers.primary_total_weight,
-        user_option_tier_total=allocation_tiers.user_option_weight,
+        primary_tier_total=tiers.primary_total_weight,
+        user_option_tier_total=tiers.user_option_weight,
         primary_traders=primary,
         consolation_traders=consolation
     )
 
 
+def stream_traders(load_file: File) -> Iterator[CowSwapTrader]:
+    """Lazily yields traders from a file written in CowSwapTrader format"""
+    for row in read_csv_rows(load_file):
+        yield CowSwapTrader.from_row(row)
+
+
+def merge_sorted_traders(
+        mainnet: Iterable[CowSwapTrader],
+        gchain: Iterable[CowSwapTrader],
+) -> Iterator[CowSwapTrader]:
+    """
+    Sort-merge join of two account-sorted trader streams. Traders present on both
+    networks are merged, all others are passed through, in order of account.
+    Raises ValueError if either stream is unsorted or contains duplicate accounts.
+    """
+    for mainnet_trader, gchain_trader in merge_join(
+            mainnet, gchain, key=lambda trader: trader.account
+    ):
+        if mainnet_trader is None:
+            yield gchain_trader
+        elif gchain_trader is None:
+            yield mainnet_trader
+        else:
+            yield mainnet_trader.merge(gchain_trader)
+
+
+def _volume_order(row: dict[str, str]) -> tuple[int, str]:
+    """Output order of trader files (volume descending then account)"""
+    return -int(row['eligible_volume']), row['account']
+
+
+def _sort_by_account(load_file: File, temp_dir: str, chunk_size: int) -> File:
+    """
+    `load_file` if it is already sorted by (lower case) account, otherwise a sorted copy
+    (in the order merged by `merge_sorted_traders`)
+    """
+    return sorted_file(load_file, lambda row: row['account'].lower(), temp_dir, chunk_size)
+
+
+def _classify(
+        traders: Iterable[CowSwapTrader],
+        parameters: DuneTradeParameters,
+        batch_size: int,
+) -> Iterator[tuple[CowSwapTrader, bool, bool]]:
+    """
+    Yields each trader along with whether it is primary and consolation eligible.
+    Eligibility is evaluated in bounded batches with the same column kernel.
+    """
+    traders = iter(traders)
+    for batch in iter(lambda: list(islice(traders, batch_size)), []):
+        primary_mask, consolation_mask = eligibility_masks(
+            [trader.eligible_volume for trader in batch],
+            [trader.num_trades for trader in batch],
+            [trader.days_between_first_and_last() or -1 for trader in batch],
+            parameters,
+        )
+        for trader, is_primary in zip(batch, primary_mask):
+            if is_primary and trader.allocation_tier not in TRADING_TIER_FACTORS:
+                raise ValueError(
+                    "Trader meets eligibility criteria, but has invalid allocation tier!"
+                )
+        yield from zip(batch, primary_mask, consolation_mask)
+
+
+def stream_combined(
+        load_from: TraderFiles,
+        excluded: Optional[set[str]] = None,
+        parameters: DuneTradeParameters = TRADER_PARAMETERS,
+        batch_size: int = 10_000,
+) -> AllocationTiers:
+    """
+    Bounded memory counterpart of `fetch_combined` for previously fetched trader data:
+    streams a sort-merge of both network files (externally sorting them by account
+    when necessary) and writes the primary and consolation trader files.
+    Raises ValueError if the stored trader data is not at the snapshot block.
+    :param batch_size: number of traders held in memory per eligibility batch and
+        per sorted chunk
+    :return: allocation tiers of the primary traders
+    """
+    check_snapshot_watermarks(load_from.watermarks, ['mainnet', 'gchain'])
+    excluded = excluded if excluded is not None else load_excluded_accounts()
+    header = [f.name for f in fields(CowSwapTrader)]
+    tier_counts = defaultdict(int)
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            ExternalSorter(header, _volume_order, batch_size, temp_dir) as primary, \
+            ExternalSorter(header, _volume_order, batch_size, temp_dir) as consolation:
+        merged = merge_sorted_traders(
+            mainnet=stream_traders(
+                _sort_by_account(
+                    load_from.traders.filename('mainnet'), temp_dir, batch_size
+                )
+            ),
+            gchain=stream_traders(
+                _sort_by_account(
+                    load_from.traders.filename('gchain'), temp_dir, batch_size
+                )
+            ),
+        )
+        eligible = (trader for trader in merged if trader.account not in excluded)
+        for trader, is_primary, is_consolation in _classify(
+                eligible, parameters, batch_size
+        ):
+            if is_primary:
+                tier_counts[trader.allocation_tier] += 1
+                primary.add(trader.to_row())
+            elif is_consolation:
+                consolation.add(trader.to_row())
+        primary.write(load_from.primary_trader)
+        consolation.write(load_from.consolation_trader)
+
+    tiers = AllocationTiers(tier_counts)
+    print(f"Tier Count for this dataset\n{tiers}")
+    return tiers
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch trader data")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="incrementally refresh trader data up to the given blocks, "
+             "leaving snapshot data untouched",
+    )
+    for chain_name in ['mainnet', 'gchain']:
+        parser.add_argument(
+            f"--{chain_name}-block",
+            type=str,
+            help=f"{chain_name} block to refresh to (with --refresh)",
+            default=SNAPSHOT_BLOCK_NUMBER[chain_name],
+        )
+    args = parser.parse_args()
     dune_connection = DuneAnalytics.new_from_environment()
-    fetch_combined(dune_connection, TraderFiles())
+    if args.refresh:
+        refresh_combined(
+            dune_connection,
+            TraderFiles(),
+            {'mainnet': args.mainnet_block, 'gchain': args.gchain_block},
+        )
+    else:
+        fetch_combined(dune_connection, TraderFiles())
@@ -2,50 +2,181 @@
 Fetching the amount of `Token` held by each liquidity provider
 for Uniswap V3 pools at a specific block
 """
-from collections import defaultdict
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Iterator, Optional
 
-from src.constants import GNO_TOKEN, SNAPSHOT_BLOCK_NUMBER
+from src.constants import GNO_TOKEN, SNAPSHOT_BLOCK_NUMBER, FILE_OUT_PATH
 from src.files import HolderFiles
 from src.models import GnoHolder
-from src.utils.univ3 import execute_query, Position, Pool, pool_query, \
-    position_query
+from src.utils.univ3 import execute_query, paginate, Position, Pool, pool_query, \
+    position_query, query_cache, token_holdings, PAGE_SIZE
+from src.utils.univ3_replay import UniV3Replay
 from src.utils.data import write_to_csv, File
 
+# Number of pools whose positions are fetched concurrently
+SUBGRAPH_WORKERS = 4
+
+
+def fetch_token_pools(block_number: int, tokens: list[str]) -> list[Pool]:
+    """
+    Fetches all UniV3 pools involving any of `tokens` at `block_number`
+    (pages of pools by token0 and token1 are fetched in the same query).
+    The queried token of a pool is the first of its tokens in `tokens`.
+    :return: a list of Pools
+    """
+    tokens = [token.lower() for token in tokens]
+    last_ids = {0: "", 1: ""}
+    results: dict[str, Pool] = {}
+    while last_ids:
+        data = execute_query(pool_query(block_number, tokens, last_ids))['data']
+        for token_index in list(last_ids):
+            page = data[f'pools{token_index}']
+            for record in page:
+                if record['id'] in results:
+                    continue
+                results[record['id']] = Pool(
+                    address=record['id'],
+                    liquidity=int(record['liquidity']),
+                    sqrt_price=int(record['sqrtPrice']),
+                    tick=int(record['tick']),
+                    queried_token_index=token_index,
+                    token0=record['token0']['id'],
+                    token1=record['token1']['id'],
+                )
+            if len(page) < PAGE_SIZE:
+                del last_ids[token_index]
+            else:
+                last_ids[token_index] = page[-1]['id']
+    return list(results.values())
+
 
 def fetch_pools(block_number: int, token: str) -> list[Pool]:
     """
     Fetches all UniV3 pools involving `token` at `block_number`
     :return: a list of Pools
     """
-    pools = execute_query(pool_query(block_number, token))['data']
-    results = []
-    for data in pools['pools0']:
-        results.append(
-            Pool(
-                address=data['id'],
-                liquidity=int(data['liquidity']),
-                sqrt_price=int(data['sqrtPrice']),
-                tick=int(data['tick']),
-                queried_token_index=0
-            )
-        )
-    for data in pools['pools1']:
-        results.append(
-            Pool(
-                address=data['id'],
-                liquidity=int(data['liquidity']),
-                sqrt_price=int(data['sqrtPrice']),
-                tick=int(data['tick']),
-                queried_token_index=1
-            )
+    return fetch_token_pools(block_number, [token])
+
+
+def fetch_positions(
+        block_number: int,
+        pools: list[Pool],
+        token: Optional[str] = None,
+        max_workers: int = SUBGRAPH_WORKERS,
+) -> Iterator[Position]:
+    """
+    Streams all open positions in `pools` at `block_number`
+    (for `token`, by default each pool's queried token).
+    Positions of each pool are fetched (page by page) as a separate shard,
+    with up to `max_workers` shards fetched concurrently.
+    Positions are yielded in order of `pools`, as soon as their shard is complete.
+    """
+    def fetch_shard(pool: Pool) -> list[dict]:
+        return list(paginate(
+            lambda last_id: position_query(block_number, pool.address, last_id),
+            'positions'
+        ))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for pool, shard in zip(pools, executor.map(fetch_shard, pools)):
+            for gql_position in shard:
+                yield Position(
+                    liquidity=int(gql_position['liquidity']),
+                    account=gql_position['owner'],
+                    tick_lower=int(gql_position['tickLower']['tickIdx']),
+                    tick_upper=int(gql_position['tickUpper']['tickIdx']),
+                    pool=pool,
+                    token=token or pool.token(pool.queried_token_index)
+                )
+
+
+def _positions_cache(block_number: int, tokens: list[str], cache_path: str) -> File:
+    """Raw position set of `tokens` pools, pinned to `block_number`"""
+    key = hashlib.sha256(",".join(sorted(t.lower() for t in tokens)).encode()).hexdigest()
+    return File(f"univ3-positions-{block_number}-{key[:16]}.json.gz", path=cache_path)
+
+
+def load_positions(
+        block_number: int,
+        tokens: list[str],
+        cache_path: str = FILE_OUT_PATH,
+) -> list[Position]:
+    """
+    Loads all open positions in pools involving any of `tokens` at `block_number`
+    from the block pinned cache, fetching (and caching) them when not yet cached.
+    """
+    cache = _positions_cache(block_number, tokens, cache_path)
+    try:
+        with gzip.open(cache.filename(), 'rt', encoding='utf-8') as cache_file:
+            raw = json.load(cache_file)
+        print(f"Loaded {len(raw['positions'])} UniV3 positions from {cache.name}")
+    except FileNotFoundError:
+        print(f"file at {cache.name} not found. Fetching from The Graph")
+        pools = fetch_token_pools(block_number, tokens)
+        raw = {
+            'pools': [asdict(pool) for pool in pools],
+            'positions': [
+                [p.pool.address, p.account, str(p.liquidity), p.tick_lower, p.tick_upper]
+                for p in fetch_positions(block_number, pools)
+            ],
+        }
+        os.makedirs(cache_path, exist_ok=True)
+        # Written under a temporary name, so an interrupted write is never loaded.
+        with gzip.open(cache.filename() + '.tmp', 'wt', encoding='utf-8') as cache_file:
+            json.dump(raw, cache_file)
+        os.replace(cache.filename() + '.tmp', cache.filename())
+        print(query_cache())
+
+    pools = {pool['address']: Pool(**pool) for pool in raw['pools']}
+    return [
+        Position(
+            account=account,
+            liquidity=int(liquidity),
+            tick_lower=tick_lower,
+            tick_upper=tick_upper,
+            pool=pools[address],
+            token=pools[address].token(pools[address].queried_token_index),
         )
-    return results
+        for address, account, liquidity, tick_lower, tick_upper in raw['positions']
+    ]
+
+
+def fetch_univ3_holdings(
+        block_number: int,
+        tokens: list[str],
+        cache_path: str = FILE_OUT_PATH,
+        replay: Optional[UniV3Replay] = None,
+) -> dict[str, dict[str, GnoHolder]]:
+    """
+    Amounts of each of `tokens` held in UniV3 positions at `block_number`,
+    from a single fetch of all pools (and positions) involving any of them.
+    :param replay: local event replay to read the positions from instead of the subgraph
+    :return: holders indexed by account, for each (lower case) token
+    """
+    if replay is not None:
+        all_positions = replay.positions(block_number, tokens)
+    else:
+        all_positions = load_positions(block_number, tokens, cache_path)
+    return {
+        token: {
+            account: GnoHolder(account=account, amount=amount)
+            for account, amount in amounts.items()
+        }
+        for token, amounts in token_holdings(all_positions, tokens).items()
+    }
 
 
 def fetch_univ3_gno(
         block_number: int,
         token: str,  # For our purposes we only ever use GNO.
         load_from: File,
+        replay: Optional[UniV3Replay] = None,
 ) -> dict[str, GnoHolder]:
     """
     Fetches all open liquidity positions for all UniV3 pools
@@ -54,6 +185,7 @@ def fetch_univ3_gno(
     :param block_number: block at which to get balances
     :param token: address string of token to get balances for
     :param load_from: location of existing file
+    :param replay: local event replay to read the positions from instead of the subgraph
     :return: all relevant positions indexed by account
     """
     try:
@@ -61,35 +193,9 @@ def fetch_univ3_gno(
     except FileNotFoundError:
         print(f"file at {load_from.name} not found. Fetching from The Graph")
 
-    pool_list = fetch_pools(block_number, token)
-    indexed_pools = {
-        pool.address: pool
-        for pool in pool_list
-    }
-
-    position_list = execute_query(
-        position_query(
-            block_number,
-            list(indexed_pools.keys()))
-    )['data']['positions']
-
-    results = defaultdict(list)
-    for gql_position in position_list:
-        pool_id = gql_position['pool']['id']
-        position = Position(
-            liquidity=int(gql_position['liquidity']),
-            account=gql_position['owner'],
-            tick_lower=int(gql_position['tickLower']['tickIdx']),
-            tick_upper=int(gql_position['tickUpper']['tickIdx']),
-            pool=indexed_pools[pool_id],
-            token=token
-        )
-        results[position.account].append(position)
-
-    return_dict = {
-        account: Position.reduce_to_gno_holder(results[account])
-        for account in results
-    }
+    return_dict = fetch_univ3_holdings(
+        block_number, [token], load_from.path, replay
+    )[token.lower()]
     gno_holders = list(return_dict.values())
     gno_holders.sort(key=lambda h: h.amount, reverse=True)
 
@@ -101,11 +207,28 @@ def fetch_univ3_gno(
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser("UniV3 GNO holders")
+    parser.add_argument(
+        "--events",
+        type=str,
+        help="local UniV3 event file (see src/utils/univ3_replay.py) "
+             "to replay instead of querying the subgraph",
+    )
+    args = parser.parse_args()
+
+    event_replay = None
+    if args.events:
+        event_replay = UniV3Replay(
+            File(os.path.basename(args.events), path=os.path.dirname(args.events) or '.')
+        )
     positions = fetch_univ3_gno(
         block_number=SNAPSHOT_BLOCK_NUMBER['mainnet'],
         token=GNO_TOKEN['mainnet'],
-        load_from=HolderFiles().univ3_holders
+        load_from=HolderFiles().univ3_holders,
+        replay=event_replay,
     )
+    if event_replay is not None:
+        event_replay.close()
 
     for holder in positions.values():
         print(f"Account {holder.account} holds {holder.amount} GNO in UniV3 positions")
@@ -61,6 +61,8 @@ class HolderFiles:
     balancer_pools = File("mainnet-balancer-gno.csv")
     combined = File("combined-holders.csv")
     network_master = NetworkFile("holders-master.csv")
+    # Digests of the source files the network masters were last built from
+    source_manifest = File("holder-source-manifest.csv")
 
 
 @dataclass
@@ -71,6 +73,11 @@ class TraderFiles:
     consolation_trader = File("combined-consolation-trader-data.csv")
     primary_trader = File("combined-primary-trader-data.csv")
     traders = NetworkFile("trader-data.csv", path='./data')
+    # Block (per network) up to which (exclusive) the trader data has been aggregated
+    watermarks = File("trader-data-watermarks.csv", path='./data')
+    # Unrounded trader aggregates (and their watermarks) kept up to date
+    # by refresh_trader_data
+    refreshed_volumes = File("refreshed-trader-volumes.sqlite")
     user_options = File("combined-user-options.csv")
 
 
@@ -3,11 +3,16 @@ Derives Holder allocations from GNO holder data
 """
 from __future__ import annotations
 
+import argparse
+from typing import Optional
+
 from src.constants import GNO_HOLDER_ALLOCATION
 from src.dune_analytics import DuneAnalytics
-from src.fetch.combined_holders import generate_combined_holders
+from src.fetch.combined_holders import generate_combined_holders, \
+    refresh_combined_holders, CombinedGnoHolder
 from src.files import AllocationFiles
 from src.models import IndexedAllocations
+from src.utils.allocation import pro_rata
 from src.utils.data import dump_results_and_index_by_account
 
 
@@ -24,13 +29,29 @@ def derive_allocations(
         print(f"file {load_from.holder_allocation} not found, fetching from Dune")
 
     combined_holders = generate_combined_holders(dune, load_from.holder_data)
+    return allocate_to_holders(combined_holders, load_from)
 
-    eligible_supply = sum(holder.total_gno for holder in combined_holders)
-    allocations = [holder.to_allocation(eligible_supply) for holder in combined_holders]
 
-    total_allocated = sum(h.amount for h in allocations)
-    assert total_allocated <= GNO_HOLDER_ALLOCATION
-    unallocated = (GNO_HOLDER_ALLOCATION - total_allocated) / pow(10, 18)
+def allocate_to_holders(
+        combined_holders: list[CombinedGnoHolder],
+        load_from: AllocationFiles,
+        supply: Optional[int] = None,
+) -> IndexedAllocations:
+    """
+    Allocates GNO_HOLDER_ALLOCATION pro-rata over `combined_holders` and writes results
+    :param supply: total GNO of `combined_holders` when already known
+    """
+    holder_allocations = pro_rata(
+        weights=[holder.total_gno for holder in combined_holders],
+        supply=GNO_HOLDER_ALLOCATION,
+        total_weight=supply,
+    )
+    allocations = holder_allocations.to_allocations(
+        holder.account for holder in combined_holders
+    )
+
+    assert holder_allocations.unallocated >= 0
+    unallocated = holder_allocations.unallocated / pow(10, 18)
     print(f"{unallocated} unallocated holder tokens")
 
     allocations.sort(key=lambda t: (-t.amount, t.account))
@@ -41,9 +62,41 @@ def derive_allocations(
     return IndexedAllocations(indexed_allocations)
 
 
+def refresh_allocations(
+        dune: DuneAnalytics,
+        load_from: AllocationFiles
+) -> IndexedAllocations:
+    """
+    Updates holder data for changed sources only (see refresh_combined_holders)
+    and re-derives the holder allocations over the updated supply.
+    """
+    refresh = refresh_combined_holders(dune, load_from.holder_data)
+    try:
+        if not refresh.affected_accounts:
+            return IndexedAllocations.load_from_file(load_from.holder_allocation)
+    except FileNotFoundError:
+        pass
+    print(f"{len(refresh.affected_accounts)} holders changed, rescaling allocations")
+    return allocate_to_holders(refresh.holders, load_from, supply=refresh.supply)
+
+
 if __name__ == "__main__":
-    dune_connection = DuneAnalytics.new_from_environment()
-    derive_allocations(
-        dune=dune_connection,
-        load_from=AllocationFiles()
+    parser = argparse.ArgumentParser(description="Derive holder allocations")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="update existing holder data for changed sources only "
+             "and rescale the allocations when holders changed",
     )
+    args = parser.parse_args()
+    dune_connection = DuneAnalytics.new_from_environment()
+    if args.refresh:
+        refresh_allocations(
+            dune=dune_connection,
+            load_from=AllocationFiles()
+        )
+    else:
+        derive_allocations(
+            dune=dune_connection,
+            load_from=AllocationFiles()
+        )
@@ -4,13 +4,16 @@ token contract deployment script.
 """
 from __future__ import annotations
 
+import argparse
 import csv
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
+from typing import Iterable, Iterator, Optional
 
 from src.dune_analytics import DuneAnalytics
 from src.files import AllocationFiles, OptionsFiles
-from src.generate.holder_allocation import derive_allocations as get_holder_allocations
+from src.generate.holder_allocation import derive_allocations as get_holder_allocations, \
+    refresh_allocations as refresh_holder_allocations
 from src.generate.poap_allocation import derive_allocations as get_poap_allocations
 from src.generate.trader_allocation import derive_allocations as get_trader_allocations
 from src.models import Allocation, IndexedAllocations
@@ -128,15 +131,22 @@ class MerkleLeaf:
     def fetch(
             cls,
             dune: DuneAnalytics,
-            allocation_files: AllocationFiles
+            allocation_files: AllocationFiles,
+            refresh_holders: bool = False,
     ) -> list[MerkleLeaf]:
         """
         This method goes one level down to fetch the individual allocation components
         needed to build a MerkleLeaf
         :param dune: Open Dune connection (used to fetch - if necessary)
         :param allocation_files: file locations of existing data - if available)
+        :param refresh_holders: bring existing holder data up to date with its
+            sources first (see refresh_allocations)
         :return: Merkle Leaves corresponding to allocation data
         """
+        if refresh_holders:
+            gno_options = refresh_holder_allocations(dune, load_from=allocation_files)
+        else:
+            gno_options = get_holder_allocations(dune, load_from=allocation_files)
         trader_allocations = get_trader_allocations(
             dune,
             load_from=allocation_files.trader_data
@@ -145,7 +155,7 @@ class MerkleLeaf:
             trader_primary=trader_allocations.primary,
             trader_consolation=trader_allocations.consolation,
             poap_options=get_poap_allocations(dune, load_from=allocation_files),
-            gno_options=get_holder_allocations(dune, load_from=allocation_files),
+            gno_options=gno_options,
             user_options=trader_allocations.user_options,
         )
         combined_allocations.sort(key=lambda a: (-a.Airdrop, a.Account))
@@ -226,6 +236,87 @@ class MerkleLeaf:
         return allocations
 
 
+MERKLE_LEAF_CATEGORIES = [
+    f.name for f in fields(MerkleLeaf) if f.name != 'Account'
+]
+
+
+class MerkleLeafTable:
+    """
+    Columnar storage for a collection of MerkleLeaf (one list per MerkleLeaf field).
+    Category totals and the account set are computed on first use and cached until
+    the column they depend on is mutated.
+    """
+
+    def __init__(self, leaves: Iterable[MerkleLeaf] = ()):
+        self.columns: dict[str, list] = {f.name: [] for f in fields(MerkleLeaf)}
+        self._totals: Optional[dict[str, int]] = None
+        self._accounts: Optional[set[str]] = None
+        self.extend(leaves)
+
+    def __len__(self):
+        return len(self.columns['Account'])
+
+    def __getitem__(self, index: int) -> MerkleLeaf:
+        return MerkleLeaf(**{name: column[index] for name, column in self.columns.items()})
+
+    def __iter__(self) -> Iterator[MerkleLeaf]:
+        for row in zip(*self.columns.values()):
+            yield MerkleLeaf(*row)
+
+    def extend(self, leaves: Iterable[MerkleLeaf]):
+        """Appends `leaves` to the table (adding them to any cached aggregates)"""
+        for leaf in leaves:
+            for name, column in self.columns.items():
+                column.append(getattr(leaf, name))
+            if self._totals is not None:
+                for category in MERKLE_LEAF_CATEGORIES:
+                    self._totals[category] += getattr(leaf, category)
+            if self._accounts is not None:
+                self._accounts.add(leaf.Account)
+
+    def update_account(self, old_account: str, new_account: str) -> list[int]:
+        """
+        Replaces `old_account` with `new_account` in the Account column.
+        Category totals are unaffected, so only the account set is invalidated.
+        :return: row indices of the updated entries
+        """
+        account_column = self.columns['Account']
+        updated = [i for i, account in enumerate(account_column) if account == old_account]
+        for index in updated:
+            account_column[index] = new_account
+        if updated:
+            self._accounts = None
+        return updated
+
+    def totals(self) -> dict[str, int]:
+        """Total (in WEI) of every MerkleLeaf category"""
+        if self._totals is None:
+            self._totals = {
+                category: sum(self.columns[category])
+                for category in MERKLE_LEAF_CATEGORIES
+            }
+        return self._totals
+
+    def total(self) -> int:
+        """Sum of all categories over all entries (in WEI)"""
+        return sum(self.totals().values())
+
+    def accounts(self) -> set[str]:
+        """Set of accounts contained in the table"""
+        if self._accounts is None:
+            self._accounts = set(self.columns['Account'])
+        return self._accounts
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate merkle leaf data")
+    parser.add_argument(
+        "--refresh-holders",
+        action="store_true",
+        help="refresh holder data for changed sources before generating "
+             "(see src/generate/holder_allocation.py --refresh)",
+    )
+    args = parser.parse_args()
     dune_connection = DuneAnalytics.new_from_environment()
-    MerkleLeaf.fetch(dune_connection, AllocationFiles())
+    MerkleLeaf.fetch(dune_connection, AllocationFiles(), refresh_holders=args.refresh_holders)
@@ -11,6 +11,7 @@ from src.fetch.alpha_traders import fetch_alpha_traders
 from src.fetch.combined_holders import load_excluded_accounts
 from src.files import AllocationFiles, NetworkFile
 from src.models import Account, Allocation, IndexedAllocations
+from src.utils.allocation import pro_rata
 from src.utils.data import dump_results_and_index_by_account, File
 
 ALPHA_TRADER_FACTORS = {
@@ -26,10 +27,6 @@ class TokenAllocation:
     factor: int
     event: str
 
-    def allocation_amount_wei(self, total_weight: int) -> int:
-        """generates allocation based on supply and total weight"""
-        return (self.factor * USER_ALLOCATION['POAP']) // total_weight
-
     def __str__(self):
         return f"  event:    {self.event}\n" \
                f"  event ID: {self.token_id}\n" \
@@ -189,20 +186,28 @@ def derive_allocations(
         load_from.poap_categories
     )
 
-    allocations = [
-        Allocation(
-            account=account,
-            amount=sum(
-                t.allocation_amount_wei(indexed_allocations.total_weight)
-                for t in tokens_held
-            )
-        )
+    # Each token held is allocated individually (and rounded down) before
+    # being summed per account.
+    tokens_by_account = [
+        (account, token)
         for account, tokens_held in indexed_allocations.items()
+        for token in tokens_held
+    ]
+    token_allocations = pro_rata(
+        weights=[token.factor for _, token in tokens_by_account],
+        supply=USER_ALLOCATION['POAP'],
+        total_weight=indexed_allocations.total_weight,
+    )
+    account_totals = defaultdict(int)
+    for (account, _), amount in zip(tokens_by_account, token_allocations.amounts):
+        account_totals[account] += amount
+    allocations = [
+        Allocation(account=account, amount=amount)
+        for account, amount in account_totals.items()
     ]
-    total_allocation = sum(a.amount for a in allocations)
     # Ensures total allocation as close as possible without exceeding.
-    assert total_allocation <= USER_ALLOCATION['POAP']
-    unallocated = (USER_ALLOCATION['POAP'] - total_allocation) / pow(10, 18)
+    assert token_allocations.unallocated >= 0
+    unallocated = token_allocations.unallocated / pow(10, 18)
     print(f"{unallocated} unallocated for poap")
 
     allocations.sort(key=lambda t: (-t.amount, t.account))
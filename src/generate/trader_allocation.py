@@ -3,11 +3,13 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 
-from src.constants import USER_ALLOCATION, USER_OPTION_SUPPLY
+from src.constants import USER_ALLOCATION, USER_OPTION_SUPPLY, TRADING_TIER_FACTORS, \
+    USER_OPTION_TIER_FACTORS
 from src.dune_analytics import DuneAnalytics
 from src.fetch import trader_data
 from src.files import TraderFiles
-from src.models import IndexedAllocations, Allocation
+from src.models import IndexedAllocations
+from src.utils.allocation import pro_rata, ProRataAllocation
 from src.utils.data import dump_results_and_index_by_account
 
 
@@ -20,14 +22,12 @@ class TraderAllocations:
 
 
 def assert_and_log(
-        allocations: list[Allocation],
+        allocations: ProRataAllocation,
         name: str,
-        supply: int,
 ):
-    total = sum(p.amount for p in allocations)
-    assert total <= supply
+    assert allocations.unallocated >= 0
 
-    unallocated = (supply - total) / pow(10, 18)
+    unallocated = allocations.unallocated / pow(10, 18)
     print(f"{unallocated} unallocated {name}")
 
 
@@ -53,50 +53,36 @@ def derive_allocations(
         )
 
     eligible_trader_data = trader_data.fetch_combined(dune, load_from)
+    primary_traders = eligible_trader_data.primary_traders
+    consolation_traders = eligible_trader_data.consolation_traders
+    primary_accounts = primary_traders.accounts()
 
     # Primary Trader Airdrop Allocations
-    primary_allocations = [
-        trader.to_primary_allocation(
-            supply=USER_ALLOCATION['primary'],
-            total_weight=eligible_trader_data.primary_tier_total
-        )
-        for trader in eligible_trader_data.primary_traders
-    ]
-
-    assert_and_log(
-        allocations=primary_allocations,
-        name="primary",
-        supply=USER_ALLOCATION['primary']
+    # KeyError not possible here because primary traders are all eligible.
+    primary = pro_rata(
+        weights=[TRADING_TIER_FACTORS[tier] for tier in primary_traders.allocation_tier],
+        supply=USER_ALLOCATION['primary'],
+        total_weight=eligible_trader_data.primary_tier_total
     )
+    assert_and_log(allocations=primary, name="primary")
+    primary_allocations = primary.to_allocations(primary_accounts)
 
-    # Consolations Trader Airdrop allocations
-    num_consolation_prizes = len(eligible_trader_data.consolation_traders)
-    consolation_allocations = [
-        trader.to_consolation_allocation(
-            supply=USER_ALLOCATION['consolation'],
-            num_recipients=num_consolation_prizes,
-        )
-        for trader in eligible_trader_data.consolation_traders
-    ]
-    assert_and_log(
-        allocations=consolation_allocations,
-        name="consolation",
-        supply=USER_ALLOCATION['consolation']
+    # Consolations Trader Airdrop allocations (equal share per recipient)
+    consolation = pro_rata(
+        weights=[1] * len(consolation_traders),
+        supply=USER_ALLOCATION['consolation'],
     )
+    assert_and_log(allocations=consolation, name="consolation")
+    consolation_allocations = consolation.to_allocations(consolation_traders.accounts())
 
     # User Option allocations
-    user_options = [
-        trader.to_user_option(
-            supply=USER_OPTION_SUPPLY,
-            total_weight=eligible_trader_data.user_option_tier_total
-        )
-        for trader in eligible_trader_data.primary_traders
-    ]
-    assert_and_log(
-        allocations=user_options,
-        name="User Options",
+    user_option = pro_rata(
+        weights=[USER_OPTION_TIER_FACTORS[tier] for tier in primary_traders.allocation_tier],
         supply=USER_OPTION_SUPPLY,
+        total_weight=eligible_trader_data.user_option_tier_total
     )
+    assert_and_log(allocations=user_option, name="User Options")
+    user_options = user_option.to_allocations(primary_accounts)
 
     # Write results of both to separate files.
     primary_allocations.sort(key=lambda t: (-t.amount, t.account))
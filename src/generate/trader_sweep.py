@@ -0,0 +1,293 @@
+"""
+What-if evaluation of trader eligibility over a grid of DuneTradeParameters.
+Trader data is loaded once and every trader is bucketed by the number of grid
+thresholds it meets in each dimension. Suffix sums over the resulting count cubes
+answer each combination's eligibility counts (per tier) in constant time, so the
+whole grid costs about as much as a single evaluation.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from itertools import compress, product
+from typing import Optional, Sequence
+
+from src.constants import VOLUME_TIERS, TRADING_TIER_FACTORS, USER_ALLOCATION, \
+    USER_OPTION_SUPPLY, USER_OPTION_TIER_FACTORS
+from src.fetch.combined_holders import load_excluded_accounts
+from src.fetch.trader_data import DuneTradeParameters, TraderTable, AllocationTiers, \
+    TRADER_PARAMETERS
+from src.files import File, TraderFiles
+from src.utils.allocation import pro_rata
+
+# Allocation tiers range from -1 (below the lowest volume tier) to len(VOLUME_TIERS) - 1
+NUM_TIERS = len(VOLUME_TIERS) + 1
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclass
+class SweepResult:
+    """Eligibility counts and allocation amounts for a single parameter combination"""
+    parameters: DuneTradeParameters
+    primary_count: int
+    consolation_count: int
+    tier_counts: dict[int, int]
+    # Amount received by each primary trader (and user option) in a given tier
+    primary_payouts: dict[int, int]
+    user_option_payouts: dict[int, int]
+    consolation_payout: int
+    # Remainder of each supply lost to rounding down
+    unallocated: dict[str, int]
+
+    def to_row(self) -> dict:
+        """Flattens result into a single csv row"""
+        row = {
+            'primary_min_trades': self.parameters.primary_min_trades,
+            'consolation_min_trades': self.parameters.consolation_min_trades,
+            'min_volume': self.parameters.min_volume,
+            'days_between': self.parameters.days_between,
+            'primary_count': self.primary_count,
+            'consolation_count': self.consolation_count,
+            'consolation_payout': self.consolation_payout,
+        }
+        for tier in TRADING_TIER_FACTORS:
+            row[f'tier_{tier}_count'] = self.tier_counts.get(tier, 0)
+            row[f'tier_{tier}_payout'] = self.primary_payouts.get(tier, 0)
+            row[f'tier_{tier}_user_option'] = self.user_option_payouts.get(tier, 0)
+        for category, dust in self.unallocated.items():
+            row[f'unallocated_{category}'] = dust
+        return row
+
+
+def parameter_grid(
+        primary_trades: Sequence[int],
+        consolation_trades: Sequence[int],
+        volumes: Sequence[float],
+        days: Sequence[int],
+        stable_factor: str = TRADER_PARAMETERS.stable_factor,
+) -> list[DuneTradeParameters]:
+    """
+    All combinations of the given parameter values.
+    The stable factor is applied by the trader data query itself,
+    so it is fixed for a sweep over already fetched trader data.
+    """
+    return [
+        DuneTradeParameters(primary, consolation, volume, day, stable_factor)
+        for primary, consolation, volume, day in product(
+            primary_trades, consolation_trades, volumes, days
+        )
+    ]
+
+
+class _CountCube:
+    """Dense count array over buckets, summed to "at least this bucket" counts"""
+
+    def __init__(self, shape: tuple[int, ...]):
+        self.shape = shape
+        self.strides = []
+        stride = 1
+        for size in reversed(shape):
+            self.strides.insert(0, stride)
+            stride *= size
+        self.counts = [0] * stride
+
+    def offset(self, index: tuple[int, ...]) -> int:
+        """Position of `index` in the flat count list"""
+        return sum(i * stride for i, stride in zip(index, self.strides))
+
+    def add_counts(self, counts: Counter):
+        """Adds number of entries in each bucket (keyed by index)"""
+        for index, count in counts.items():
+            self.counts[self.offset(index)] += count
+
+    def suffix_sum(self, axes: Sequence[int]):
+        """
+        Replaces each count along `axes` by the sum over all buckets at least as large.
+        Indices are visited in decreasing order so each neighbour is already summed.
+        """
+        indices = list(product(*(range(size) for size in self.shape)))
+        indices.reverse()
+        for axis in axes:
+            stride = self.strides[axis]
+            for index in indices:
+                if index[axis] < self.shape[axis] - 1:
+                    position = self.offset(index)
+                    self.counts[position] += self.counts[position + stride]
+
+    def __getitem__(self, index: tuple[int, ...]) -> int:
+        return self.counts[self.offset(index)]
+
+
+def _thresholds(values) -> list:
+    return sorted(set(values))
+
+
+def _tier_payouts(
+        tier_counts: dict[int, int],
+        tier_factors: dict[int, int],
+        supply: int,
+        total_weight: int,
+) -> tuple[dict[int, int], int]:
+    """Per trader amount in each tier along with the unallocated remainder"""
+    tiers = [tier for tier in tier_factors if tier_counts.get(tier, 0) > 0]
+    amounts = pro_rata(
+        weights=[tier_factors[tier] for tier in tiers],
+        supply=supply,
+        total_weight=total_weight,
+    ).amounts
+    payouts = dict(zip(tiers, amounts))
+    allocated = sum(tier_counts[tier] * amount for tier, amount in payouts.items())
+    return payouts, supply - allocated
+
+
+# pylint: disable=too-many-locals
+def sweep_eligibility(
+        traders: TraderTable,
+        grid: Sequence[DuneTradeParameters],
+        excluded: Optional[set[str]] = None,
+) -> list[SweepResult]:
+    """
+    Evaluates the trader eligibility criteria for every parameter combination in `grid`.
+    :param traders: merged trader data for all networks
+    :param grid: parameter combinations to evaluate
+    :param excluded: accounts which are not eligible for any trader allocation
+    :return: one SweepResult per entry of `grid` (in the same order)
+    """
+    volumes = _thresholds(p.min_volume for p in grid)
+    primary_trades = _thresholds(p.primary_min_trades for p in grid)
+    consolation_trades = _thresholds(p.consolation_min_trades for p in grid)
+    days = _thresholds(p.days_between for p in grid)
+
+    # Bucket b means the trader meets the first b (sorted) thresholds.
+    included = [not is_excluded for is_excluded in traders.account_mask(excluded or set())]
+    volume_buckets = list(compress(
+        (bisect_right(volumes, volume) for volume in traders.eligible_volume), included
+    ))
+    num_trades = list(compress(traders.num_trades, included))
+
+    primary_cube = _CountCube(
+        (len(volumes) + 1, len(primary_trades) + 1, len(days) + 1, NUM_TIERS)
+    )
+    primary_cube.add_counts(Counter(zip(
+        volume_buckets,
+        (bisect_right(primary_trades, trades) for trades in num_trades),
+        (bisect_right(days, d) for d in compress(traders.days_between(), included)),
+        (tier + 1 for tier in compress(traders.allocation_tier, included)),
+    )))
+    primary_cube.suffix_sum(axes=(0, 1, 2))
+    consolation_cube = _CountCube((len(volumes) + 1, len(consolation_trades) + 1))
+    consolation_cube.add_counts(Counter(zip(
+        volume_buckets,
+        (bisect_right(consolation_trades, trades) for trades in num_trades),
+    )))
+    consolation_cube.suffix_sum(axes=(0, 1))
+
+    results = []
+    for parameters in grid:
+        volume_index = volumes.index(parameters.min_volume) + 1
+        trades_index = primary_trades.index(parameters.primary_min_trades) + 1
+        days_index = days.index(parameters.days_between) + 1
+        consolation_index = consolation_trades.index(parameters.consolation_min_trades) + 1
+
+        tier_counts = {
+            tier: primary_cube[(volume_index, trades_index, days_index, tier + 1)]
+            for tier in range(-1, NUM_TIERS - 1)
+        }
+        if any(count > 0 and tier not in TRADING_TIER_FACTORS
+               for tier, count in tier_counts.items()):
+            raise ValueError(
+                f"Trader meets eligibility criteria {parameters}, "
+                f"but has invalid allocation tier!"
+            )
+        primary_count = sum(tier_counts.values())
+        # Primary traders always meet the volume requirement so they are a subset of
+        # those meeting either consolation requirement.
+        consolation_count = (
+            consolation_cube[(volume_index, 0)]
+            + consolation_cube[(0, consolation_index)]
+            - consolation_cube[(volume_index, consolation_index)]
+            - primary_count
+        )
+
+        tiers = AllocationTiers(tier_counts)
+        primary_payouts, primary_dust = _tier_payouts(
+            tier_counts, TRADING_TIER_FACTORS,
+            USER_ALLOCATION['primary'], tiers.primary_total_weight
+        )
+        user_option_payouts, user_option_dust = _tier_payouts(
+            tier_counts, USER_OPTION_TIER_FACTORS,
+            USER_OPTION_SUPPLY, tiers.user_option_weight
+        )
+        consolation_payout = USER_ALLOCATION['consolation'] // consolation_count \
+            if consolation_count > 0 else 0
+        results.append(SweepResult(
+            parameters=parameters,
+            primary_count=primary_count,
+            consolation_count=consolation_count,
+            tier_counts={t: c for t, c in tier_counts.items() if t in TRADING_TIER_FACTORS},
+            primary_payouts=primary_payouts,
+            user_option_payouts=user_option_payouts,
+            consolation_payout=consolation_payout,
+            unallocated={
+                'primary': primary_dust,
+                'consolation': USER_ALLOCATION['consolation']
+                - consolation_count * consolation_payout,
+                'user_option': user_option_dust,
+            }
+        ))
+    return results
+
+
+def write_sweep_results(results: list[SweepResult], outfile: File):
+    """Writes one row per parameter combination to `outfile`"""
+    if len(results) == 0:
+        print("No data in list, skipping write")
+        return
+    print(f"dumping {len(results)} results to {outfile.name}")
+    rows = [result.to_row() for result in results]
+    if not os.path.exists(outfile.path):
+        os.makedirs(outfile.path)
+    with open(outfile.filename(), 'w', encoding='utf-8') as out_file:
+        dict_writer = csv.DictWriter(out_file, list(rows[0]), lineterminator='\n')
+        dict_writer.writeheader()
+        dict_writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate trader eligibility over a grid of parameters"
+    )
+    parser.add_argument(
+        "--primary-trades", type=int, nargs='+',
+        default=[TRADER_PARAMETERS.primary_min_trades],
+    )
+    parser.add_argument(
+        "--consolation-trades", type=int, nargs='+',
+        default=[TRADER_PARAMETERS.consolation_min_trades],
+    )
+    parser.add_argument(
+        "--volumes", type=float, nargs='+',
+        default=[TRADER_PARAMETERS.min_volume],
+    )
+    parser.add_argument(
+        "--days", type=int, nargs='+',
+        default=[TRADER_PARAMETERS.days_between],
+    )
+    args = parser.parse_args()
+
+    trader_files = TraderFiles()
+    sweep_results = sweep_eligibility(
+        traders=TraderTable.load_and_merge(
+            mainnet_file=trader_files.traders.filename('mainnet'),
+            gchain_file=trader_files.traders.filename('gchain'),
+        ),
+        grid=parameter_grid(
+            args.primary_trades, args.consolation_trades, args.volumes, args.days
+        ),
+        excluded=load_excluded_accounts(),
+    )
+    write_sweep_results(sweep_results, File("trader-parameter-sweep.csv"))
@@ -13,7 +13,8 @@ class Account:
     account: str
 
     def __init__(self, account: str):
-        # TODO - replace with checksum address
+        # Accounts are compared lower case, checksum encoding is only applied
+        # (in bulk) when writing output. See src.utils.checksum
         self.account = account.lower()
 
     def __hash__(self):
@@ -5,7 +5,7 @@ from typing import Optional
 
 from src.dune_analytics import DuneAnalytics
 from src.fetch.combined_holders import CombinedGnoHolder
-from src.fetch.trader_data import CowSwapTrader
+from src.fetch.trader_data import TraderTable
 from src.files import File, AllocationFiles
 from src.generate.merkle_data import MerkleLeaf
 from src.generate.poap_allocation import IndexedPoapAllocations
@@ -22,7 +22,7 @@ class TraderDetails:
 
     def __init__(
             self,
-            data: dict[str, CowSwapTrader],
+            data: TraderTable,
             allocations: IndexedAllocations,
             allocation_type: AllocationType,
     ):
@@ -46,7 +46,7 @@ class VerboseTraderDetails:
             self,
             primary: TraderDetails,
             consolation: TraderDetails,
-            raw_trader_data: dict[str, CowSwapTrader],
+            raw_trader_data: TraderTable,
     ):
         self.primary = primary
         self.consolation = consolation
@@ -155,12 +155,12 @@ def load_all_data_from_out(allocation_files: AllocationFiles) -> AllocationDetai
 
     # Load Trader Info
     trader_details = VerboseTraderDetails(
-        raw_trader_data=CowSwapTrader.load_and_merge_network_trader_data(
+        raw_trader_data=TraderTable.load_and_merge(
             mainnet_file=allocation_files.trader_data.traders.filename('mainnet'),
             gchain_file=allocation_files.trader_data.traders.filename('gchain'),
         ),
         primary=TraderDetails(
-            data=CowSwapTrader.load_from_file(
+            data=TraderTable.load_from_file(
                 load_file=allocation_files.trader_data.primary_trader
             ),
             allocations=IndexedAllocations.load_from_file(
@@ -169,7 +169,7 @@ def load_all_data_from_out(allocation_files: AllocationFiles) -> AllocationDetai
             allocation_type=AllocationType.PRIMARY
         ),
         consolation=TraderDetails(
-            data=CowSwapTrader.load_from_file(
+            data=TraderTable.load_from_file(
                 load_file=allocation_files.trader_data.consolation_trader
             ),
             allocations=IndexedAllocations.load_from_file(
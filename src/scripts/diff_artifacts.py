@@ -0,0 +1,216 @@
+"""
+Compares two versions of a pipeline artifact (e.g. before and after a rerun).
+The old file is indexed by account and the new one is streamed against it (hash join),
+reporting added and removed accounts, per-field deltas and the largest movers.
+For merkle leaves and split files the field totals are the drift per allocation category.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import heapq
+import sys
+from dataclasses import dataclass, field
+from operator import add, itemgetter, ne, sub
+from typing import Iterator, Optional
+
+from src.files import File
+from src.generate.merkle_data import MERKLE_LEAF_CATEGORIES
+
+
+@dataclass
+class ArtifactType:
+    """Layout of a csv artifact to be compared"""
+    key: str
+    fields: tuple[str, ...]
+    # Field by which movers are ranked (sum of all fields when None)
+    mover_field: Optional[str] = None
+
+    def weight(self, values: tuple[int, ...]) -> int:
+        """Value of a record by which movers are ranked"""
+        if self.mover_field is None:
+            return sum(values)
+        return values[self.fields.index(self.mover_field)]
+
+
+ARTIFACT_TYPES = {
+    'allocations': ArtifactType('account', ('amount',)),
+    'holders': ArtifactType(
+        'account', ('mainnet_gno', 'gchain_gno', 'total_gno'), mover_field='total_gno'
+    ),
+    'traders': ArtifactType(
+        'account',
+        ('eligible_volume', 'num_trades', 'allocation_tier'),
+        mover_field='eligible_volume'
+    ),
+    # Merkle leaves and (per network) split files share the same layout.
+    'merkle': ArtifactType('Account', tuple(MERKLE_LEAF_CATEGORIES)),
+}
+
+
+@dataclass
+class FieldDrift:
+    """Aggregate change of a single field"""
+    old_total: int = 0
+    new_total: int = 0
+    # Number of accounts (present in both versions) for which the field changed
+    num_changed: int = 0
+
+    @property
+    def delta(self) -> int:
+        """Change in the field's total"""
+        return self.new_total - self.old_total
+
+
+@dataclass
+class Mover:
+    """Change in weight of a single account (zero when absent)"""
+    account: str
+    old: int
+    new: int
+
+    @property
+    def delta(self) -> int:
+        """Change in weight"""
+        return self.new - self.old
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclass
+class ArtifactDiff:
+    """Differences between two versions of an artifact"""
+    artifact: ArtifactType
+    num_old: int = 0
+    num_new: int = 0
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    num_changed: int = 0
+    drift: dict[str, FieldDrift] = field(default_factory=dict)
+    top_movers: list[Mover] = field(default_factory=list)
+
+    def is_identical(self) -> bool:
+        """True if both versions contain the same values for the same accounts"""
+        return not (self.added or self.removed or self.num_changed)
+
+    def __str__(self):
+        lines = [
+            f"old records: {self.num_old}, new records: {self.num_new}",
+            f"added: {len(self.added)}, removed: {len(self.removed)}, "
+            f"changed: {self.num_changed}",
+            "",
+            f"{'field':<18}{'old total':>28}{'new total':>28}{'delta':>28}{'changed':>10}",
+        ]
+        for name, drift in self.drift.items():
+            lines.append(
+                f"{name:<18}{drift.old_total:>28}{drift.new_total:>28}"
+                f"{drift.delta:>28}{drift.num_changed:>10}"
+            )
+        if self.top_movers:
+            lines += ["", "largest movers:"]
+            lines += [
+                f"  {mover.account} {mover.old} -> {mover.new} ({mover.delta:+})"
+                for mover in self.top_movers
+            ]
+        return "\n".join(lines)
+
+
+def _records(
+        load_from: File,
+        artifact: ArtifactType,
+) -> Iterator[tuple[str, tuple[str, ...]]]:
+    """Streams (account, raw field values) of an artifact file"""
+    with open(load_from.filename(), 'r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        key_index = header.index(artifact.key)
+        # itemgetter of a single index doesn't return a tuple, so the key is included
+        values = itemgetter(key_index, *(header.index(name) for name in artifact.fields))
+        for row in reader:
+            account, *amounts = values(row)
+            yield account.lower(), tuple(amounts)
+
+
+def _parse(values: tuple[str, ...]) -> tuple[int, ...]:
+    return tuple(map(int, values))
+
+
+def diff_artifacts(
+        old: File,
+        new: File,
+        artifact: ArtifactType,
+        num_movers: int = 10,
+) -> ArtifactDiff:
+    """
+    Joins `new` against `old` by (lower case) account in a single pass over each.
+    Only records whose raw values differ are parsed, unchanged records
+    don't contribute to any delta.
+    :param num_movers: number of accounts with the largest absolute weight change to report
+    :return: differences between the two versions
+    """
+    previous = dict(_records(old, artifact))
+    num_fields = len(artifact.fields)
+    old_totals = [sum(map(int, column)) for column in zip(*previous.values())] \
+        or [0] * num_fields
+    deltas, changed_counts = [0] * num_fields, [0] * num_fields
+    result = ArtifactDiff(artifact=artifact, num_old=len(previous))
+
+    def movers() -> Iterator[Mover]:
+        for account, raw_values in _records(new, artifact):
+            result.num_new += 1
+            raw_old_values = previous.pop(account, None)
+            if raw_old_values == raw_values:
+                continue
+            values = _parse(raw_values)
+            deltas[:] = map(add, deltas, values)
+            if raw_old_values is None:
+                result.added.append(account)
+                yield Mover(account, 0, artifact.weight(values))
+                continue
+            old_values = _parse(raw_old_values)
+            deltas[:] = map(sub, deltas, old_values)
+            if old_values != values:
+                result.num_changed += 1
+                changed_counts[:] = map(add, changed_counts, map(ne, old_values, values))
+                yield Mover(account, artifact.weight(old_values), artifact.weight(values))
+        for account, raw_old_values in previous.items():
+            result.removed.append(account)
+            old_values = _parse(raw_old_values)
+            deltas[:] = map(sub, deltas, old_values)
+            yield Mover(account, artifact.weight(old_values), 0)
+
+    result.top_movers = [
+        mover for mover in heapq.nlargest(
+            num_movers, movers(), key=lambda mover: abs(mover.delta)
+        ) if mover.delta != 0
+    ]
+    result.drift = {
+        name: FieldDrift(old_totals[i], old_totals[i] + deltas[i], changed_counts[i])
+        for i, name in enumerate(artifact.fields)
+    }
+    return result
+
+
+def _file_arg(filename: str) -> File:
+    path, _, name = filename.rpartition('/')
+    return File(name=name, path=path or '.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare two versions of an allocation pipeline artifact"
+    )
+    parser.add_argument("artifact", choices=sorted(ARTIFACT_TYPES))
+    parser.add_argument("old", type=_file_arg, help="previous version of the artifact")
+    parser.add_argument("new", type=_file_arg, help="new version of the artifact")
+    parser.add_argument("--movers", type=int, default=10)
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="exit with non zero status when the versions differ",
+    )
+    args = parser.parse_args()
+
+    diff = diff_artifacts(args.old, args.new, ARTIFACT_TYPES[args.artifact], args.movers)
+    print(diff)
+    if args.strict and not diff.is_identical():
+        sys.exit(1)
@@ -31,13 +31,14 @@ for allocation on both networks:
 Defined as SPECIAL_CASES here
 """
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 from src.constants import EXPECTED_TOTAL, ANONYMOUS_INVESTMENTS, WEI_IN_ETH
 from src.dune_analytics import DuneAnalytics
 from src.fetch.contracts import EvmAccountInfo
 from src.files import AllocationFiles
-from src.generate.merkle_data import MerkleLeaf, AllocationOption
+from src.generate.merkle_data import MerkleLeaf, AllocationOption, MerkleLeafTable
 from src.utils.data import write_to_csv
 
 ALLOCATION_SPLIT = 10000 * 10 ** 18
@@ -96,48 +97,37 @@ def handle_special_considerations(
 @dataclass
 class SplitAllocations:
     """Basic class to store the output of split_allocation"""
-    mainnet: list[MerkleLeaf]
-    gchain: list[MerkleLeaf]
+    mainnet: MerkleLeafTable
+    gchain: MerkleLeafTable
 
     def get_all_accounts(self) -> set[str]:
-        mainnet_accounts = set(a.Account for a in self.mainnet)
-        gchain_accounts = set(a.Account for a in self.gchain)
-        return mainnet_accounts | gchain_accounts
+        return self.mainnet.accounts() | self.gchain.accounts()
 
     def total_allocation_wei(self) -> int:
-        mainnet_total = sum(a.total() for a in self.mainnet)
-        gchain_total = sum(a.total() for a in self.gchain)
-        return mainnet_total + gchain_total
+        return self.mainnet.total() + self.gchain.total()
 
-    def total_airdrop(self) -> float:
-        mainnet_total = sum(a.Airdrop for a in self.mainnet)
-        gchain_total = sum(a.Airdrop for a in self.gchain)
+    def _category_total(self, category: str) -> float:
+        mainnet_total = self.mainnet.totals()[category]
+        gchain_total = self.gchain.totals()[category]
         return (mainnet_total + gchain_total) / WEI_IN_ETH
 
+    def total_airdrop(self) -> float:
+        return self._category_total('Airdrop')
+
     def total_advisor(self) -> float:
-        mainnet_total = sum(a.Advisor for a in self.mainnet)
-        gchain_total = sum(a.Advisor for a in self.gchain)
-        return (mainnet_total + gchain_total) / WEI_IN_ETH
+        return self._category_total('Advisor')
 
     def total_gno_option(self) -> float:
-        mainnet_total = sum(a.GnoOption for a in self.mainnet)
-        gchain_total = sum(a.GnoOption for a in self.gchain)
-        return (mainnet_total + gchain_total) / WEI_IN_ETH
+        return self._category_total('GnoOption')
 
     def total_user_option(self) -> float:
-        mainnet_total = sum(a.UserOption for a in self.mainnet)
-        gchain_total = sum(a.UserOption for a in self.gchain)
-        return (mainnet_total + gchain_total) / WEI_IN_ETH
+        return self._category_total('UserOption')
 
     def total_investor(self) -> float:
-        mainnet_total = sum(a.Investor for a in self.mainnet)
-        gchain_total = sum(a.Investor for a in self.gchain)
-        return (mainnet_total + gchain_total) / WEI_IN_ETH
+        return self._category_total('Investor')
 
     def total_team(self) -> float:
-        mainnet_total = sum(a.Team for a in self.mainnet)
-        gchain_total = sum(a.Team for a in self.gchain)
-        return (mainnet_total + gchain_total) / WEI_IN_ETH
+        return self._category_total('Team')
 
     def append_options(self, option_type: AllocationOption):
         option_allocations = option_type.load_options()
@@ -158,7 +148,7 @@ class SplitAllocations:
             f"Appending {len(appendages)} {option_type.name} entries to mainnet "
             f"allocation with a total of {allocation_total / 1e18} tokens"
         )
-        self.mainnet += appendages
+        self.mainnet.extend(appendages)
 
     def redirect_vesting_contract_allocation(self):
         # This particular source account is a Vesting contract which will not be
@@ -168,10 +158,9 @@ class SplitAllocations:
         # https://etherscan.io/address/0x9f7dfab2222a473284205cddf08a677726d786a0
         redirect_dest = "0x9f7dfab2222a473284205cddf08a677726d786a0"
 
-        for allocation in self.mainnet + self.gchain:
-            if allocation.Account == redirect_source:
-                print(f"Redirecting allocation {allocation} to {redirect_dest}")
-                allocation.update_account(redirect_dest)
+        for table in [self.mainnet, self.gchain]:
+            for index in table.update_account(redirect_source, redirect_dest):
+                print(f"Redirecting allocation {table[index]} from {redirect_source}")
 
     def __str__(self):
         mill = pow(10, 6)
@@ -261,7 +250,10 @@ def split_allocations(
         outfile=AllocationFiles().gchain_allocation,
         data_list=gchain
     )
-    return SplitAllocations(mainnet=mainnet, gchain=gchain)
+    return SplitAllocations(
+        mainnet=MerkleLeafTable(mainnet),
+        gchain=MerkleLeafTable(gchain)
+    )
 
 
 def fetch_and_split_allocations(
@@ -273,19 +265,25 @@ def fetch_and_split_allocations(
         allocation_files
     )
 
+    networks = ['mainnet', 'gchain']
+
+    def network_contracts(network: str) -> set[str]:
+        return EvmAccountInfo(
+            node_url=NODE_URL[network],
+            addresses=[a.Account for a in fetched_allocations],
+            network=network
+        ).contracts(load_from=AllocationFiles.contracts)
+
+    # Both networks are classified concurrently, each with its own batches in flight.
+    with ThreadPoolExecutor(max_workers=len(networks)) as executor:
+        known_contracts = dict(zip(networks, executor.map(network_contracts, networks)))
+
     return split_allocations(
         allocations=fetched_allocations,
-        known_contracts={
-            network: EvmAccountInfo(
-                node_url=NODE_URL[network],
-                addresses=[a.Account for a in fetched_allocations],
-                network=network
-            ).contracts(load_from=AllocationFiles.contracts)
-            for network in ['mainnet', 'gchain']
-        },
+        known_contracts=known_contracts,
         accounts={
             network: allocation_files.load_all_network_accounts(network)
-            for network in ['mainnet', 'gchain']
+            for network in networks
         },
     )
 
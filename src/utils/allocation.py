@@ -0,0 +1,69 @@
+"""
+Shared kernel for splitting a fixed token supply pro-rata over a column of weights.
+All arithmetic is exact integer floor division so results are bit-identical to
+computing `(supply * weight) // total_weight` for each recipient individually.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+from src.models import Allocation
+
+
+@dataclass
+class ProRataAllocation:
+    """Amounts allocated to each weight (in input order) out of `supply`"""
+    amounts: list[int]
+    supply: int
+
+    @property
+    def total(self) -> int:
+        """Sum of all allocated amounts"""
+        return sum(self.amounts)
+
+    @property
+    def unallocated(self) -> int:
+        """Remainder of the supply lost to rounding down"""
+        return self.supply - self.total
+
+    def to_allocations(self, accounts: Iterable[str]) -> list[Allocation]:
+        """Pairs amounts with `accounts` (which must be in the same order as weights)"""
+        accounts = list(accounts)
+        if len(accounts) != len(self.amounts):
+            raise ValueError(
+                f"Got {len(accounts)} accounts for {len(self.amounts)} weights"
+            )
+        return [
+            Allocation(account=account, amount=amount)
+            for account, amount in zip(accounts, self.amounts)
+        ]
+
+
+def pro_rata(
+        weights: Sequence[int],
+        supply: int,
+        total_weight: Optional[int] = None,
+) -> ProRataAllocation:
+    """
+    Allocates floor(supply * weight / total_weight) to every entry of `weights`.
+    Allocation weights are typically drawn from a small set of values (tier factors,
+    POAP factors) so the wide multiply-divide is evaluated once per distinct weight.
+    :param weights: column of non-negative integer weights
+    :param supply: total amount being distributed
+    :param total_weight: defaults to the sum of `weights`
+    :return: amounts in the same order as `weights` along with the supply
+    """
+    if len(weights) == 0:
+        return ProRataAllocation(amounts=[], supply=supply)
+    if total_weight is None:
+        total_weight = sum(weights)
+    if total_weight <= 0:
+        raise ValueError(f"Can't allocate over non-positive total weight {total_weight}")
+    amount_for_weight = {
+        weight: (supply * weight) // total_weight for weight in set(weights)
+    }
+    return ProRataAllocation(
+        amounts=list(map(amount_for_weight.__getitem__, weights)),
+        supply=supply,
+    )
@@ -0,0 +1,83 @@
+"""
+EIP-55 checksum encoding of ethereum addresses.
+Accounts are kept lower case throughout the project and only checksum encoded
+when written out (see the `checksum_columns` of write_to_csv and write_to_json),
+memoised so that each distinct address is only hashed once.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Iterable
+
+from web3 import Web3
+
+
+class ChecksumEncoder:
+    """
+    Checksum encoder with an LRU cache keyed by the raw 20 byte address.
+    Columns are de-duplicated, so only distinct addresses which are not already
+    cached are hashed (one keccak each).
+    """
+
+    def __init__(self, max_size: int = 2 ** 20):
+        self.max_size = max_size
+        self._cache: OrderedDict[bytes, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def raw_address(address: str) -> bytes:
+        """Parses hex address (with or without 0x prefix) into its 20 raw bytes"""
+        hex_address = address[2:] if address[:2] in ('0x', '0X') else address
+        try:
+            raw = bytes.fromhex(hex_address)
+        except ValueError as err:
+            raise ValueError(f"Invalid address {address}") from err
+        if len(raw) != 20:
+            raise ValueError(f"Invalid address length {address}")
+        return raw
+
+    @staticmethod
+    def _encode(raw: bytes) -> str:
+        hex_address = raw.hex()
+        address_hash = bytes(Web3.keccak(text=hex_address)).hex()
+        return "0x" + "".join(
+            char.upper() if int(hash_char, 16) >= 8 else char
+            for char, hash_char in zip(hex_address, address_hash)
+        )
+
+    def _remember(self, raw: bytes, encoded: str):
+        self._cache[raw] = encoded
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def encode(self, address: str) -> str:
+        """Checksum encodes a single address"""
+        return self.encode_many([address])[0]
+
+    def encode_many(self, addresses: Iterable[str]) -> list[str]:
+        """Checksum encodes a column of addresses (preserving order)"""
+        raw_addresses = [self.raw_address(address) for address in addresses]
+        encoded = {}
+        for raw in set(raw_addresses):
+            cached = self._cache.get(raw)
+            if cached is not None:
+                self._cache.move_to_end(raw)
+                self.hits += 1
+                encoded[raw] = cached
+            else:
+                self.misses += 1
+                encoded[raw] = self._encode(raw)
+                self._remember(raw, encoded[raw])
+        return [encoded[raw] for raw in raw_addresses]
+
+
+CHECKSUM_ENCODER = ChecksumEncoder()
+
+
+def checksum_column(rows: list[dict], column: str) -> list[dict]:
+    """Replaces `column` of each row (in place) by its checksum encoding"""
+    encoded = CHECKSUM_ENCODER.encode_many(row[column] for row in rows)
+    for row, address in zip(rows, encoded):
+        row[column] = address
+    return rows
@@ -0,0 +1,120 @@
+"""
+Persistent store of the code deployed at each address (per network),
+recorded as its length and keccak hash along with the block at which it was checked.
+Shared by all users of EvmAccountInfo, so each address is fetched at most once.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable
+
+from web3 import Web3
+
+from src.constants import FILE_OUT_PATH
+from src.contract_bytecode import proxy_implementation
+from src.utils.file import open_database
+
+# Max number of addresses per lookup query (bound by sqlite's max host parameters)
+LOOKUP_CHUNK_SIZE = 500
+
+
+def code_hash(code: str) -> str:
+    """keccak of hex encoded `code`"""
+    return Web3.keccak(hexstr=code).hex()
+
+
+@dataclass
+class CodeInfo:
+    """Code at `address` as of `block`"""
+    address: str
+    # In bytes, zero for externally owned accounts
+    code_length: int
+    code_hash: str
+    block: int
+    # Address the code delegates to, when it is a known proxy pattern
+    implementation: str = ''
+
+    @classmethod
+    def from_code(cls, address: str, code: str, block: int) -> CodeInfo:
+        """Summary of hex encoded `code` at `address`"""
+        return cls(
+            address=address.lower(),
+            code_length=(len(code) - 2) // 2,
+            code_hash=code_hash(code),
+            block=block,
+            implementation=proxy_implementation(code) or '',
+        )
+
+    def is_contract(self) -> bool:
+        """True if there is code deployed at the address"""
+        return self.code_length > 0
+
+
+class CodeStore:
+    """
+    Code info by network and (lower case) address in sqlite.
+    Merging keeps the most recently checked info of each address.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Shared by the fetching threads (guarded by the lock)
+        self._connection = open_database(
+            path,
+            "code (network TEXT, address TEXT, code_length INTEGER, code_hash TEXT, "
+            "block INTEGER, implementation TEXT, PRIMARY KEY (network, address))"
+        )
+
+    def lookup(
+            self,
+            network: str,
+            addresses: Iterable[str],
+            min_block: int = 0,
+    ) -> dict[str, CodeInfo]:
+        """
+        Bulk lookup of `addresses` on `network`
+        :param min_block: info checked before this block is ignored
+        :return: known code info by (lower case) address
+        """
+        addresses = list({address.lower() for address in addresses})
+        results = {}
+        with self._lock:
+            for start in range(0, len(addresses), LOOKUP_CHUNK_SIZE):
+                chunk = addresses[start:start + LOOKUP_CHUNK_SIZE]
+                rows = self._connection.execute(
+                    "SELECT address, code_length, code_hash, block, implementation FROM code "
+                    f"WHERE network = ? AND block >= ? "
+                    f"AND address IN ({','.join('?' * len(chunk))})",
+                    (network, min_block, *chunk)
+                )
+                for row in rows:
+                    results[row[0]] = CodeInfo(*row)
+        return results
+
+    def merge(self, network: str, infos: Iterable[CodeInfo]):
+        """Stores `infos` of `network` unless more recent info is already known"""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO code VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (network, address) DO UPDATE SET "
+                "code_length = excluded.code_length, code_hash = excluded.code_hash, "
+                "block = excluded.block, implementation = excluded.implementation "
+                "WHERE excluded.block >= code.block",
+                (
+                    (
+                        network, info.address.lower(), info.code_length,
+                        info.code_hash, info.block, info.implementation
+                    )
+                    for info in infos
+                )
+            )
+
+
+@lru_cache(maxsize=None)
+def code_store() -> CodeStore:
+    """Store shared by all code lookups of this process"""
+    return CodeStore(os.path.join(FILE_OUT_PATH, "code-hashes.sqlite"))
@@ -0,0 +1,195 @@
+"""
+Bounded memory sorting of csv records.
+Rows are sorted in chunks which are spilled to temporary csv files and then
+lazily k-way merged, so at most `chunk_size` rows are held in memory at once.
+"""
+from __future__ import annotations
+
+import csv
+import heapq
+import os
+import tempfile
+from contextlib import ExitStack
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+from src.files import File
+
+# Keys are evaluated on csv records, so all values are strings.
+RowKey = Callable[[dict[str, str]], Any]
+Record = TypeVar('Record')
+
+
+def read_csv_rows(infile: File) -> Iterator[dict[str, str]]:
+    """Lazily yields the records of `infile`"""
+    with open(infile.filename(), 'r', encoding='utf-8') as file:
+        yield from csv.DictReader(file)
+
+
+def is_sorted(rows: Iterable[dict[str, str]], key: RowKey, strict: bool = False) -> bool:
+    """
+    :param strict: when True, equal consecutive keys are also considered out of order
+    :return: True if `rows` are in (non-decreasing) order of `key`
+    """
+    previous = None
+    for index, row in enumerate(rows):
+        current = key(row)
+        if index > 0 and (previous > current or (strict and previous == current)):
+            return False
+        previous = current
+    return True
+
+
+def merge_join(
+        left: Iterable[Record],
+        right: Iterable[Record],
+        key: Callable[[Record], Any],
+) -> Iterator[tuple[Optional[Record], Optional[Record]]]:
+    """
+    Sort-merge (full outer) join of two streams ordered by unique `key`.
+    Yields pairs of matching entries, with None on the side without a match.
+    Raises ValueError if either stream is unsorted or contains duplicate keys.
+    """
+    sentinel = None
+    left_iter, right_iter = iter(left), iter(right)
+    left_item, right_item = next(left_iter, sentinel), next(right_iter, sentinel)
+    previous = None
+    while left_item is not sentinel or right_item is not sentinel:
+        if right_item is sentinel or (
+                left_item is not sentinel and key(left_item) < key(right_item)
+        ):
+            pair = left_item, None
+            left_item = next(left_iter, sentinel)
+        elif left_item is sentinel or key(right_item) < key(left_item):
+            pair = None, right_item
+            right_item = next(right_iter, sentinel)
+        else:
+            pair = left_item, right_item
+            left_item, right_item = next(left_iter, sentinel), next(right_iter, sentinel)
+        current = key(pair[0] if pair[0] is not None else pair[1])
+        if previous is not None and current <= previous:
+            raise ValueError(
+                f"Streams must be sorted by unique key: {current} after {previous}"
+            )
+        previous = current
+        yield pair
+
+
+class ExternalSorter:
+    """
+    Accumulates csv records and writes them out in order of `key`.
+    Usable as a context manager to clean up spilled chunks.
+    """
+
+    def __init__(
+            self,
+            fieldnames: list[str],
+            key: RowKey,
+            chunk_size: int = 100_000,
+            temp_dir: Optional[str] = None,
+    ):
+        self.fieldnames = fieldnames
+        self.key = key
+        self.chunk_size = chunk_size
+        self._chunk: list[dict[str, str]] = []
+        self._runs: list[str] = []
+        self._temp_dir = temp_dir
+        self.num_rows = 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def add(self, row: dict[str, str]):
+        """Adds a single record (spilling the current chunk to disk when full)"""
+        self._chunk.append(row)
+        self.num_rows += 1
+        if len(self._chunk) >= self.chunk_size:
+            self._spill()
+
+    def extend(self, rows: Iterable[dict[str, str]]):
+        """Adds all `rows`"""
+        for row in rows:
+            self.add(row)
+
+    def _spill(self):
+        self._chunk.sort(key=self.key)
+        file_descriptor, run_path = tempfile.mkstemp(suffix='.csv', dir=self._temp_dir)
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as run_file:
+            writer = csv.DictWriter(run_file, self.fieldnames, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(self._chunk)
+        self._runs.append(run_path)
+        self._chunk = []
+
+    def sorted_rows(self) -> Iterator[dict[str, str]]:
+        """Yields all records added so far in order of `key`"""
+        self._chunk.sort(key=self.key)
+        if not self._runs:
+            yield from self._chunk
+            return
+        with ExitStack() as stack:
+            runs = [
+                csv.DictReader(stack.enter_context(open(run, 'r', encoding='utf-8')))
+                for run in self._runs
+            ]
+            yield from heapq.merge(*runs, self._chunk, key=self.key)
+
+    def write(self, outfile: File) -> int:
+        """Writes sorted records to `outfile` and returns the number written"""
+        if self.num_rows == 0:
+            print("No data in list, skipping write")
+            return 0
+        print(f"dumping {self.num_rows} results to {outfile.name}")
+        if not os.path.exists(outfile.path):
+            os.makedirs(outfile.path)
+        with open(outfile.filename(), 'w', encoding='utf-8') as out_file:
+            writer = csv.DictWriter(out_file, self.fieldnames, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(self.sorted_rows())
+        return self.num_rows
+
+    def close(self):
+        """Removes spilled chunks"""
+        for run in self._runs:
+            os.remove(run)
+        self._runs = []
+        self._chunk = []
+
+
+def external_sort(
+        infile: File,
+        outfile: File,
+        key: RowKey,
+        chunk_size: int = 100_000,
+) -> int:
+    """
+    Sorts the records of csv `infile` by `key` into `outfile` with bounded memory.
+    :return: number of records written
+    """
+    with open(infile.filename(), 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        with ExternalSorter(list(reader.fieldnames or []), key, chunk_size) as sorter:
+            sorter.extend(reader)
+            return sorter.write(outfile)
+
+
+def sorted_file(
+        infile: File,
+        key: RowKey,
+        temp_dir: str,
+        chunk_size: int = 100_000,
+) -> File:
+    """
+    `infile` if its records are already strictly ordered by `key`,
+    otherwise an externally sorted copy of it in `temp_dir`
+    """
+    if is_sorted(read_csv_rows(infile), key=key, strict=True):
+        return infile
+    outfile = File(name=f"sorted-{infile.name}", path=temp_dir)
+    external_sort(infile, outfile, key, chunk_size)
+    return outfile
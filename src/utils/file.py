@@ -1,18 +1,38 @@
 import csv
+import hashlib
+import json
 import os
+import sqlite3
 from dataclasses import fields, astuple
+from typing import Optional
 
 from src.files import File
 
 
-def write_to_csv(data_list: list, outfile: File):
-    """Writes `data_list` to `filename` as csv"""
+def write_to_csv(
+        data_list: list,
+        outfile: File,
+        checksum_columns: Optional[list[str]] = None,
+):
+    """
+    Writes `data_list` to `filename` as csv
+    :param checksum_columns: address columns to be written with checksum encoding
+    """
     if len(data_list) == 0:
         print("No data in list, skipping write")
         return
     print(f"dumping {len(data_list)} results to {outfile.name}")
     headers = [f.name for f in fields(data_list[0])]
     data_tuple = [astuple(x) for x in data_list]
+    if checksum_columns:
+        # Imported here, so that writers without checksum columns don't load web3.
+        # pylint: disable=import-outside-toplevel
+        from src.utils.checksum import CHECKSUM_ENCODER
+        columns = [list(column) for column in zip(*data_tuple)]
+        for name in checksum_columns:
+            index = headers.index(name)
+            columns[index] = CHECKSUM_ENCODER.encode_many(columns[index])
+        data_tuple = list(zip(*columns))
 
     if not os.path.exists(outfile.path):
         os.makedirs(outfile.path)
@@ -23,7 +43,54 @@ def write_to_csv(data_list: list, outfile: File):
         writer.writerows(data_tuple)
 
 
+def write_to_json(
+        data_list: list[dict],
+        outfile: File,
+        checksum_columns: Optional[list[str]] = None,
+):
+    """
+    Writes `data_list` to `filename` as (indented) json
+    :param checksum_columns: address fields to be written with checksum encoding
+        (`data_list` itself is left unchanged)
+    """
+    print(f"dumping {len(data_list)} results to {outfile.name}")
+    if checksum_columns:
+        # pylint: disable=import-outside-toplevel
+        from src.utils.checksum import checksum_column
+        data_list = [dict(row) for row in data_list]
+        for name in checksum_columns:
+            checksum_column(data_list, name)
+
+    if not os.path.exists(outfile.path):
+        os.makedirs(outfile.path)
+    with open(outfile.filename(), 'w', encoding='utf-8') as out_file:
+        json.dump(data_list, out_file, indent=2)
+
+
 def open_query(filename: str) -> str:
     """Opens `filename` and returns entire file parsed as string"""
     with open(filename, 'r', encoding='utf-8') as query_file:
         return query_file.read()
+
+
+def file_digest(file: File) -> str:
+    """sha256 hex digest of the contents of `file`"""
+    digest = hashlib.sha256()
+    with open(file.filename(), 'rb') as digest_file:
+        for block in iter(lambda: digest_file.read(2 ** 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def open_database(path: str, schema: str) -> sqlite3.Connection:
+    """
+    Opens (creating if needed) the sqlite database at `path` with table `schema`.
+    The connection may be shared by threads, as long as access is serialised.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    with connection:
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {schema}")
+    return connection
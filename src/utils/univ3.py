@@ -4,13 +4,25 @@ https://thegraph.com/hosted-service/subgraph/uniswap/uniswap-v3
 """
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Optional
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, Optional
 
-import requests
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from src.constants import FILE_OUT_PATH
 from src.models import GnoHolder
+from src.utils.file import open_database
 
 # Constants taken from:
 # https://github.com/Uniswap/v3-sdk/blob/c807b04812cecca2b1e32c1c26b508296764a8bc/src/utils/tickMath.ts#L19-L26
@@ -19,44 +31,56 @@ Q96 = 2 ** 96
 MAX_U256 = 2 ** 256 - 1
 MIN_TICK = -887272
 MAX_TICK = -1 * MIN_TICK
+# Positions mostly share a small number of tick boundaries (full range and multiples
+# of the tick spacing), so a bounded cache of sqrt ratios serves nearly all lookups.
+SQRT_RATIO_CACHE_SIZE = 2 ** 16
 
+GRAPH_URL = 'https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3'
+# Maximum number of records returned by the subgraph per query
+PAGE_SIZE = 1000
+MAX_RETRIES = 5
+# Seconds before responses to queries which are not block pinned are fetched again
+QUERY_CACHE_TTL = 60 * 60
+BLOCK_PINNED = re.compile(r"block:\s*{\s*number:\s*\d+\s*}")
+_thread_local = threading.local()
 
-def pool_query(block_number: int, token: str) -> str:
+
+def pool_query(block_number: int, tokens: list[str], last_ids: dict[int, str]) -> str:
     """
-    Constructs and returns Graph query for all pools involving `token` at `block_number`
+    Constructs and returns Graph query for the next page of pools with any of `tokens`
+    as token0 (aliased `pools0`) and as token1 (`pools1`) at `block_number`.
+    Only token indices in `last_ids` are queried, each following its own last pool id.
     Compatible with UniswapV3 subgraph:
     https://thegraph.com/hosted-service/subgraph/uniswap/uniswap-v3
     """
-    return f"""
-    {{
-      pools0: pools(
+    aliases = "".join(
+        f"""
+      pools{index}: pools(
         block: {{ number: {block_number} }}
-        where: {{ token0: \"{token}\" }}
+        where: {{ token{index}_in: {json.dumps(tokens)}, id_gt: \"{last_id}\" }}
+        first: {PAGE_SIZE}
+        orderBy: id
+        orderDirection: asc
       ) {{
         id
-        totalValueLockedToken0
+        token0 {{ id }}
+        token1 {{ id }}
         tick
         sqrtPrice
         liquidity
-      }}
-      pools1: pools(
-        block: {{ number: {block_number} }}
-        where: {{ token1: \"{token}\" }}
-      ) {{
-        id
-        totalValueLockedToken1
-        tick
-        sqrtPrice
-        liquidity
-      }}
+      }}"""
+        for index, last_id in last_ids.items()
+    )
+    return f"""
+    {{{aliases}
     }}
     """
 
 
-def position_query(block_number: int, pool_list: list[str]) -> str:
+def position_query(block_number: int, pool: str, last_id: str = "") -> str:
     """
-    Constructs and returns Graph query for all positions in pools
-    involving `token` at `block_number`. Compatible with UniswapV3 subgraph:
+    Constructs and returns Graph query for the page of open positions in `pool`
+    following `last_id` at `block_number`. Compatible with UniswapV3 subgraph:
     https://thegraph.com/hosted-service/subgraph/uniswap/uniswap-v3
     """
     return f"""
@@ -64,10 +88,15 @@ def position_query(block_number: int, pool_list: list[str]) -> str:
       positions(
         block: {{ number: {block_number} }}
         where: {{
-          pool_in: {json.dumps(pool_list)}
+          pool: \"{pool}\"
           liquidity_gt: "0"
+          id_gt: \"{last_id}\"
         }}
+        first: {PAGE_SIZE}
+        orderBy: id
+        orderDirection: asc
       ) {{
+        id
         owner
         liquidity
         tickLower {{ tickIdx }}
@@ -89,6 +118,16 @@ class Pool:
     sqrt_price: int
     tick: Optional[int]
     queried_token_index: int
+    token0: str = ""
+    token1: str = ""
+
+    def token(self, index: int) -> str:
+        """Address of token{`index`} of the pool"""
+        if index == 0:
+            return self.token0
+        if index == 1:
+            return self.token1
+        raise IndexError(f"Uniswap Pools do not have token index {index}")
 
 
 @dataclass
@@ -175,15 +214,229 @@ class Position:
         )
 
 
-def execute_query(query: str):
+def token_holdings(
+        positions: list[Position],
+        tokens: Iterable[str],
+) -> dict[str, dict[str, int]]:
+    """
+    Amount of each of `tokens` held by the owners of `positions`.
+    Both amount0 and amount1 of every position are attributed
+    to the pool's token0 and token1 respectively, when they are among `tokens`.
+    :return: amount by account for each token (lower case addresses)
+    """
+    results: dict[str, dict[str, int]] = {token.lower(): defaultdict(int) for token in tokens}
+    for token_index in [0, 1]:
+        matching = defaultdict(list)
+        for position in positions:
+            token = position.pool.token(token_index)
+            if token in results:
+                matching[token].append(position)
+        for token, token_positions in matching.items():
+            for account, amount in token_amounts(token_positions, token_index).items():
+                results[token][account] += amount
+    return {token: dict(amounts) for token, amounts in results.items()}
+
+
+def _amount_bounds(
+        pool: Pool,
+        tick_lower: int,
+        tick_upper: int,
+        token_index: int,
+) -> Optional[tuple[int, int]]:
+    """
+    Sqrt ratio bounds (lower, upper) of token{`token_index`} held by positions
+    in `pool` over the tick range, following Position.get_amount_0/get_amount_1.
+    :return: None when these positions hold none of the token
+    """
+    if token_index == 0:
+        if pool.tick < tick_lower:
+            return get_sqrt_ratio_at_tick(tick_lower), get_sqrt_ratio_at_tick(tick_upper)
+        if pool.tick < tick_upper:
+            return pool.sqrt_price, get_sqrt_ratio_at_tick(tick_upper)
+        return None
+    if token_index == 1:
+        if pool.tick < tick_lower:
+            return None
+        if pool.tick < tick_upper:
+            return get_sqrt_ratio_at_tick(tick_lower), pool.sqrt_price
+        return get_sqrt_ratio_at_tick(tick_lower), get_sqrt_ratio_at_tick(tick_upper)
+    raise IndexError(f"Uniswap Pools do not have token index {token_index}")
+
+
+def token_amounts(
+        positions: Iterable[Position],
+        token_index: Optional[int] = None,
+) -> dict[str, int]:
+    """
+    Total token amount held by each owner of `positions`, identical to summing
+    `gno_amount` (or get_amount_0/get_amount_1) of each position.
+    Positions are grouped by pool and tick range: the sqrt ratio bounds are computed
+    once per group, and positions are evaluated and reduced per owner in one pass.
+    :param token_index: token of the pools to evaluate (default: each pool's queried token)
+    :return: amount by account (including owners of positions without any of the token)
+    """
+    # (pool, tick_lower, tick_upper) -> (token index, lower bound, upper bound - lower)
+    groups: dict[tuple[str, int, int], tuple[int, int, int]] = {}
+    totals: dict[str, int] = defaultdict(int)
+    for position in positions:
+        pool = position.pool
+        key = (pool.address, position.tick_lower, position.tick_upper)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _group_constants(
+                pool,
+                position.tick_lower,
+                position.tick_upper,
+                pool.queried_token_index if token_index is None else token_index,
+            )
+        index, sqrt_ratio_a, difference = group
+        # Same operations as get_amount0_delta/get_amount1_delta (without rounding up)
+        if difference == 0:
+            totals[position.account] += 0
+        elif index == 0:
+            totals[position.account] += (
+                ((position.liquidity << 96) * difference) // (sqrt_ratio_a + difference)
+            ) // sqrt_ratio_a
+        else:
+            totals[position.account] += (position.liquidity * difference) // Q96
+    return dict(totals)
+
+
+def _group_constants(
+        pool: Pool,
+        tick_lower: int,
+        tick_upper: int,
+        token_index: int,
+) -> tuple[int, int, int]:
+    """
+    Token index, lower sqrt ratio bound and width of the bounds for positions
+    in `pool` over the tick range (zero width when they hold none of the token)
+    """
+    bounds = _amount_bounds(pool, tick_lower, tick_upper, token_index)
+    if bounds is None:
+        return token_index, 0, 0
+    sqrt_ratio_a, sqrt_ratio_b = sorted(bounds)
+    return token_index, sqrt_ratio_a, sqrt_ratio_b - sqrt_ratio_a
+
+
+def _session() -> Session:
+    """
+    Connection pool of the current thread, retrying requests
+    which are rate limited or fail at the server (with exponential backoff).
+    """
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = Session()
+        retries = Retry(
+            total=MAX_RETRIES,
+            # Unreachable hosts are not worth waiting for
+            connect=2,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # Graph queries are POST requests, which are not retried by default
+            allowed_methods=None,
+        )
+        session.mount('https://', HTTPAdapter(max_retries=retries))
+        _thread_local.session = session
+    return session
+
+
+class QueryCache:
+    """
+    Persistent cache of subgraph responses (zlib compressed JSON in sqlite),
+    keyed by endpoint and normalised query text.
+    Responses to block pinned queries never change, so they never expire.
+    All other responses expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float = QUERY_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Shared by the fetching threads (guarded by the lock)
+        self._connection = open_database(
+            path, "responses (key TEXT PRIMARY KEY, pinned INTEGER, created REAL, body BLOB)"
+        )
+
+    @staticmethod
+    def key(endpoint: str, query: str) -> str:
+        """Cache key of `query` (ignoring whitespace) at `endpoint`"""
+        normalised = " ".join(query.split())
+        return hashlib.sha256(f"{endpoint}\n{normalised}".encode()).hexdigest()
+
+    @staticmethod
+    def is_block_pinned(query: str) -> bool:
+        """True if `query` is evaluated at a fixed block number"""
+        return BLOCK_PINNED.search(query) is not None
+
+    def get(self, endpoint: str, query: str) -> Optional[dict]:
+        """Cached response to `query`, if any (and not expired)"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT pinned, created, body FROM responses WHERE key = ?",
+                (self.key(endpoint, query),)
+            ).fetchone()
+            if row is None or (not row[0] and row[1] + self.ttl < time.time()):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[2]))
+
+    def put(self, endpoint: str, query: str, response: dict):
+        """Stores `response` to `query`"""
+        body = zlib.compress(json.dumps(response, separators=(',', ':')).encode(), 6)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (self.key(endpoint, query), self.is_block_pinned(query), time.time(), body)
+            )
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0
+        return f"subgraph cache: {self.hits}/{lookups} hits ({rate:.1%})"
+
+
+@lru_cache(maxsize=None)
+def query_cache() -> QueryCache:
+    """Cache shared by all subgraph queries of this process"""
+    return QueryCache(os.path.join(FILE_OUT_PATH, "subgraph-cache.sqlite"))
+
+
+def execute_query(query: str, cache: Optional[QueryCache] = None):
     """
     Executes UniswapV3 subgraph queries.
     :param query: Graph QL Query
+    :param cache: response cache (default: query_cache())
     :return: results of the query.
     """
-    graph_url = 'https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3'
-    response = requests.post(graph_url, json={'query': query, 'variables': None})
-    return response.json()
+    cache = cache or query_cache()
+    cached = cache.get(GRAPH_URL, query)
+    if cached is not None:
+        return cached
+    response = _session().post(GRAPH_URL, json={'query': query, 'variables': None})
+    response_json = response.json()
+    if 'errors' in response_json:
+        raise RuntimeError("Subgraph request failed with", response_json)
+    cache.put(GRAPH_URL, query, response_json)
+    return response_json
+
+
+def paginate(query: Callable[[str], str], entity: str) -> Iterator[dict]:
+    """
+    Yields all `entity` records of a subgraph query page by page.
+    :param query: constructs the query for the page of records following id `last_id`
+        (records must be ordered by id and include it)
+    """
+    last_id = ""
+    while True:
+        page = execute_query(query(last_id))['data'][entity]
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        last_id = page[-1]['id']
 
 
 def get_amount0_delta(
@@ -226,6 +479,7 @@ def get_amount1_delta(
 
 
 # pylint: disable=too-many-branches
+@lru_cache(maxsize=SQRT_RATIO_CACHE_SIZE)
 def get_sqrt_ratio_at_tick(tick: int) -> int:
     """
     Function transcribed from UniswapV3 SDK:
@@ -285,6 +539,21 @@ def get_sqrt_ratio_at_tick(tick: int) -> int:
     return ratio // Q32
 
 
+def precompute_sqrt_ratios(positions: Iterable[Position]) -> int:
+    """
+    Evaluates (and caches) the sqrt ratio at every tick boundary of `positions`
+    up front, e.g. for all positions of a pool before computing their amounts.
+    :return: number of distinct ticks
+    """
+    ticks = set()
+    for position in positions:
+        ticks.add(position.tick_lower)
+        ticks.add(position.tick_upper)
+    for tick in ticks:
+        get_sqrt_ratio_at_tick(tick)
+    return len(ticks)
+
+
 def mul_shift(val: int, mul_by: int) -> int:
     """Multiplication followed by bit shift"""
     return (val * mul_by) >> 128
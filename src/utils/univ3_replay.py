@@ -0,0 +1,289 @@
+"""
+Network free source of UniswapV3 Pools and Positions at any block,
+replayed from a local file of pool and NonfungiblePositionManager events.
+
+The event file contains one JSON object per line, ordered by (block, log_index):
+  Initialize:        pool, token0, token1, sqrt_price, tick
+  Swap:              pool, sqrt_price, tick, liquidity
+  Mint / Burn:       pool, owner, tick_lower, tick_upper, amount
+  IncreaseLiquidity: token_id, liquidity, pool, tick_lower, tick_upper
+  DecreaseLiquidity: token_id, liquidity
+  Transfer:          token_id, to  (position NFT transfers, including mints)
+all with `type`, `block` and `log_index`. Integer values may be strings.
+Pool Mint/Burn events of the position manager only change the pool's active
+liquidity, the corresponding NFT positions are tracked by token id.
+Collect events don't change liquidity and are ignored.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import tempfile
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Optional
+
+from src.files import File
+from src.utils.univ3 import Pool, Position
+
+NONFUNGIBLE_POSITION_MANAGER = "0xc36442b4a4522e871399cd717abdd847ab11fe88"
+
+
+@dataclass
+class PoolState:
+    """Replayed state of a single pool"""
+    address: str
+    token0: str
+    token1: str
+    sqrt_price: int
+    tick: int
+    # Liquidity of positions in range of the current tick
+    liquidity: int = 0
+
+    def in_range(self, tick_lower: int, tick_upper: int) -> bool:
+        """True if positions over the tick range are active at the current tick"""
+        return tick_lower <= self.tick < tick_upper
+
+
+@dataclass
+class PositionState:
+    """Replayed state of a single position"""
+    owner: str
+    pool: str
+    tick_lower: int
+    tick_upper: int
+    liquidity: int = 0
+
+
+@dataclass
+class ReplayState:
+    """Pools and positions after all events up to (but excluding) `next_block`"""
+    next_block: int = 0
+    pools: dict[str, PoolState] = field(default_factory=dict)
+    # NFT positions by token id, others by pool, owner and tick range
+    positions: dict[str, PositionState] = field(default_factory=dict)
+
+    def save(self, filename: str):
+        """Writes the state to a gzipped JSON file (integers as strings)"""
+        with gzip.open(filename, 'wt', encoding='utf-8') as file:
+            json.dump({
+                'next_block': self.next_block,
+                'pools': {key: {**asdict(pool), 'sqrt_price': str(pool.sqrt_price),
+                                'liquidity': str(pool.liquidity)}
+                          for key, pool in self.pools.items()},
+                'positions': {key: {**asdict(position), 'liquidity': str(position.liquidity)}
+                              for key, position in self.positions.items()},
+            }, file)
+
+    @classmethod
+    def load(cls, filename: str) -> ReplayState:
+        """Reads a state written by `save`"""
+        with gzip.open(filename, 'rt', encoding='utf-8') as file:
+            data = json.load(file)
+        return cls(
+            next_block=data['next_block'],
+            pools={key: PoolState(**{**pool, 'sqrt_price': int(pool['sqrt_price']),
+                                     'liquidity': int(pool['liquidity'])})
+                   for key, pool in data['pools'].items()},
+            positions={key: PositionState(**{**position,
+                                             'liquidity': int(position['liquidity'])})
+                       for key, position in data['positions'].items()},
+        )
+
+    def _update_pool_liquidity(self, event: dict, sign: int):
+        pool = self.pools[event['pool'].lower()]
+        if pool.in_range(int(event['tick_lower']), int(event['tick_upper'])):
+            pool.liquidity += sign * int(event['amount'])
+
+    def _update_position(self, key: str, event: dict, amount: int):
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = PositionState(
+                owner=event.get('owner', '').lower(),
+                pool=event['pool'].lower(),
+                tick_lower=int(event['tick_lower']),
+                tick_upper=int(event['tick_upper']),
+            )
+        elif 'pool' in event and not position.pool:
+            # Token transferred (minted) before its liquidity was added
+            position.pool = event['pool'].lower()
+            position.tick_lower = int(event['tick_lower'])
+            position.tick_upper = int(event['tick_upper'])
+        position.liquidity += amount
+        if position.liquidity < 0:
+            raise ValueError(f"Negative liquidity for position {key} after {event}")
+
+    def apply(self, event: dict):
+        """Applies a single event"""
+        event_type = event['type']
+        if event_type == 'Initialize':
+            address = event['pool'].lower()
+            self.pools[address] = PoolState(
+                address=address,
+                token0=event['token0'].lower(),
+                token1=event['token1'].lower(),
+                sqrt_price=int(event['sqrt_price']),
+                tick=int(event['tick']),
+            )
+        elif event_type == 'Swap':
+            pool = self.pools[event['pool'].lower()]
+            pool.sqrt_price = int(event['sqrt_price'])
+            pool.tick = int(event['tick'])
+            pool.liquidity = int(event['liquidity'])
+        elif event_type in ('Mint', 'Burn'):
+            sign = 1 if event_type == 'Mint' else -1
+            self._update_pool_liquidity(event, sign)
+            owner = event['owner'].lower()
+            if owner != NONFUNGIBLE_POSITION_MANAGER:
+                key = f"{event['pool'].lower()}:{owner}:" \
+                      f"{event['tick_lower']}:{event['tick_upper']}"
+                self._update_position(key, event, sign * int(event['amount']))
+        elif event_type == 'IncreaseLiquidity':
+            self._update_position(f"nft:{event['token_id']}", event, int(event['liquidity']))
+        elif event_type == 'DecreaseLiquidity':
+            self._update_position(f"nft:{event['token_id']}", event, -int(event['liquidity']))
+        elif event_type == 'Transfer':
+            key = f"nft:{event['token_id']}"
+            position = self.positions.get(key)
+            if position is None:
+                self.positions[key] = PositionState(
+                    owner=event['to'].lower(), pool='', tick_lower=0, tick_upper=0
+                )
+            else:
+                position.owner = event['to'].lower()
+
+
+@dataclass
+class Checkpoint:
+    """
+    State before the first event of `block` (or later), saved to `filename`,
+    and that event's file offset
+    """
+    block: int
+    offset: int
+    filename: str
+
+
+class UniV3Replay:
+    """
+    Replays a local event file to answer Pool and Position queries at any block.
+    Checkpoints of the full state are taken every `checkpoint_interval` blocks during
+    a single indexing pass, so each query only replays the events since the
+    nearest checkpoint. Checkpoint states are kept on disk in `checkpoint_path`
+    (a temporary directory removed by `close` unless given), only their block
+    and event file offset are held in memory.
+    """
+
+    def __init__(
+            self,
+            events: File,
+            checkpoint_interval: int = 10_000,
+            checkpoint_path: Optional[str] = None,
+    ):
+        self.events = events
+        self.checkpoint_interval = checkpoint_interval
+        self._temp_dir = None
+        if checkpoint_path is None:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix='univ3-replay-')
+            checkpoint_path = self._temp_dir.name
+        os.makedirs(checkpoint_path, exist_ok=True)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints: list[Checkpoint] = []
+        self._index()
+
+    def __enter__(self) -> UniV3Replay:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Removes the checkpoint files if they are in a temporary directory"""
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    def _checkpoint(self, block: int, offset: int, state: ReplayState) -> Checkpoint:
+        filename = os.path.join(self.checkpoint_path, f"checkpoint-{block}.json.gz")
+        state.save(filename)
+        return Checkpoint(block, offset, filename)
+
+    def _read(self, offset: int = 0) -> Iterable[tuple[int, dict]]:
+        """Yields (file offset, event) of all events starting at `offset`"""
+        with open(self.events.filename(), 'rb') as event_file:
+            event_file.seek(offset)
+            while True:
+                position = event_file.tell()
+                line = event_file.readline()
+                if not line:
+                    return
+                if line.strip():
+                    yield position, json.loads(line)
+
+    def _index(self):
+        state = ReplayState()
+        self.checkpoints = [self._checkpoint(0, 0, state)]
+        next_checkpoint = self.checkpoint_interval
+        previous = (-1, -1)
+        for offset, event in self._read():
+            order = (int(event['block']), int(event['log_index']))
+            if order <= previous:
+                raise ValueError(f"Events must be ordered by block and log index: {event}")
+            previous = order
+            if order[0] >= next_checkpoint:
+                state.next_block = order[0]
+                self.checkpoints.append(self._checkpoint(order[0], offset, state))
+                next_checkpoint = (order[0] // self.checkpoint_interval + 1) \
+                    * self.checkpoint_interval
+            state.apply(event)
+        print(f"indexed {self.events.name} with {len(self.checkpoints)} checkpoints")
+
+    def state_at(self, block_number: int) -> ReplayState:
+        """State after all events up to and including `block_number`"""
+        index = bisect_right([c.block for c in self.checkpoints], block_number) - 1
+        checkpoint = self.checkpoints[index]
+        state = ReplayState.load(checkpoint.filename)
+        for _, event in self._read(checkpoint.offset):
+            if int(event['block']) > block_number:
+                break
+            state.apply(event)
+        state.next_block = block_number + 1
+        return state
+
+    def positions(
+            self,
+            block_number: int,
+            tokens: list[str],
+            state: Optional[ReplayState] = None,
+    ) -> list[Position]:
+        """
+        Open positions in pools involving any of `tokens` at `block_number`,
+        as fetched from the subgraph (see fetch_token_pools and fetch_positions).
+        """
+        state = state or self.state_at(block_number)
+        tokens = {token.lower() for token in tokens}
+        pools = {}
+        for address, pool in state.pools.items():
+            if pool.token0 in tokens or pool.token1 in tokens:
+                pools[address] = Pool(
+                    address=address,
+                    liquidity=pool.liquidity,
+                    sqrt_price=pool.sqrt_price,
+                    tick=pool.tick,
+                    queried_token_index=0 if pool.token0 in tokens else 1,
+                    token0=pool.token0,
+                    token1=pool.token1,
+                )
+        return [
+            Position(
+                account=position.owner,
+                liquidity=position.liquidity,
+                tick_lower=position.tick_lower,
+                tick_upper=position.tick_upper,
+                pool=pools[position.pool],
+                token=pools[position.pool].token(pools[position.pool].queried_token_index),
+            )
+            for position in state.positions.values()
+            if position.liquidity > 0 and position.pool in pools
+        ]
@@ -0,0 +1,59 @@
+import unittest
+
+from src.constants import GNO_HOLDER_ALLOCATION, TRADING_TIER_FACTORS
+from src.models import Allocation
+from src.utils.allocation import pro_rata
+
+
+class TestProRata(unittest.TestCase):
+    def test_matches_individual_floor_division(self):
+        weights = [10 ** 25 + 7, 3 * 10 ** 21, 1, 0, 3 * 10 ** 21, 123456789]
+        total = sum(weights)
+        result = pro_rata(weights, supply=GNO_HOLDER_ALLOCATION)
+        self.assertEqual(
+            result.amounts,
+            [(GNO_HOLDER_ALLOCATION * w) // total for w in weights]
+        )
+        self.assertEqual(
+            result.unallocated,
+            GNO_HOLDER_ALLOCATION - sum(result.amounts)
+        )
+        self.assertGreaterEqual(result.unallocated, 0)
+
+    def test_explicit_total_weight(self):
+        result = pro_rata([1, 3, 3], supply=100, total_weight=10)
+        self.assertEqual(result.amounts, [10, 30, 30])
+        self.assertEqual(result.unallocated, 30)
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(pro_rata([], supply=100).amounts, [])
+        self.assertEqual(pro_rata([], supply=100).unallocated, 100)
+        with self.assertRaises(ValueError):
+            pro_rata([0, 0], supply=100)
+
+    def test_to_allocations(self):
+        result = pro_rata([1, 1, 1], supply=10)
+        self.assertEqual(
+            result.to_allocations(["0x1", "0x2", "0x3"]),
+            [Allocation("0x1", 3), Allocation("0x2", 3), Allocation("0x3", 3)]
+        )
+        with self.assertRaises(ValueError):
+            result.to_allocations(["0x1", "0x2", "0x3", "0x4"])
+        with self.assertRaises(ValueError):
+            result.to_allocations(["0x1", "0x2"])
+
+    def test_tier_factor_weights(self):
+        # Primary trader allocations: supply split by tier factor over the total weight.
+        factors = [TRADING_TIER_FACTORS[tier] for tier in [0, 0, 5]]
+        total_weight = sum(factors)
+        result = pro_rata(factors, supply=100, total_weight=total_weight)
+        self.assertEqual(
+            result.amounts,
+            [(100 * factor) // total_weight for factor in factors]
+        )
+        # Consolation allocations: an equal share per recipient.
+        self.assertEqual(pro_rata([1] * 7, supply=100).amounts, [100 // 7] * 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from src.constants import SNAPSHOT_BLOCK_NUMBER, GNO_TOKEN
+from src.fetch.combined_holders import load_excluded_accounts, _exclusion_key, \
+    apply_contributions, CombinedGnoHolder, CombinedGnoHolderBlob, CombinedHolderRefresh, \
+    VerboseNetworkHolderData, stream_master_holder_data, merge_network_totals, \
+    generate_combined_holders
+from src.files import File, HolderFiles, NetworkFile
+from src.generate import holder_allocation
+from src.utils.file import write_to_csv
+
+
+class TestExcludedAccounts(unittest.TestCase):
+    def test_persisted_artifact_is_reused(self):
+        block_number = int(SNAPSHOT_BLOCK_NUMBER['mainnet'])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            artifact = os.path.join(
+                temp_dir,
+                f"excluded-accounts-{block_number}-{_exclusion_key(block_number)}.csv"
+            )
+            with open(artifact, 'w', encoding='utf-8') as file:
+                file.write("account\n0x1\n0x2\n")
+
+            # No network access required when the artifact exists.
+            excluded = load_excluded_accounts(cache_path=temp_dir)
+            self.assertEqual(excluded, {"0x1", "0x2"})
+
+            # Callers receive copies of the memoised set.
+            excluded.add("0x3")
+            os.remove(artifact)
+            self.assertEqual(load_excluded_accounts(cache_path=temp_dir), {"0x1", "0x2"})
+
+    def test_fetched_and_persisted_when_artifact_missing(self):
+        pool = '0x00000000000000000000000000000000000000aa'
+
+        def fake_subgraph(query: str) -> dict:
+            self.assertIn(GNO_TOKEN['mainnet'].lower(), query)
+            pool_record = {
+                'id': pool,
+                'token0': {'id': GNO_TOKEN['mainnet'].lower()},
+                'token1': {'id': '0x00000000000000000000000000000000000000bb'},
+                'tick': '0',
+                'sqrtPrice': str(2 ** 96),
+                'liquidity': '1',
+            }
+            return {'data': {'pools0': [pool_record], 'pools1': []}}
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('src.fetch.univ3_gno.execute_query', side_effect=fake_subgraph) as query:
+            excluded = load_excluded_accounts(cache_path=temp_dir)
+            query.assert_called()
+            self.assertIn(pool, excluded)
+
+            # The fetched accounts are persisted for the next run.
+            block_number = int(SNAPSHOT_BLOCK_NUMBER['mainnet'])
+            artifact = File(
+                name=f"excluded-accounts-{block_number}-{_exclusion_key(block_number)}.csv",
+                path=temp_dir
+            )
+            self.assertEqual(artifact.get_accounts_from(), excluded)
+
+
+class TestIncrementalRefresh(unittest.TestCase):
+    def setUp(self) -> None:
+        self.gchain = {
+            '0x1': VerboseNetworkHolderData('0x1', 'gchain', gno_held=5, lp_gno=0, staked_gno=10),
+            '0x2': VerboseNetworkHolderData('0x2', 'gchain', gno_held=0, lp_gno=0, staked_gno=3),
+            '0x3': VerboseNetworkHolderData('0x3', 'gchain', gno_held=7, lp_gno=0),
+        }
+        self.mainnet = {
+            '0x2': VerboseNetworkHolderData('0x2', 'mainnet', gno_held=20, lp_gno=0),
+        }
+        self.blob = CombinedGnoHolderBlob(mainnet=self.mainnet, gchain=self.gchain)
+        self.holders = [
+            self.blob.combined_holder(account) for account in ['0x2', '0x1', '0x3']
+        ]
+
+    def test_apply_contributions(self):
+        affected = apply_contributions(
+            self.gchain, 'gchain', {'staked_gno': {'0x1': 10, '0x3': 1, '0x4': 2}}
+        )
+        # 0x1 unchanged, 0x2 stopped staking, 0x3 and 0x4 started.
+        self.assertEqual(affected, {'0x2', '0x3', '0x4'})
+        # 0x2 has nothing left on gchain
+        self.assertNotIn('0x2', self.gchain)
+        self.assertEqual(self.gchain['0x3'].total_gno, 8)
+        self.assertEqual(self.gchain['0x4'].total_gno, 2)
+        self.assertEqual(self.gchain['0x1'].gno_held, 5)
+
+    def test_update_master_holder_data(self):
+        affected = apply_contributions(
+            self.gchain, 'gchain', {'staked_gno': {'0x1': 10, '0x3': 1, '0x4': 2}}
+        )
+        holders, supply_change = self.blob.update_master_holder_data(
+            holders=self.holders,
+            affected_accounts=affected,
+            min_gno=2,
+            excluded_accounts={'0x4'},
+        )
+        self.assertEqual(holders, [
+            CombinedGnoHolder('0x2', mainnet_gno=20, gchain_gno=0),
+            CombinedGnoHolder('0x1', mainnet_gno=0, gchain_gno=15),
+            CombinedGnoHolder('0x3', mainnet_gno=0, gchain_gno=8),
+        ])
+        self.assertEqual(supply_change, -3 + 1)
+        self.assertEqual(
+            sum(h.total_gno for h in self.holders) + supply_change,
+            sum(h.total_gno for h in holders)
+        )
+
+
+    def test_refresh_allocations(self):
+        refresh = CombinedHolderRefresh(
+            holders=self.holders,
+            supply=sum(h.total_gno for h in self.holders),
+            affected_accounts={'0x1'},
+        )
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.object(holder_allocation, 'refresh_combined_holders',
+                             return_value=refresh), \
+                patch.object(holder_allocation, 'allocate_to_holders',
+                             wraps=holder_allocation.allocate_to_holders) as allocate:
+            load_from = SimpleNamespace(
+                holder_data=HolderFiles(),
+                holder_allocation=File('allocations-holder.csv', path=temp_dir),
+            )
+            allocations = holder_allocation.refresh_allocations(None, load_from)
+            self.assertEqual(set(allocations.data), {'0x1', '0x2', '0x3'})
+            self.assertEqual(allocate.call_count, 1)
+
+            # Without changed holders, the written allocations are reused.
+            refresh.affected_accounts = set()
+            reused = holder_allocation.refresh_allocations(None, load_from)
+            self.assertEqual(allocate.call_count, 1)
+            self.assertEqual(
+                {account: a.amount for account, a in reused.data.items()},
+                {account: a.amount for account, a in allocations.data.items()},
+            )
+
+
+class TestStreamMasterHolderData(unittest.TestCase):
+    def setUp(self) -> None:
+        self.networks = {
+            'mainnet': {
+                f'0x{i:02x}': VerboseNetworkHolderData(f'0x{i:02x}', 'mainnet', i, i % 3)
+                for i in range(0, 60, 2)
+            },
+            'gchain': {
+                f'0x{i:02x}': VerboseNetworkHolderData(
+                    f'0x{i:02x}', 'gchain', i % 5, 0, staked_gno=i % 7
+                )
+                for i in range(0, 60, 3)
+            },
+        }
+        self.excluded = {'0x06', '0x07', '0x08'}
+        blob = CombinedGnoHolderBlob(**self.networks)
+        self.expected = sorted(
+            (
+                holder for holder in map(blob.combined_holder, blob.account_set())
+                if holder.total_gno >= 10 and holder.account not in self.excluded
+            ),
+            key=lambda t: (-t.total_gno, t.account)
+        )
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.load_from = HolderFiles()
+        self.load_from.network_master = NetworkFile("holders-master.csv", path=self.temp_dir.name)
+        self.load_from.combined = File("combined-holders.csv", path=self.temp_dir.name)
+        for network, holders in self.networks.items():
+            # Network master files are written by total GNO, not by account.
+            write_to_csv(
+                sorted(holders.values(), key=lambda t: (-t.total_gno, t.account)),
+                self.load_from.network_master.filename(network),
+            )
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_streamed_master_holder_data(self):
+        supply = stream_master_holder_data(
+            self.load_from, min_gno=10, excluded_accounts=self.excluded, chunk_size=4
+        )
+        self.assertEqual(CombinedGnoHolder.load_from(self.load_from.combined), self.expected)
+        self.assertEqual(supply, sum(holder.total_gno for holder in self.expected))
+
+    def test_generate_combined_holders(self):
+        # Network master files are already built, only the merge remains.
+        with patch('src.fetch.combined_holders.build_network_holders') as build, \
+                patch('src.fetch.combined_holders.load_excluded_accounts',
+                      return_value=self.excluded), \
+                patch('src.fetch.combined_holders.MIN_GNO', 10):
+            self.assertEqual(generate_combined_holders(None, self.load_from), self.expected)
+            self.assertEqual(build.call_count, 1)
+            # Loaded from the combined holders file once written
+            self.assertEqual(generate_combined_holders(None, self.load_from), self.expected)
+            self.assertEqual(build.call_count, 1)
+
+    def test_merge_network_totals(self):
+        self.assertEqual(
+            list(merge_network_totals([('0x1', 1), ('0x3', 3)], [('0x2', 2), ('0x3', 4)])),
+            [
+                CombinedGnoHolder('0x1', 1, 0),
+                CombinedGnoHolder('0x2', 0, 2),
+                CombinedGnoHolder('0x3', 3, 4),
+            ]
+        )
+        with self.assertRaises(ValueError):
+            list(merge_network_totals([('0x1', 1), ('0x1', 2)], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
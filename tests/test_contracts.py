@@ -0,0 +1,313 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src.fetch.contracts import AdaptiveBatchSize, EvmAccountInfo, MAX_ATTEMPTS
+from src.files import File, NetworkFile
+from src.utils.code_store import CodeInfo, CodeStore
+
+
+class FakeNode:
+    """Answers eth_getCode batches, rejecting those larger than `batch_limit`"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, batch_limit: int, codes=None, fail_once=(), rate_limit_every=0,
+                 block_failures=0):
+        self.batch_limit = batch_limit
+        self.codes = codes or {}
+        # Addresses whose first request fails
+        self.fail_once = set(fail_once)
+        # Every n-th batch is answered with status code 429
+        self.rate_limit_every = rate_limit_every
+        # Number of eth_blockNumber requests answered with status code 429
+        self.block_failures = block_failures
+        self.block_requests = 0
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def post(self, _url, json, timeout):
+        response = MagicMock()
+        if json[0]['method'] == 'eth_blockNumber':
+            with self.lock:
+                self.block_requests += 1
+                failing = self.block_requests <= self.block_failures
+            response.status_code = 429 if failing else 200
+            response.headers = {}
+            response.json.return_value = [{"jsonrpc": "2.0", "id": 0, "result": "0x10"}]
+            return response
+        with self.lock:
+            self.batch_sizes.append(len(json))
+            rate_limited = self.rate_limit_every \
+                and len(self.batch_sizes) % self.rate_limit_every == 0
+            failing = {
+                request['params'][0] for request in json if request['params'][0] in self.fail_once
+            }
+            self.fail_once -= failing
+        if rate_limited:
+            response.status_code = 429
+            response.headers = {'Retry-After': '0'}
+            return response
+        if len(json) > self.batch_limit:
+            response.status_code = 413
+            return response
+        response.status_code = 200
+        response.json.return_value = [
+            {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32005, "message": "rate limit exceeded"}
+            } if request['params'][0] in failing else {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "result": self.codes.get(request['params'][0], f"0x{request['params'][0][-2:]}")
+            }
+            for request in json
+        ]
+        return response
+
+
+def http_response(status_code: int, content: bytes) -> requests.Response:
+    """Response as received from a node (or a proxy in front of it)"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content  # pylint: disable=protected-access
+    return response
+
+
+class TestAdaptiveBatchSize(unittest.TestCase):
+    def test_grows_and_shrinks(self):
+        batch_size = AdaptiveBatchSize(initial=100, maximum=200, target_latency=1.0)
+        batch_size.succeeded(100, 0.1)
+        self.assertEqual(batch_size.size, 150)
+        # slow batches and smaller (stale) batches don't grow the size
+        batch_size.succeeded(150, 5.0)
+        batch_size.succeeded(10, 0.1)
+        self.assertEqual(batch_size.size, 150)
+        batch_size.succeeded(150, 0.1)
+        self.assertEqual(batch_size.size, 200)
+        batch_size.rejected(200)
+        self.assertEqual(batch_size.size, 100)
+        # later rejections of already shrunk batches don't shrink further
+        batch_size.rejected(200)
+        self.assertEqual(batch_size.size, 100)
+
+
+class TestBatchCall(unittest.TestCase):
+    def setUp(self) -> None:
+        self.addresses = [f"0x{i:040x}" for i in range(1000)]
+        self.expected = {address: f"0x{address[-2:]}" for address in self.addresses}
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = CodeStore(os.path.join(self.temp_dir.name, "code.sqlite"))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_results_independent_of_batching(self):
+        node = FakeNode(batch_limit=37)
+        session = MagicMock()
+        session.post.side_effect = node.post
+        account_info = EvmAccountInfo(
+            "node", self.addresses, "mainnet", max_workers=4, store=self.store
+        )
+        with patch('src.fetch.contracts._session', return_value=session):
+            results = account_info.batch_call(self.addresses, account_info._get_code_at)
+
+        self.assertEqual(results, self.expected)
+        self.assertEqual(list(results), self.addresses)
+        self.assertLessEqual(max(node.batch_sizes), 100)
+        # after shrinking below the limit, batches no longer fail
+        self.assertLess(node.batch_sizes.count(100), 10)
+
+    def test_single_address_rejection_raises(self):
+        node = FakeNode(batch_limit=0)
+        session = MagicMock()
+        session.post.side_effect = node.post
+        account_info = EvmAccountInfo("node", self.addresses[:10], "mainnet", store=self.store)
+        with patch('src.fetch.contracts._session', return_value=session), \
+                patch('src.fetch.contracts.RETRY_BACKOFF', 0):
+            with self.assertRaises(IOError):
+                account_info.batch_call(self.addresses[:10], account_info._get_code_at)
+
+    def test_invalid_params_raise(self):
+        session = MagicMock()
+        session.post.return_value.status_code = 200
+        session.post.return_value.json.return_value = [
+            {"jsonrpc": "2.0", "id": 0, "error": {"code": -32602, "message": "invalid argument"}}
+        ]
+        account_info = EvmAccountInfo("node", ["Bad Input"], "mainnet", store=self.store)
+        with patch('src.fetch.contracts._session', return_value=session):
+            with self.assertRaises(IOError):
+                account_info.batch_call(["Bad Input"], account_info._get_code_at)
+        self.assertEqual(session.post.call_count, 1)
+
+    def test_non_json_responses(self):
+        error_page = b'<html><body><h1>502 Bad Gateway</h1></body></html>'
+        node = FakeNode(batch_limit=1000)
+        responses = [http_response(502, error_page), http_response(200, error_page)]
+        session = MagicMock()
+        session.post.side_effect = \
+            lambda *args, **kwargs: responses.pop(0) if responses else node.post(*args, **kwargs)
+        account_info = EvmAccountInfo("node", self.addresses[:10], "mainnet", store=self.store)
+        with patch('src.fetch.contracts._session', return_value=session), \
+                patch('src.fetch.contracts.RETRY_BACKOFF', 0):
+            results = account_info.batch_call(self.addresses[:10], account_info._get_code_at)
+            self.assertEqual(results, {a: self.expected[a] for a in self.addresses[:10]})
+
+            # Retried up to the retry budget
+            session.post.side_effect = None
+            session.post.return_value = http_response(200, error_page)
+            with self.assertRaisesRegex(IOError, "Bad Gateway"):
+                account_info.batch_call(self.addresses[:1], account_info._get_code_at)
+            self.assertEqual(session.post.call_count, 2 + len(node.batch_sizes) + MAX_ATTEMPTS)
+
+    def test_client_error_raises(self):
+        session = MagicMock()
+        session.post.return_value = http_response(403, b'Forbidden: invalid API key')
+        account_info = EvmAccountInfo("node", self.addresses[:10], "mainnet", store=self.store)
+        with patch('src.fetch.contracts._session', return_value=session):
+            with self.assertRaisesRegex(IOError, "status code 403: Forbidden: invalid API key"):
+                account_info.batch_call(self.addresses[:10], account_info._get_code_at)
+        self.assertEqual(session.post.call_count, 1)
+
+    def test_partial_failures_retried(self):
+        node = FakeNode(batch_limit=1000, fail_once=self.addresses[::7], rate_limit_every=5)
+        session = MagicMock()
+        session.post.side_effect = node.post
+        account_info = EvmAccountInfo("node", self.addresses, "mainnet", store=self.store)
+        with patch('src.fetch.contracts._session', return_value=session), \
+                patch('src.fetch.contracts.RETRY_BACKOFF', 0):
+            results = account_info.batch_call(self.addresses, account_info._get_code_at)
+
+        self.assertEqual(results, self.expected)
+        self.assertEqual(node.fail_once, set())
+
+    def test_resume_from_checkpoint(self):
+        node = FakeNode(batch_limit=1000)
+        session = MagicMock()
+        session.post.side_effect = node.post
+        account_info = EvmAccountInfo(
+            "node", self.addresses, "mainnet", max_workers=1, store=self.store
+        )
+        checkpoint = File("checkpoint.jsonl", path=self.temp_dir.name)
+        calls = []
+
+        def interrupted(batch):
+            calls.append(batch)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return account_info._get_code_at(batch)
+
+        with patch('src.fetch.contracts._session', return_value=session):
+            with self.assertRaises(KeyboardInterrupt):
+                account_info.batch_call(self.addresses, interrupted, checkpoint)
+            self.assertTrue(os.path.exists(checkpoint.filename()))
+            results = account_info.batch_call(
+                self.addresses, account_info._get_code_at, checkpoint
+            )
+
+        self.assertEqual(results, self.expected)
+        # Only the two batches completed before the interruption are skipped
+        self.assertEqual(sum(node.batch_sizes), len(self.addresses))
+        self.assertFalse(os.path.exists(checkpoint.filename()))
+
+
+class TestCodeStore(unittest.TestCase):
+    def test_lookup_and_merge(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = CodeStore(os.path.join(temp_dir, "code.sqlite"))
+            store.merge('mainnet', [
+                CodeInfo.from_code('0xA', '0x6001', 10),
+                CodeInfo.from_code('0xb', '0x', 10),
+            ])
+            # older info doesn't replace newer info
+            store.merge('mainnet', [CodeInfo.from_code('0xa', '0x', 5)])
+            store.merge('gchain', [CodeInfo.from_code('0xa', '0x', 5)])
+
+            known = store.lookup('mainnet', ['0xa', '0xB', '0xc'])
+            self.assertEqual(set(known), {'0xa', '0xb'})
+            self.assertEqual(known['0xa'].code_length, 2)
+            self.assertTrue(known['0xa'].is_contract())
+            self.assertFalse(known['0xb'].is_contract())
+            self.assertEqual(
+                known['0xb'].code_hash,
+                "0xc5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"
+            )
+            self.assertFalse(store.lookup('gchain', ['0xa'])['0xa'].is_contract())
+            self.assertEqual(store.lookup('mainnet', ['0xa'], min_block=11), {})
+
+    def test_code_fetched_once(self):
+        addresses = [f"0x{i:040x}" for i in range(300)]
+        node = FakeNode(batch_limit=1000)
+        session = MagicMock()
+        session.post.side_effect = node.post
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('src.fetch.contracts._session', return_value=session):
+            store = CodeStore(os.path.join(temp_dir, "code.sqlite"))
+            first = EvmAccountInfo("node", addresses[:200], "mainnet", store=store)
+            first.code_info(first.addresses)
+            second = EvmAccountInfo("node", addresses, "mainnet", store=store)
+            infos = second.code_info(second.addresses)
+
+        self.assertEqual(sum(node.batch_sizes), 300)
+        self.assertEqual(set(infos), set(addresses))
+        self.assertEqual({info.block for info in infos.values()}, {16})
+        self.assertTrue(all(info.code_length == 1 for info in infos.values()))
+
+    def test_block_resolved_once_with_retries(self):
+        addresses = [f"0x{i:040x}" for i in range(1000)]
+        node = FakeNode(batch_limit=1000, block_failures=2)
+        session = MagicMock()
+        session.post.side_effect = node.post
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('src.fetch.contracts._session', return_value=session), \
+                patch('src.fetch.contracts.RETRY_BACKOFF', 0):
+            account_info = EvmAccountInfo(
+                "node", addresses, "mainnet", max_workers=4,
+                store=CodeStore(os.path.join(temp_dir, "code.sqlite"))
+            )
+            infos = account_info.code_info(account_info.addresses)
+
+        # Two rate limited attempts and a single successful one, before any code batch.
+        self.assertEqual(node.block_requests, 3)
+        self.assertEqual({info.block for info in infos.values()}, {16})
+
+
+SAFE_PROXY = "0x608060405273ffffffffffffffffffffffffffffffffffffffff600054163660008037600080366000845af43d6000803e6000811415603d573d6000fd5b3d6000f3fea165627a7a723058201e7d648b83cfac072cbccefc2ffc62a6999d4a050ee87a721942de1da9670db80029"
+NOT_WALLET = "0x3660006000376110006000366000732157a7894439191e520825fe9399ab8655e0f7085af41558576110006000f3"
+
+
+class TestBytecodeClassification(unittest.TestCase):
+    def test_get_non_wallets(self):
+        wallet, not_wallet, unknown, proxy, implementation = (f"0x{i:040x}" for i in range(1, 6))
+        node = FakeNode(batch_limit=1000, codes={
+            wallet: SAFE_PROXY,
+            not_wallet: NOT_WALLET,
+            unknown: "0x6001",
+            # EIP-1167 proxy (unknown bytecode) to wallet bytecode
+            proxy: f"0x363d3d373d3d3d363d73{implementation[2:]}5af43d82803e903d91602b57fd5bf3",
+            implementation: SAFE_PROXY,
+        })
+        session = MagicMock()
+        session.post.side_effect = node.post
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('src.fetch.contracts._session', return_value=session):
+            contracts = {wallet, not_wallet, unknown, proxy}
+            account_info = EvmAccountInfo(
+                "node", list(contracts), "mainnet",
+                store=CodeStore(os.path.join(temp_dir, "code.sqlite"))
+            )
+            account_info.unknown_bytecode_file = NetworkFile("unknown.csv", path=temp_dir)
+            non_wallets = account_info.get_non_wallets(contracts)
+            with open(os.path.join(temp_dir, "mainnet-unknown.csv"), encoding='utf-8') as file:
+                recorded = file.read()
+
+        self.assertEqual(non_wallets, {not_wallet, unknown})
+        self.assertIn(f",2,,1,{unknown}", recorded)
+
+
+if __name__ == '__main__':
+    unittest.main()
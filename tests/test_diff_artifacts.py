@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from src.files import File
+from src.scripts.diff_artifacts import diff_artifacts, ARTIFACT_TYPES, Mover
+
+
+def write_file(path: str, name: str, content: str) -> File:
+    with open(os.path.join(path, name), 'w', encoding='utf-8') as file:
+        file.write(content)
+    return File(name=name, path=path)
+
+
+class TestDiffArtifacts(unittest.TestCase):
+    def test_merkle_leaf_diff(self):
+        header = "Account,Airdrop,GnoOption,UserOption,Investor,Team,Advisor\n"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            old = write_file(temp_dir, "old.csv", header + "0xA,1,2,0,0,0,0\n0xb,5,0,0,0,0,0\n0xc,3,0,0,0,0,0\n")
+            new = write_file(temp_dir, "new.csv", header + "0xc,3,0,0,0,0,0\n0xa,1,4,0,0,0,0\n0xd,0,0,7,0,0,0\n")
+            diff = diff_artifacts(old, new, ARTIFACT_TYPES['merkle'])
+
+        self.assertFalse(diff.is_identical())
+        self.assertEqual((diff.num_old, diff.num_new), (3, 3))
+        self.assertEqual(diff.added, ['0xd'])
+        self.assertEqual(diff.removed, ['0xb'])
+        self.assertEqual(diff.num_changed, 1)
+        self.assertEqual(diff.drift['Airdrop'].delta, -5)
+        self.assertEqual(diff.drift['GnoOption'].delta, 2)
+        self.assertEqual(diff.drift['GnoOption'].num_changed, 1)
+        self.assertEqual(diff.drift['UserOption'].new_total, 7)
+        self.assertEqual(diff.top_movers, [Mover('0xd', 0, 7), Mover('0xb', 5, 0), Mover('0xa', 3, 5)])
+
+    def test_identical(self):
+        content = "account,amount\n0x1,10\n0x2,20\n"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            diff = diff_artifacts(
+                write_file(temp_dir, "old.csv", content),
+                write_file(temp_dir, "new.csv", content),
+                ARTIFACT_TYPES['allocations'],
+            )
+        self.assertTrue(diff.is_identical())
+        self.assertEqual(diff.top_movers, [])
+        self.assertEqual(diff.drift['amount'].delta, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
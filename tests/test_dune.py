@@ -1,4 +1,6 @@
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, Mock
 
 from src.dune_analytics import DuneAnalytics
@@ -33,6 +35,29 @@ class MyTestCase(unittest.TestCase):
                 max_retries=2
             )
 
+    def test_concurrent_queries_take_turns(self):
+        dune = DuneAnalytics('user', 'password', 0)
+        dune.open_query = MagicMock(return_value="")
+        active, overlaps = [], []
+
+        def initiate_new_query(query, query_name, network, parameters):
+            active.append(network)
+            overlaps.append(len(active) > 1)
+
+        def execute_and_await_results(_ping_frequency):
+            time.sleep(0.01)
+            return active.pop()
+
+        dune.initiate_new_query = initiate_new_query
+        dune.execute_and_await_results = execute_and_await_results
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(
+                lambda n: dune.query_initiate_execute_await("", str(n)), range(8)
+            ))
+        # Each query gets back the result for its own parameters.
+        self.assertEqual(results, [str(n) for n in range(8)])
+        self.assertFalse(any(overlaps))
+
 
 if __name__ == '__main__':
     unittest.main()
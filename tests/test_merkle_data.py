@@ -0,0 +1,60 @@
+import unittest
+
+from src.generate.merkle_data import MerkleLeaf, MerkleLeafTable
+from src.split_allocation import SplitAllocations
+
+
+def leaf(account: str, airdrop: int = 0, team: int = 0) -> MerkleLeaf:
+    return MerkleLeaf(
+        Account=account,
+        Airdrop=airdrop,
+        GnoOption=0,
+        UserOption=0,
+        Investor=0,
+        Team=team,
+        Advisor=0
+    )
+
+
+class TestMerkleLeafTable(unittest.TestCase):
+    def test_round_trip(self):
+        leaves = [leaf("0x1", airdrop=5), leaf("0x2", team=7)]
+        table = MerkleLeafTable(leaves)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table), leaves)
+        self.assertEqual(table[1], leaves[1])
+
+    def test_cached_totals(self):
+        table = MerkleLeafTable([leaf("0x1", airdrop=5), leaf("0x2", team=7)])
+        self.assertEqual(table.totals()['Airdrop'], 5)
+        self.assertEqual(table.total(), 12)
+        accounts = table.accounts()
+
+        # Appended leaves are added to the cached aggregates (not recomputed).
+        totals = table.totals()
+        table.extend([leaf("0x3", airdrop=1), leaf("0x1", team=2)])
+        self.assertIs(table.totals(), totals)
+        self.assertEqual(table.totals()['Airdrop'], 6)
+        self.assertEqual(table.totals()['Team'], 9)
+        self.assertEqual(table.total(), 15)
+        self.assertIs(table.accounts(), accounts)
+        self.assertEqual(table.accounts(), {"0x1", "0x2", "0x3"})
+
+        totals = table.totals()
+        self.assertEqual(table.update_account("0x1", "0x4"), [0, 3])
+        # Redirecting an account leaves category totals untouched.
+        self.assertIs(table.totals(), totals)
+        self.assertEqual(table.accounts(), {"0x2", "0x3", "0x4"})
+
+    def test_split_allocation_totals(self):
+        split = SplitAllocations(
+            mainnet=MerkleLeafTable([leaf("0x1", airdrop=10 ** 18)]),
+            gchain=MerkleLeafTable([leaf("0x2", airdrop=2 * 10 ** 18, team=1)]),
+        )
+        self.assertEqual(split.total_airdrop(), 3.0)
+        self.assertEqual(split.total_allocation_wei(), 3 * 10 ** 18 + 1)
+        self.assertEqual(split.get_all_accounts(), {"0x1", "0x2"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
+import os
+import tempfile
 import unittest
 from fractions import Fraction
 
 from src.fetch.lp_holders import LiquidityProportion
+from src.files import File
 
 
 class TestLiquidityProportion(unittest.TestCase):
@@ -9,11 +12,34 @@ class TestLiquidityProportion(unittest.TestCase):
         proportion = LiquidityProportion(
             account="0x1",
             pool="0x2",
-            proportion=Fraction(1, 10)
+            lp_balance=1,
+            lp_supply=10,
         )
         position = proportion.to_liquidity_position(100)
         self.assertEqual(position.gno_amount, 10)
 
+    def test_load_legacy_format(self):
+        balances = {"0x1": 7, "0x2": 21, "0x3": 0, "0x4": 3 * 10 ** 20}
+        supply = sum(balances.values())
+        pool_gno = 123456789 * 10 ** 18 + 1
+        with tempfile.TemporaryDirectory() as temp_dir:
+            legacy_file = File("lp-holders.csv", temp_dir)
+            with open(legacy_file.filename(), 'w', encoding='utf-8') as file:
+                file.write("account,pool,lp_proportion\n")
+                for account, balance in balances.items():
+                    file.write(f"{account},0xp,{Fraction(balance, supply)}\n")
+                file.write("0x5,0xq,1\n")
+            loaded = LiquidityProportion.load_from_file(legacy_file)
+
+        for account, balance in balances.items():
+            (proportion,) = loaded[account]
+            self.assertEqual(
+                proportion.to_liquidity_position(pool_gno).gno_amount,
+                int(Fraction(balance, supply) * pool_gno)
+            )
+            self.assertEqual(proportion.lp_supply, loaded["0x1"][0].lp_supply)
+        self.assertEqual(loaded["0x5"][0].to_liquidity_position(5).gno_amount, 5)
+
 
 if __name__ == '__main__':
     unittest.main()
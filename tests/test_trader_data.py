@@ -1,8 +1,14 @@
+import os
+import tempfile
 import unittest
 from datetime import datetime, date
+from unittest.mock import patch
 
-from src.fetch.trader_data import CowSwapTrader
-from src.models import Allocation
+from src.fetch.trader_data import CowSwapTrader, TraderTable, allocation_tiers, \
+    merge_sorted_traders, refresh_trader_data, write_watermark, \
+    fetch_combined, stream_combined, refresh_combined, allocation_tier
+from src.constants import SNAPSHOT_BLOCK_NUMBER
+from src.files import File, NetworkFile, TraderFiles
 
 
 def date_from_postgres(date_str: str) -> date:
@@ -128,51 +134,246 @@ class TestTraderData(unittest.TestCase):
         )
         self.assertEqual(4, four_days_between.days_between_first_and_last())
 
-    def test_to_primary_allocation(self):
-        not_eligible = CowSwapTrader(
-            account=f"0x1",
-            eligible_volume=1,
-            num_trades=2,
-            first_trade=date_from_postgres('2021-01-01'),
-            last_trade=date_from_postgres('2021-01-05'),
+    def test_bulk_allocation_tiers(self):
+        self.assertEqual(
+            allocation_tiers([999, 10 ** 3, 10 ** 4, 49999, 10 ** 5, 10 ** 6, 10 ** 9]),
+            [-1, 0, 1, 1, 3, 5, 5]
         )
-        with self.assertRaises(AssertionError):
-            not_eligible.to_primary_allocation(total_weight=10, supply=100)
 
-        eligible = CowSwapTrader(
-            account=f"0x1",
-            eligible_volume=1000,
-            num_trades=3,
-            first_trade=date_from_postgres('2021-01-01'),
-            last_trade=date_from_postgres('2021-02-01'),
-        )
+    def test_table_merge(self):
+        mainnet, gchain = TraderTable(), TraderTable()
+        mainnet.append("0x" + "1" * 40, 600, 1, date_from_postgres('2021-01-01'),
+                       date_from_postgres('2021-01-01'))
+        mainnet.append("0x" + "2" * 40, 5, 1, date_from_postgres('2021-01-01'),
+                       date_from_postgres('2021-01-01'))
+        gchain.append("0x" + "1" * 40, 600, 2, date_from_postgres('2021-03-01'),
+                      date_from_postgres('2021-03-01'))
+        gchain.append("0x" + "3" * 40, 7, 1, date_from_postgres('2021-02-01'),
+                      date_from_postgres('2021-02-01'))
+        merged = TraderTable.merge(mainnet, gchain)
+        self.assertEqual(len(merged), 3)
         self.assertEqual(
-            Allocation(account='0x1', amount=10),
-            eligible.to_primary_allocation(total_weight=10, supply=100)
+            merged.get("0x" + "1" * 40),
+            mainnet.trader(0).merge(gchain.trader(0))
         )
+        self.assertEqual(merged.get("0x" + "1" * 40).allocation_tier, 0)
+        self.assertEqual(merged.get("0x" + "2" * 40), mainnet.trader(1))
+        self.assertEqual(merged.get("0x" + "3" * 40), gchain.trader(1))
+        self.assertIsNone(merged.get("0x" + "4" * 40))
+        self.assertEqual(merged.tier_histogram(), {0: 1, -1: 2})
 
-    def test_to_consolation_allocation(self):
-        not_eligible = CowSwapTrader(
-            account=f"0x1",
-            eligible_volume=1,
-            num_trades=2,
-            first_trade=date_from_postgres('2021-01-01'),
-            last_trade=date_from_postgres('2021-01-05'),
+    def test_table_eligibility_masks(self):
+        traders = [
+            # eligible
+            CowSwapTrader("0x" + "1" * 40, 1000, 3, date_from_postgres('2021-01-01'),
+                          date_from_postgres('2021-03-01')),
+            # consolation by volume
+            CowSwapTrader("0x" + "2" * 40, 1000, 2, date_from_postgres('2021-01-01'),
+                          date_from_postgres('2021-03-01')),
+            # consolation by trades
+            CowSwapTrader("0x" + "3" * 40, 1, 5, date_from_postgres('2021-01-01'),
+                          date_from_postgres('2021-01-01')),
+            # neither
+            CowSwapTrader("0x" + "4" * 40, 1, 4, date_from_postgres('2021-01-01'),
+                          date_from_postgres('2021-03-01')),
+        ]
+        table = TraderTable()
+        for trader in traders:
+            table.append(trader.account, trader.eligible_volume, trader.num_trades,
+                         trader.first_trade, trader.last_trade)
+        primary, consolation = table.eligibility_masks()
+        self.assertEqual(primary, [t.is_eligible() for t in traders])
+        self.assertEqual(primary, [True, False, False, False])
+        self.assertEqual(consolation, [False, True, True, False])
+        self.assertEqual(
+            table.select(consolation).accounts(),
+            [traders[1].account, traders[2].account]
         )
+
+    def test_merge_sorted_traders(self):
+        def trader(account, volume, day):
+            trade_date = date_from_postgres(f'2021-01-{day:02d}')
+            return CowSwapTrader(account, volume, 1, trade_date, trade_date)
+
+        mainnet = [trader("0x1", 600, 1), trader("0x3", 10, 2)]
+        gchain = [trader("0x1", 600, 5), trader("0x2", 7, 3), trader("0x4", 1, 4)]
+        merged = list(merge_sorted_traders(mainnet, gchain))
         self.assertEqual(
-            Allocation(account='0x1', amount=10),
-            not_eligible.to_consolation_allocation(num_recipients=10, supply=100)
+            merged,
+            [mainnet[0].merge(gchain[0]), gchain[1], mainnet[1], gchain[2]]
         )
+        self.assertEqual(merged[0].allocation_tier, 0)
+        self.assertEqual(list(merge_sorted_traders([], gchain)), gchain)
 
-        eligible = CowSwapTrader(
-            account=f"0x1",
-            eligible_volume=1000,
-            num_trades=3,
-            first_trade=date_from_postgres('2021-01-01'),
-            last_trade=date_from_postgres('2021-02-05'),
+        with self.assertRaises(ValueError):
+            list(merge_sorted_traders(mainnet[::-1], []))
+
+    def test_refresh_trader_data(self):
+        class DeltaDune:
+            def __init__(self, records):
+                self.records = records
+                self.parameters = None
+
+            def fetch(self, query_filepath, network, name, parameters):
+                self.parameters = {p['key']: p['value'] for p in parameters}
+                return self.records
+
+        def record(account, non_stable, stable, trades, day):
+            return {'trader': account, 'non_stable_volume': non_stable,
+                    'stable_volume': stable, 'num_trades': trades,
+                    'first_trade': day, 'last_trade': day}
+
+        trader_1, trader_2, trader_3 = ("0x" + str(i) * 40 for i in range(1, 4))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = TraderFiles()
+            files.traders = NetworkFile("trader-data.csv", path=temp_dir)
+            files.watermarks = File("watermarks.csv", path=temp_dir)
+            files.refreshed_volumes = File("volumes.sqlite", path=temp_dir)
+
+            # The first refresh fetches all history.
+            dune = DeltaDune([
+                record(trader_1, 1000.3, 0, 2, '2021-01-05'),
+                record(trader_2, 50, 0, 1, '2021-01-05'),
+                # Trades without volume are kept: their count may matter later.
+                record(trader_3, 0, 0, 4, '2021-01-06'),
+            ])
+            refreshed = refresh_trader_data(dune, 'mainnet', '100', files)
+            self.assertEqual(dune.parameters, {'StartBlock': '0', 'BlockNumber': '100'})
+            self.assertEqual(refreshed.accounts(), [trader_1, trader_2])
+
+            dune = DeltaDune([
+                record(trader_1, 0.3, 0, 1, '2021-02-01'),
+                record(trader_3, 0, 10, 1, '2021-02-02'),
+            ])
+            with patch('src.fetch.trader_data.allocation_tier',
+                       wraps=allocation_tier) as retier:
+                refreshed = refresh_trader_data(dune, 'mainnet', '200', files)
+            # Only the traders with new trades are retiered.
+            self.assertEqual(retier.call_count, 2)
+            self.assertEqual(dune.parameters, {'StartBlock': '100', 'BlockNumber': '200'})
+            # Volumes are only rounded after folding (1000.3 + 0.3 rounds up).
+            self.assertEqual(
+                refreshed.get(trader_1),
+                CowSwapTrader(trader_1, 1001, 3, date_from_postgres('2021-01-05'),
+                              date_from_postgres('2021-02-01'))
+            )
+            self.assertEqual(refreshed.get(trader_1).allocation_tier, 0)
+            self.assertEqual(refreshed.get(trader_2).allocation_tier, -1)
+            self.assertEqual(
+                refreshed.get(trader_3),
+                CowSwapTrader(trader_3, 1, 5, date_from_postgres('2021-01-06'),
+                              date_from_postgres('2021-02-02'))
+            )
+            self.assertEqual(len(refreshed), 3)
+            # The snapshot trader data is left untouched.
+            self.assertFalse(os.path.exists(files.traders.filename('mainnet').filename()))
+            self.assertFalse(os.path.exists(files.watermarks.filename()))
+
+            # Nothing is fetched when already up to date.
+            dune.parameters = None
+            reloaded = refresh_trader_data(dune, 'mainnet', '200', files)
+            self.assertIsNone(dune.parameters)
+            self.assertEqual(reloaded.accounts(), refreshed.accounts())
+            with self.assertRaises(ValueError):
+                refresh_trader_data(dune, 'mainnet', '150', files)
+
+            # A different stable factor restates all stored traders.
+            restated = refresh_trader_data(dune, 'mainnet', '200', files, stable_factor='1')
+            self.assertIsNone(dune.parameters)
+            self.assertEqual(restated.get(trader_3).eligible_volume, 10)
+
+    def test_refresh_combined(self):
+        class NetworkDune:
+            def fetch(self, query_filepath, network, name, parameters):
+                trader = "0x" + "1" * 40
+                return [{'trader': trader, 'non_stable_volume': 600, 'stable_volume': 0,
+                         'num_trades': 2 if network == 'mainnet' else 1,
+                         'first_trade': '2021-01-01' if network == 'mainnet' else '2021-03-01',
+                         'last_trade': '2021-02-01' if network == 'mainnet' else '2021-03-01'}]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = TraderFiles()
+            files.refreshed_volumes = File("volumes.sqlite", path=temp_dir)
+            files.primary_trader = File("primary.csv", path=temp_dir)
+            with patch('src.fetch.trader_data.load_excluded_accounts', return_value=set()):
+                results = refresh_combined(
+                    NetworkDune(), files, {'mainnet': '10', 'gchain': '20'}
+                )
+            self.assertEqual(results.primary_traders.accounts(), ["0x" + "1" * 40])
+            self.assertEqual(results.primary_traders.trader(0).eligible_volume, 1200)
+            self.assertFalse(os.path.exists(files.primary_trader.filename()))
+
+    def test_stream_combined_matches_fetch_combined(self):
+        header = "account,eligible_volume,num_trades,first_trade,last_trade\n"
+        # Unsorted, with mixed case accounts and traders on both networks.
+        network_rows = {
+            'mainnet': [
+                "0x00000000000000000000000000000000000000Cc,5000,10,2021-01-01,2021-03-01",
+                "0x00000000000000000000000000000000000000aa,600,2,2021-01-01,2021-02-01",
+                "0x00000000000000000000000000000000000000Bb,10,6,2021-01-01,2021-01-02",
+                "0x00000000000000000000000000000000000000dd,2000,4,2021-01-01,2021-01-05",
+                "0x00000000000000000000000000000000000000ee,90000,40,2021-01-01,2021-06-01",
+            ],
+            'gchain': [
+                "0x00000000000000000000000000000000000000AA,600,1,2021-01-10,2021-03-01",
+                "0x0000000000000000000000000000000000000011,1,1,2021-01-01,2021-01-01",
+                "0x00000000000000000000000000000000000000dD,20,1,2021-01-01,2021-02-01",
+                "0x00000000000000000000000000000000000000Ff,1200,3,2021-01-01,2021-01-20",
+            ],
+        }
+        excluded = {"0x00000000000000000000000000000000000000ee"}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = TraderFiles()
+            files.traders = NetworkFile("trader-data.csv", path=temp_dir)
+            files.watermarks = File("watermarks.csv", path=temp_dir)
+            for network, rows in network_rows.items():
+                with open(files.traders.filename(network).filename(), 'w',
+                          encoding='utf-8') as file:
+                    file.write(header + "\n".join(rows) + "\n")
+
+            outputs = {}
+            for name in ['fetched', 'streamed']:
+                files.primary_trader = File(f"{name}-primary.csv", path=temp_dir)
+                files.consolation_trader = File(f"{name}-consolation.csv", path=temp_dir)
+                if name == 'fetched':
+                    with patch('src.fetch.trader_data.load_excluded_accounts',
+                               return_value=excluded):
+                        fetched = fetch_combined(dune=None, load_from=files)
+                else:
+                    tiers = stream_combined(files, excluded=excluded, batch_size=2)
+                outputs[name] = []
+                for output in [files.primary_trader, files.consolation_trader]:
+                    with open(output.filename(), 'r', encoding='utf-8') as file:
+                        outputs[name].append(file.read())
+
+        self.assertEqual(outputs['streamed'], outputs['fetched'])
+        self.assertEqual(
+            set(fetched.primary_traders.accounts()),
+            {"0x" + "0" * 38 + suffix for suffix in ["aa", "cc", "dd", "ff"]}
         )
-        with self.assertRaises(AssertionError):
-            eligible.to_consolation_allocation(num_recipients=10, supply=100)
+        self.assertEqual(
+            fetched.consolation_traders.accounts(), ["0x" + "0" * 38 + "bb"]
+        )
+        self.assertEqual(tiers.primary_total_weight, fetched.primary_tier_total)
+        self.assertEqual(tiers.user_option_weight, fetched.user_option_tier_total)
+
+    def test_combined_requires_snapshot_data(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = TraderFiles()
+            files.traders = NetworkFile("trader-data.csv", path=temp_dir)
+            files.watermarks = File("watermarks.csv", path=temp_dir)
+            for network in ['mainnet', 'gchain']:
+                table = TraderTable()
+                table.append("0x" + "1" * 40, 900, 2, date_from_postgres('2021-01-05'),
+                             date_from_postgres('2021-01-06'))
+                table.write_to_csv(files.traders.filename(network))
+            snapshot_block = int(SNAPSHOT_BLOCK_NUMBER['gchain'])
+            write_watermark('gchain', snapshot_block + 1, files.watermarks)
+
+            with self.assertRaises(ValueError):
+                fetch_combined(dune=None, load_from=files)
+            with self.assertRaises(ValueError):
+                stream_combined(files, excluded=set())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,60 @@
+import unittest
+from datetime import date, timedelta
+
+from src.constants import USER_ALLOCATION
+from src.fetch.trader_data import TraderTable
+from src.generate.trader_sweep import parameter_grid, sweep_eligibility
+
+
+def trader_table() -> TraderTable:
+    table = TraderTable()
+    start = date(2021, 1, 1)
+    for i in range(1, 200):
+        table.append(
+            account=f"0x{i:040x}",
+            eligible_volume=(i * 7919) % 60000,
+            num_trades=i % 9,
+            first_trade=start,
+            last_trade=start + timedelta(days=i % 40),
+        )
+    return table
+
+
+class TestTraderSweep(unittest.TestCase):
+    def test_matches_individual_evaluation(self):
+        table = trader_table()
+        excluded = {f"0x{i:040x}" for i in range(1, 200, 11)}
+        grid = parameter_grid([1, 3, 4], [2, 5], [1000, 20000], [0, 14, 30])
+        results = sweep_eligibility(table, grid, excluded)
+        self.assertEqual(len(results), len(grid))
+
+        included = [not e for e in table.account_mask(excluded)]
+        for result in results:
+            primary, consolation = table.eligibility_masks(result.parameters)
+            primary = [p and i for p, i in zip(primary, included)]
+            consolation = [c and i for c, i in zip(consolation, included)]
+            self.assertEqual(result.primary_count, sum(primary))
+            self.assertEqual(result.consolation_count, sum(consolation))
+            histogram = table.select(primary).tier_histogram()
+            for tier, count in result.tier_counts.items():
+                self.assertEqual(count, histogram[tier])
+            self.assertEqual(
+                result.unallocated['consolation'],
+                USER_ALLOCATION['consolation'] % result.consolation_count
+            )
+            allocated = sum(
+                result.primary_payouts[tier] * count
+                for tier, count in result.tier_counts.items() if count > 0
+            )
+            self.assertEqual(
+                allocated + result.unallocated['primary'], USER_ALLOCATION['primary']
+            )
+
+    def test_invalid_tier(self):
+        # Volume threshold below the lowest volume tier admits tier -1 traders.
+        with self.assertRaises(ValueError):
+            sweep_eligibility(trader_table(), parameter_grid([1], [5], [1], [0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
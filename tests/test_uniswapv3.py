@@ -1,13 +1,44 @@
+import random
+import re
+import os
+import tempfile
 import unittest
+from collections import defaultdict
+from unittest.mock import patch, MagicMock
 
 from src.constants import GNO_TOKEN
-from src.fetch.univ3_gno import fetch_pools, fetch_univ3_gno
+from src.fetch.univ3_gno import fetch_pools, fetch_univ3_gno, fetch_positions, \
+    fetch_univ3_holdings, load_positions
 from src.files import File
 from src.models import GnoHolder
-from src.utils.univ3 import execute_query, Position, Pool
+from src.utils.univ3 import execute_query, Position, Pool, get_sqrt_ratio_at_tick, \
+    precompute_sqrt_ratios, MIN_TICK, MAX_TICK, PAGE_SIZE, token_amounts, QueryCache, \
+    position_query
+from src.utils.univ3_replay import UniV3Replay, NONFUNGIBLE_POSITION_MANAGER
 
 
 from e2e.test_util import TEST_FILE, drop_files
+from tests.test_univ3_replay import write_events
+
+# Subgraph responses are cached in a temporary directory (not the working tree).
+CACHE_DIR = tempfile.TemporaryDirectory()
+CACHE_PATCHES = [
+    patch(f'{module}.query_cache',
+          return_value=QueryCache(os.path.join(CACHE_DIR.name, 'subgraph-cache.sqlite')))
+    for module in ['src.utils.univ3', 'src.fetch.univ3_gno']
+]
+
+
+def setUpModule():
+    for cache_patch in CACHE_PATCHES:
+        cache_patch.start()
+
+
+def tearDownModule():
+    for cache_patch in CACHE_PATCHES:
+        cache_patch.stop()
+    CACHE_DIR.cleanup()
+
 
 class TestUniswapV3Fetching(unittest.TestCase):
     def setUp(self) -> None:
@@ -230,5 +261,282 @@ def known_position_query(block_number: int) -> str:
         """
 
 
+class TestSubgraphPagination(unittest.TestCase):
+    def setUp(self) -> None:
+        self.token = GNO_TOKEN['mainnet']
+
+    def test_fetch_positions_pages_through_all_shards(self):
+        pools = [
+            Pool(f'0xpool{i}', liquidity=1, sqrt_price=2 ** 96, tick=0, queried_token_index=0)
+            for i in range(3)
+        ]
+        # The middle pool spans multiple pages (and ends on a full page).
+        num_positions = {'0xpool0': 5, '0xpool1': 2 * PAGE_SIZE, '0xpool2': 0}
+        subgraph = {
+            pool: [
+                {
+                    'id': f'{index:06d}',
+                    'owner': f'0x{index:x}',
+                    'liquidity': '10',
+                    'tickLower': {'tickIdx': '-60'},
+                    'tickUpper': {'tickIdx': '60'},
+                    'pool': {'id': pool},
+                }
+                for index in range(count)
+            ]
+            for pool, count in num_positions.items()
+        }
+
+        def fake_subgraph(query: str):
+            pool = re.search(r'pool: "(\w+)"', query).group(1)
+            last_id = re.search(r'id_gt: "(\w*)"', query).group(1)
+            page = [p for p in subgraph[pool] if p['id'] > last_id][:PAGE_SIZE]
+            return {'data': {'positions': page}}
+
+        with patch('src.utils.univ3.execute_query', side_effect=fake_subgraph) as query:
+            positions = list(fetch_positions(1, pools, self.token, max_workers=2))
+
+        self.assertEqual(len(positions), sum(num_positions.values()))
+        self.assertEqual(
+            [position.pool.address for position in positions],
+            [pool.address for pool in pools for _ in range(num_positions[pool.address])]
+        )
+        self.assertEqual(positions[5].account, '0x0')
+        # one page for pool0 and pool2, three for pool1
+        self.assertEqual(query.call_count, 5)
+
+
+class TestBatchedAmounts(unittest.TestCase):
+    def test_token_amounts_match_positions(self):
+        rng = random.Random(42)
+        pools = [
+            Pool(
+                address=f'0xpool{i}',
+                liquidity=0,
+                sqrt_price=get_sqrt_ratio_at_tick(tick) + rng.randrange(10 ** 20),
+                tick=tick,
+                queried_token_index=i % 2
+            )
+            for i, tick in enumerate([-19968, 0, 600, -887220])
+        ]
+        ranges = [(-887220, 887220), (-600, 600), (-20040, -19920), (0, 60), (660, 1200)]
+        positions = []
+        for _ in range(2000):
+            tick_lower, tick_upper = rng.choice(ranges)
+            positions.append(Position(
+                account=f'0x{rng.randrange(50):x}',
+                liquidity=rng.randrange(1, 10 ** 24),
+                tick_lower=tick_lower,
+                tick_upper=tick_upper,
+                pool=rng.choice(pools),
+                token='0x',
+            ))
+
+        expected = defaultdict(int)
+        for position in positions:
+            expected[position.account] += position.gno_amount()
+        self.assertEqual(token_amounts(positions), dict(expected))
+
+        for token_index, amount in [(0, Position.get_amount_0), (1, Position.get_amount_1)]:
+            expected = defaultdict(int)
+            for position in positions:
+                expected[position.account] += amount(position)
+            self.assertEqual(token_amounts(positions, token_index), dict(expected))
+
+
+GNO, COW, WETH = '0x6810', '0xdef1', '0xc02a'
+# Subgraph state served by fake_subgraph: (token0, token1, tick) by pool and
+# (pool, owner, liquidity) of positions over ticks [-600, 600)
+SUBGRAPH_POOLS = {
+    '0xp1': (GNO, WETH, 0),
+    '0xp2': (COW, GNO, 0),
+    '0xp3': (COW, WETH, 1000),
+}
+SUBGRAPH_POSITIONS = [
+    ('0xp1', '0xa', 10 ** 18),
+    ('0xp2', '0xa', 2 * 10 ** 18),
+    ('0xp2', '0xb', 10 ** 18),
+    ('0xp3', '0xb', 3 * 10 ** 18),
+]
+
+
+def fake_subgraph(query: str):
+    if 'positions(' in query:
+        pool = re.search(r'pool: "(\w+)"', query).group(1)
+        return {'data': {'positions': [
+            {
+                'id': f'{pool}-{index}',
+                'owner': owner,
+                'liquidity': str(liquidity),
+                'tickLower': {'tickIdx': '-600'},
+                'tickUpper': {'tickIdx': '600'},
+                'pool': {'id': pool},
+            }
+            for index, (position_pool, owner, liquidity) in enumerate(SUBGRAPH_POSITIONS)
+            if position_pool == pool
+        ]}}
+    data = {}
+    for index, tokens in re.findall(r'pools(\d): .*?token\d_in: (\[.*?\])', query, re.S):
+        requested = set(re.findall(r'"(\w+)"', tokens))
+        data[f'pools{index}'] = [
+            {
+                'id': pool,
+                'token0': {'id': token0},
+                'token1': {'id': token1},
+                'tick': str(tick),
+                'sqrtPrice': str(get_sqrt_ratio_at_tick(tick)),
+                'liquidity': '1',
+            }
+            for pool, (token0, token1, tick) in SUBGRAPH_POOLS.items()
+            if (token0, token1)[int(index)] in requested
+        ]
+    return {'data': data}
+
+
+class TestMultiTokenHoldings(unittest.TestCase):
+    def test_single_pass_over_all_tokens(self):
+        gno, cow = GNO, COW
+        pools, positions = SUBGRAPH_POOLS, SUBGRAPH_POSITIONS
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('src.fetch.univ3_gno.execute_query', side_effect=fake_subgraph) as pool_fetch, \
+                patch('src.utils.univ3.execute_query', side_effect=fake_subgraph) as position_fetch:
+            holdings = fetch_univ3_holdings(1, [gno, cow], cache_path=temp_dir)
+            self.assertEqual(pool_fetch.call_count, 1)
+            self.assertEqual(position_fetch.call_count, 3)
+            # Cached raw positions are pinned to the block.
+            self.assertEqual(fetch_univ3_holdings(1, [gno, cow], cache_path=temp_dir), holdings)
+            self.assertEqual(pool_fetch.call_count, 1)
+
+        pool = {address: Pool(address, 1, get_sqrt_ratio_at_tick(tick), tick, 0)
+                for address, (_, _, tick) in pools.items()}
+
+        def amount(address, liquidity, token_index):
+            position = Position('0x', liquidity, -600, 600, pool[address], '')
+            return position.get_amount_0() if token_index == 0 else position.get_amount_1()
+
+        self.assertEqual(set(holdings), {gno, cow})
+        self.assertEqual(
+            {account: holder.amount for account, holder in holdings[gno].items()},
+            {
+                '0xa': amount('0xp1', 10 ** 18, 0) + amount('0xp2', 2 * 10 ** 18, 1),
+                '0xb': amount('0xp2', 10 ** 18, 1),
+            }
+        )
+        self.assertEqual(
+            {account: holder.amount for account, holder in holdings[cow].items()},
+            {
+                '0xa': amount('0xp2', 2 * 10 ** 18, 0),
+                # The 0xp3 position is below the pool tick, so it holds no token0
+                '0xb': amount('0xp2', 10 ** 18, 0) + 0,
+            }
+        )
+
+    def test_replay_matches_subgraph(self):
+        # Events leading to the subgraph state, 0xp3's position minted as an NFT.
+        events = []
+        for pool, (token0, token1, tick) in SUBGRAPH_POOLS.items():
+            events.append({'type': 'Initialize', 'block': 1, 'pool': pool, 'token0': token0,
+                           'token1': token1, 'sqrt_price': str(get_sqrt_ratio_at_tick(0)),
+                           'tick': 0})
+        for token_id, (pool, owner, liquidity) in enumerate(SUBGRAPH_POSITIONS):
+            ticks = {'tick_lower': -600, 'tick_upper': 600}
+            if pool == '0xp3':
+                events += [
+                    {'type': 'Mint', 'block': 2, 'pool': pool, 'amount': str(liquidity),
+                     'owner': NONFUNGIBLE_POSITION_MANAGER, **ticks},
+                    {'type': 'Transfer', 'block': 2, 'token_id': token_id, 'to': owner},
+                    {'type': 'IncreaseLiquidity', 'block': 2, 'token_id': token_id,
+                     'liquidity': str(liquidity), 'pool': pool, **ticks},
+                ]
+            else:
+                events.append({'type': 'Mint', 'block': 2, 'pool': pool, 'owner': owner,
+                               'amount': str(liquidity), **ticks})
+        for pool, (_, _, tick) in SUBGRAPH_POOLS.items():
+            events.append({'type': 'Swap', 'block': 3, 'pool': pool, 'liquidity': '1',
+                           'sqrt_price': str(get_sqrt_ratio_at_tick(tick)), 'tick': tick})
+
+        def position_key(position: Position):
+            return position.pool.address, position.account
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('src.fetch.univ3_gno.execute_query', side_effect=fake_subgraph), \
+                patch('src.utils.univ3.execute_query', side_effect=fake_subgraph):
+            for tokens in [[GNO], [GNO, COW], [WETH, COW]]:
+                subgraph = load_positions(1, tokens, cache_path=temp_dir)
+                with UniV3Replay(write_events(temp_dir, events), checkpoint_interval=2) \
+                        as replay:
+                    self.assertEqual(
+                        sorted(replay.positions(3, tokens), key=position_key),
+                        sorted(subgraph, key=position_key)
+                    )
+                    self.assertEqual(
+                        fetch_univ3_holdings(3, tokens, replay=replay),
+                        fetch_univ3_holdings(1, tokens, cache_path=temp_dir)
+                    )
+
+
+class TestQueryCache(unittest.TestCase):
+    def test_block_pinned_responses_are_permanent(self):
+        pinned = position_query(13974427, '0xpool')
+        unpinned = '{ pools(first: 1) { id } }'
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'cache.sqlite')
+            # Every unpinned entry has expired
+            cache = QueryCache(path, ttl=-1)
+            self.assertTrue(cache.is_block_pinned(pinned))
+            self.assertFalse(cache.is_block_pinned(unpinned))
+
+            session = MagicMock()
+            session.post.return_value.json.return_value = {'data': {'positions': []}}
+            with patch('src.utils.univ3._session', return_value=session):
+                for query in [pinned, unpinned, pinned, unpinned]:
+                    self.assertEqual(
+                        execute_query(query, cache), {'data': {'positions': []}}
+                    )
+                self.assertEqual(session.post.call_count, 3)
+                self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+                # Persisted across instances, and whitespace doesn't matter.
+                reopened = QueryCache(path)
+                execute_query(" ".join(pinned.split()), reopened)
+                execute_query(unpinned, reopened)
+                self.assertEqual(session.post.call_count, 3)
+                self.assertEqual(str(reopened), "subgraph cache: 2/2 hits (100.0%)")
+
+                # Failed queries are not cached
+                session.post.return_value.json.return_value = {'errors': ['timeout']}
+                for _ in range(2):
+                    with self.assertRaises(RuntimeError):
+                        execute_query('{ other }', reopened)
+                self.assertEqual(session.post.call_count, 5)
+
+
+class TestSqrtRatioCache(unittest.TestCase):
+    def test_cached_ratios_are_exact(self):
+        # Values of TickMath.MIN_SQRT_RATIO and TickMath.MAX_SQRT_RATIO
+        self.assertEqual(get_sqrt_ratio_at_tick(MIN_TICK), 4295128739)
+        self.assertEqual(
+            get_sqrt_ratio_at_tick(MAX_TICK),
+            1461446703485210103287273052203988822378723970342
+        )
+        self.assertEqual(get_sqrt_ratio_at_tick(0), 2 ** 96)
+
+        pool = Pool('0x1', liquidity=1, sqrt_price=2 ** 96, tick=0, queried_token_index=0)
+        positions = [
+            Position('0x2', 1, tick_lower=tick, tick_upper=-tick, pool=pool, token='0x3')
+            for tick in range(-887220, 0, 60 * 997)
+        ]
+        get_sqrt_ratio_at_tick.cache_clear()
+        self.assertEqual(precompute_sqrt_ratios(positions), 2 * len(positions))
+        for position in positions:
+            for tick in (position.tick_lower, position.tick_upper):
+                self.assertEqual(
+                    get_sqrt_ratio_at_tick(tick),
+                    get_sqrt_ratio_at_tick.__wrapped__(tick)
+                )
+        self.assertEqual(get_sqrt_ratio_at_tick.cache_info().misses, 2 * len(positions))
+
+
 if __name__ == '__main__':
     unittest.main()
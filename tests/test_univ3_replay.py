@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from src.files import File
+from src.utils.univ3 import get_sqrt_ratio_at_tick, token_holdings
+from src.utils.univ3_replay import UniV3Replay, ReplayState, NONFUNGIBLE_POSITION_MANAGER
+
+GNO, WETH = '0x6810', '0xc02a'
+
+
+def write_events(path: str, events: list[dict]) -> File:
+    with open(os.path.join(path, 'events.jsonl'), 'w', encoding='utf-8') as file:
+        for log_index, event in enumerate(events):
+            file.write(json.dumps({'log_index': log_index, **event}) + '\n')
+    return File('events.jsonl', path=path)
+
+
+def random_events(rng: random.Random) -> list[dict]:
+    events = [{
+        'type': 'Initialize', 'block': 1, 'pool': '0xpool', 'token0': GNO, 'token1': WETH,
+        'sqrt_price': str(get_sqrt_ratio_at_tick(0)), 'tick': 0,
+    }]
+    liquidity = {}
+    for block in range(2, 5000, 7):
+        token_id = rng.randrange(20)
+        if token_id not in liquidity:
+            liquidity[token_id] = 0
+            events.append({'type': 'Transfer', 'block': block, 'token_id': token_id,
+                           'to': f'0x{rng.randrange(5)}'})
+        amount = rng.randrange(1, 10 ** 18)
+        if liquidity[token_id] > amount and rng.random() < 0.4:
+            liquidity[token_id] -= amount
+            events.append({'type': 'DecreaseLiquidity', 'block': block,
+                           'token_id': token_id, 'liquidity': str(amount)})
+        else:
+            liquidity[token_id] += amount
+            events.append({'type': 'IncreaseLiquidity', 'block': block, 'token_id': token_id,
+                           'liquidity': str(amount), 'pool': '0xpool',
+                           'tick_lower': -60 * (token_id + 1), 'tick_upper': 60 * (token_id + 1)})
+        tick = rng.randrange(-1200, 1200)
+        events.append({'type': 'Swap', 'block': block, 'pool': '0xpool',
+                       'sqrt_price': str(get_sqrt_ratio_at_tick(tick)), 'tick': tick,
+                       'liquidity': str(rng.randrange(10 ** 20))})
+    return events
+
+
+class TestUniV3Replay(unittest.TestCase):
+    def test_checkpoints_match_full_replay(self):
+        events = random_events(random.Random(7))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint_path = os.path.join(temp_dir, 'checkpoints')
+            replay = UniV3Replay(write_events(temp_dir, events), checkpoint_interval=500,
+                                 checkpoint_path=checkpoint_path)
+            self.assertGreater(len(replay.checkpoints), 5)
+            # Checkpoint states are only kept on disk
+            self.assertEqual(len(os.listdir(checkpoint_path)), len(replay.checkpoints))
+            for block in [0, 1, 499, 500, 501, 2222, 4999, 10 ** 6]:
+                expected = ReplayState()
+                for event in events:
+                    if event['block'] <= block:
+                        expected.apply(event)
+                state = replay.state_at(block)
+                if block == 2222:
+                    state_at_2222 = state
+                self.assertEqual(state.pools, expected.pools)
+                self.assertEqual(state.positions, expected.positions)
+
+            with UniV3Replay(write_events(temp_dir, events), checkpoint_interval=500) as replay:
+                self.assertEqual(replay.state_at(2222), state_at_2222)
+                temporary_path = replay.checkpoint_path
+            self.assertFalse(os.path.exists(temporary_path))
+
+    def test_positions_and_holdings(self):
+        pool = {'pool': '0xPool'}
+        events = [
+            {'type': 'Initialize', 'block': 1, **pool, 'token0': GNO, 'token1': WETH,
+             'sqrt_price': get_sqrt_ratio_at_tick(0), 'tick': 0},
+            # Direct pool position
+            {'type': 'Mint', 'block': 2, **pool, 'owner': '0xA', 'tick_lower': -60,
+             'tick_upper': 60, 'amount': 100},
+            # NFT position (the manager's pool Mint only changes active liquidity)
+            {'type': 'Mint', 'block': 3, **pool, 'owner': NONFUNGIBLE_POSITION_MANAGER,
+             'tick_lower': 60, 'tick_upper': 120, 'amount': 5 * 10 ** 17},
+            {'type': 'Transfer', 'block': 3, 'token_id': 1, 'to': '0xB'},
+            {'type': 'IncreaseLiquidity', 'block': 3, 'token_id': 1, 'liquidity': 5 * 10 ** 17,
+             **pool, 'tick_lower': 60, 'tick_upper': 120},
+            {'type': 'Transfer', 'block': 4, 'token_id': 1, 'to': '0xC'},
+            {'type': 'Burn', 'block': 5, **pool, 'owner': '0xA', 'tick_lower': -60,
+             'tick_upper': 60, 'amount': 100},
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            replay = UniV3Replay(write_events(temp_dir, events), checkpoint_interval=2)
+            at_block_2 = replay.positions(2, [GNO])
+            self.assertEqual(len(at_block_2), 1)
+            self.assertEqual(at_block_2[0].account, '0xa')
+            self.assertEqual(at_block_2[0].pool.liquidity, 100)
+            self.assertEqual(at_block_2[0].pool.address, '0xpool')
+
+            self.assertEqual(
+                [(p.account, p.liquidity) for p in replay.positions(4, [GNO])],
+                [('0xa', 100), ('0xc', 5 * 10 ** 17)]
+            )
+            at_block_5 = replay.positions(5, [WETH])
+            self.assertEqual([(p.account, p.tick_lower) for p in at_block_5], [('0xc', 60)])
+            self.assertEqual(at_block_5[0].pool.queried_token_index, 1)
+            self.assertEqual(at_block_5[0].pool.liquidity, 0)
+            # Out of range above the current tick: token0 only
+            self.assertEqual(token_holdings(at_block_5, [WETH]), {WETH: {'0xc': 0}})
+            self.assertGreater(token_holdings(at_block_5, [GNO])[GNO]['0xc'], 0)
+
+    def test_unordered_events(self):
+        events = [
+            {'type': 'Transfer', 'block': 2, 'token_id': 1, 'to': '0xb'},
+            {'type': 'Transfer', 'block': 1, 'token_id': 2, 'to': '0xb'},
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with self.assertRaises(ValueError):
+                UniV3Replay(write_events(temp_dir, events))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,16 @@
 import collections
+import json
+import random
+import tempfile
 import unittest
 
+from src.files import File
+from src.models import Allocation
+from src.utils.checksum import ChecksumEncoder, checksum_column
+from src.utils.external_sort import ExternalSorter, external_sort, is_sorted, \
+    read_csv_rows
 from src.utils.data import *
+from src.utils.file import write_to_json
 
 Account = collections.namedtuple('Account', 'account value')
 
@@ -54,5 +63,75 @@ class TestUtils(unittest.TestCase):
             )
 
 
+class TestChecksumEncoder(unittest.TestCase):
+    def test_encode_many(self):
+        encoder = ChecksumEncoder(max_size=2)
+        addresses = [
+            "0xe91d153e0b41518a2ce8dd3d7944fa863463a97d",
+            "0x6810e776880c02933d47db1b9fc05908e5386b96",
+            "0xE91D153E0B41518A2CE8DD3D7944FA863463A97D",
+        ]
+        expected = [
+            "0xe91D153E0b41518A2Ce8Dd3D7944Fa863463a97d",
+            "0x6810e776880C02933D47DB1b9fc05908e5386b96",
+            "0xe91D153E0b41518A2Ce8Dd3D7944Fa863463a97d",
+        ]
+        self.assertEqual(encoder.encode_many(addresses), expected)
+        # Same raw address is only hashed once.
+        self.assertEqual(encoder.misses, 2)
+        self.assertEqual(encoder.encode(addresses[1]), expected[1])
+        self.assertEqual(encoder.hits, 1)
+
+        with self.assertRaises(ValueError):
+            encoder.encode("0x42")
+
+    def test_write_checksum_columns(self):
+        lower = "0x6810e776880c02933d47db1b9fc05908e5386b96"
+        checksummed = "0x6810e776880C02933D47DB1b9fc05908e5386b96"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_file = File("accounts.csv", path=temp_dir)
+            write_to_csv([Allocation(lower, 5)], csv_file, checksum_columns=['account'])
+            with open(csv_file.filename(), 'r', encoding='utf-8') as file:
+                self.assertEqual(file.read(), f"account,amount\n{checksummed},5\n")
+
+            rows = [{"wallet": lower, "tokenID": 1}]
+            json_file = File("wallets.json", path=temp_dir)
+            write_to_json(rows, json_file, checksum_columns=['wallet'])
+            with open(json_file.filename(), 'r', encoding='utf-8') as file:
+                self.assertEqual(json.load(file), [{"wallet": checksummed, "tokenID": 1}])
+            # The rows passed in keep their (lower case) accounts.
+            self.assertEqual(rows[0]["wallet"], lower)
+
+    def test_checksum_column(self):
+        rows = [{"wallet": "0x6810e776880c02933d47db1b9fc05908e5386b96", "id": 1}]
+        self.assertEqual(
+            checksum_column(rows, "wallet"),
+            [{"wallet": "0x6810e776880C02933D47DB1b9fc05908e5386b96", "id": 1}]
+        )
+
+
+class TestExternalSort(unittest.TestCase):
+    def test_spilled_chunks_merge_in_order(self):
+        rows = [{'account': f"0x{i:02x}", 'value': str(i % 7)} for i in range(50)]
+        random.Random(1).shuffle(rows)
+        key = lambda row: (-int(row['value']), row['account'])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with ExternalSorter(['account', 'value'], key, chunk_size=8) as sorter:
+                sorter.extend(rows)
+                self.assertEqual(len(sorter._runs), 6)
+                self.assertEqual(list(sorter.sorted_rows()), sorted(rows, key=key))
+                outfile = File("sorted.csv", temp_dir)
+                self.assertEqual(sorter.write(outfile), 50)
+            self.assertEqual(sorter._runs, [])
+            self.assertEqual(list(read_csv_rows(outfile)), sorted(rows, key=key))
+
+            resorted = File("by-account.csv", temp_dir)
+            external_sort(outfile, resorted, key=lambda row: row['account'], chunk_size=7)
+            self.assertTrue(
+                is_sorted(read_csv_rows(resorted), lambda r: r['account'], strict=True)
+            )
+            self.assertFalse(is_sorted(read_csv_rows(outfile), lambda r: r['account']))
+
+
 if __name__ == '__main__':
     unittest.main()